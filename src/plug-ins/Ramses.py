@@ -113,6 +113,11 @@ def uninitializePlugin( obj ):
     ram.maf.HotKey.restoreOpenSceneHotkey()
     ram.maf.HotKey.restoreSaveSceneAsHotkey()
 
+    # Stop listening to the scene
+    ram.RAMSES_NODE_INDEX.remove_callbacks()
+    ram.RAMSES_ITEM_CACHE.remove_callbacks()
+    ram.maf.NODE_CACHE.remove_callbacks()
+
     for c in reversed( ram.cmds_classes ):
         try:
             plugin.deregisterCommand( c.name )
@@ -1,8 +1,12 @@
 from .hotkeys import HotKey
 from .nodes import Node
+from .attribute_index import AttributeIndex
+from .node_cache import NodeCache, NODE_CACHE
 from . import paths
 from .scene import Scene
 from . import sets
+from . import undo
+from . import dag
 from . import ui
 from .plugins import Plugin
 from .namespaces import Namespace
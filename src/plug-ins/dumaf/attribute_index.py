@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+# ====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# ======================= END GPL LICENSE BLOCK ========================
+
+"""A scene-wide index of the nodes flagged with a boolean attribute"""
+
+import maya.api.OpenMaya as om  # pylint: disable=import-error
+
+class AttributeIndex():
+    """Keeps the list of the nodes which have the given boolean attribute checked.
+    The index is built with a single plug query on the whole scene,
+    then kept up to date with Maya callbacks, so listing the nodes
+    costs O(indexed nodes) instead of O(scene nodes)."""
+
+    # Above this number of new nodes, it's faster to rebuild the whole index
+    MAX_PENDING_NODES = 5000
+
+    # <== Constructor ==>
+
+    def __init__(self, attribute):
+        self.__attribute = attribute
+        # uuid -> MObjectHandle
+        self.__nodes = {}
+        # uuid -> attribute changed callback id
+        self.__node_callbacks = {}
+        # Handles of the nodes created since the last query
+        self.__pending = []
+        self.__dirty = True
+        self.__callbacks = []
+
+    # <== Public ==>
+
+    def attribute(self):
+        """The name of the indexed attribute"""
+        return self.__attribute
+
+    def install_callbacks(self):
+        """Starts listening to the scene changes"""
+        if len(self.__callbacks) > 0:
+            return
+        self.__callbacks = [
+            om.MDGMessage.addNodeAddedCallback( self.__node_added, 'dependNode' ),
+            om.MDGMessage.addNodeRemovedCallback( self.__node_removed, 'dependNode' ),
+            om.MSceneMessage.addCallback( om.MSceneMessage.kAfterOpen, self.__scene_changed ),
+            om.MSceneMessage.addCallback( om.MSceneMessage.kAfterNew, self.__scene_changed ),
+        ]
+        # We've missed everything which happened before
+        self.__dirty = True
+
+    def remove_callbacks(self):
+        """Stops listening to the scene changes (call this before unloading the plug-in)"""
+        for callback_id in self.__callbacks:
+            om.MMessage.removeCallback(callback_id)
+        self.__callbacks = []
+        self.__clear()
+
+    def invalidate(self):
+        """Forces a full rebuild of the index on the next query"""
+        self.__dirty = True
+
+    def update(self, node):
+        """Adds or removes a single node from the index, according to its attribute value.
+        Call this after changing the attribute on a node which already exists."""
+        obj = self.__get_object(node)
+        if obj is None:
+            return
+        self.__check_node(obj)
+
+    def nodes(self):
+        """Returns the full paths of all the indexed nodes"""
+        self.__refresh()
+        paths = []
+        for node_uuid, handle in list(self.__nodes.items()):
+            if not handle.isValid():
+                self.__unindex(node_uuid)
+                continue
+            paths.append( self.__node_path(handle.object()) )
+        return paths
+
+    def count(self):
+        """The number of indexed nodes"""
+        self.__refresh()
+        return len(self.__nodes)
+
+    # <== Private ==>
+
+    def __refresh(self):
+        self.install_callbacks()
+        if self.__dirty:
+            self.__rebuild()
+            return
+        pending = self.__pending
+        self.__pending = []
+        for handle in pending:
+            if handle.isValid():
+                self.__check_node(handle.object())
+
+    def __rebuild(self):
+        self.__clear()
+        self.__dirty = False
+        # A single query for all the plugs with this name, in all namespaces
+        selection = om.MSelectionList()
+        try:
+            selection.add( '*.' + self.__attribute, True )
+        except RuntimeError:
+            # Nothing found
+            return
+        for i in range(selection.length()):
+            try:
+                plug = selection.getPlug(i)
+            except TypeError:
+                continue
+            if plug.asBool():
+                self.__index( plug.node() )
+
+    def __clear(self):
+        for callback_id in self.__node_callbacks.values():
+            om.MMessage.removeCallback(callback_id)
+        self.__node_callbacks = {}
+        self.__nodes = {}
+        self.__pending = []
+
+    def __check_node(self, obj):
+        fn_node = om.MFnDependencyNode(obj)
+        checked = False
+        if fn_node.hasAttribute(self.__attribute):
+            checked = fn_node.findPlug(self.__attribute, False).asBool()
+        if checked:
+            self.__index(obj)
+        else:
+            self.__unindex( fn_node.uuid().asString() )
+
+    def __index(self, obj):
+        node_uuid = om.MFnDependencyNode(obj).uuid().asString()
+        if node_uuid in self.__nodes:
+            return
+        self.__nodes[node_uuid] = om.MObjectHandle(obj)
+        self.__node_callbacks[node_uuid] = om.MNodeMessage.addAttributeChangedCallback(
+            obj,
+            self.__attribute_changed
+            )
+
+    def __unindex(self, node_uuid):
+        if node_uuid not in self.__nodes:
+            return
+        del self.__nodes[node_uuid]
+        callback_id = self.__node_callbacks.pop(node_uuid, None)
+        if callback_id is not None:
+            om.MMessage.removeCallback(callback_id)
+
+    def __node_path(self, obj):
+        if obj.hasFn(om.MFn.kDagNode):
+            return om.MDagPath.getAPathTo(obj).fullPathName()
+        return om.MFnDependencyNode(obj).name()
+
+    def __get_object(self, node):
+        selection = om.MSelectionList()
+        try:
+            selection.add( node )
+            return selection.getDependNode(0)
+        except: # pylint: disable=bare-except
+            return None
+
+    # <== Callbacks ==>
+
+    def __node_added(self, obj, client_data): # pylint: disable=unused-argument
+        if self.__dirty:
+            return
+        if len(self.__pending) >= self.MAX_PENDING_NODES:
+            self.__pending = []
+            self.__dirty = True
+            return
+        self.__pending.append( om.MObjectHandle(obj) )
+
+    def __node_removed(self, obj, client_data): # pylint: disable=unused-argument
+        if len(self.__nodes) == 0:
+            return
+        self.__unindex( om.MFnDependencyNode(obj).uuid().asString() )
+
+    def __attribute_changed(self, msg, plug, other_plug, client_data): # pylint: disable=unused-argument
+        if not msg & (om.MNodeMessage.kAttributeSet | om.MNodeMessage.kAttributeRemoved):
+            return
+        if plug.partialName(useLongNames=True) != self.__attribute:
+            return
+        # The attribute may be removed at this point, check the node again later
+        self.__pending.append( om.MObjectHandle(plug.node()) )
+
+    def __scene_changed(self, client_data=None): # pylint: disable=unused-argument
+        self.__dirty = True
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+
+# ====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# ======================= END GPL LICENSE BLOCK ========================
+
+"""Fast DAG traversal, yielding lightweight records instead of Node objects"""
+
+import re
+import fnmatch
+import maya.cmds as cmds  # pylint: disable=import-error
+import maya.api.OpenMaya as om  # pylint: disable=import-error
+from .undo import lock_plugs
+
+TRANSFORM_ATTRIBUTES = ('tx', 'ty', 'tz', 'rx', 'ry', 'rz', 'sx', 'sy', 'sz')
+
+class DagRecord():
+    """The info about a DAG node found during a walk.
+    The values are read from the API only when they're first needed."""
+
+    __slots__ = (
+        'path',
+        '__fn_node',
+        '__shapes',
+        '__hidden',
+        '__transform_locked',
+        )
+
+    def __init__(self, dag_path):
+        # The MDagPath (a copy, the iterator reuses its own)
+        self.path = om.MDagPath( dag_path )
+        self.__fn_node = None
+        self.__shapes = None
+        self.__hidden = None
+        self.__transform_locked = None
+
+    def full_path(self):
+        """The full path name of the node"""
+        return self.path.fullPathName()
+
+    def node_type(self):
+        """The type of the node"""
+        return self.__fn().typeName
+
+    def is_transform(self):
+        """Checks if this is a transform node (or derived, like joints)"""
+        return self.path.node().hasFn( om.MFn.kTransform )
+
+    def is_referenced(self):
+        """Checks if this node is part of a reference"""
+        return self.__fn().isFromReferencedFile
+
+    def shapes(self):
+        """The MDagPath of the shapes of this node"""
+        if self.__shapes is None:
+            self.__shapes = []
+            for i in range( self.path.childCount() ):
+                child = self.path.child(i)
+                if not child.hasFn( om.MFn.kShape ):
+                    continue
+                shape_path = om.MDagPath( self.path )
+                shape_path.push( child )
+                self.__shapes.append( shape_path )
+        return self.__shapes
+
+    def shape_type(self):
+        """The type of the (first) shape of this node, '' if it has no shape"""
+        shapes = self.shapes()
+        if len(shapes) == 0:
+            return ''
+        return om.MFnDependencyNode( shapes[0].node() ).typeName
+
+    def is_hidden(self):
+        """Checks if the visibility is off.
+        If there's no visibility attribute, the node is not hidden."""
+        if self.__hidden is None:
+            fn_node = self.__fn()
+            self.__hidden = False
+            if fn_node.hasAttribute( 'visibility' ):
+                self.__hidden = not fn_node.findPlug( 'visibility', False ).asBool()
+        return self.__hidden
+
+    def is_transform_locked(self):
+        """Checks if all the transformation attributes are locked"""
+        if self.__transform_locked is None:
+            self.__transform_locked = True
+            if not self.is_transform():
+                return True
+            fn_node = self.__fn()
+            for attr in TRANSFORM_ATTRIBUTES:
+                if not fn_node.findPlug( attr, False ).isLocked:
+                    self.__transform_locked = False
+                    break
+        return self.__transform_locked
+
+    def __fn(self):
+        if self.__fn_node is None:
+            self.__fn_node = om.MFnDagNode( self.path )
+        return self.__fn_node
+
+def get_dag_path( node ):
+    """Gets the MDagPath of a node given as a path, an MDagPath, or a Node.
+    Returns None if the node is not found"""
+    if isinstance(node, om.MDagPath):
+        return node
+    if hasattr(node, 'dagPath'):
+        return node.dagPath()
+    selection = om.MSelectionList()
+    try:
+        selection.add( node )
+        return selection.getDagPath(0)
+    except: # pylint: disable=bare-except
+        return None
+
+def walk( root, transform_only=False, include_root=False ):
+    """Walks the whole subtree of the root node (depth first, parents first)
+    and yields a DagRecord for each node"""
+    root_path = get_dag_path( root )
+    if root_path is None:
+        return
+
+    iterator = om.MItDag( om.MItDag.kDepthFirst )
+    iterator.reset( root_path, om.MItDag.kDepthFirst )
+    if not include_root:
+        iterator.next()
+
+    while not iterator.isDone():
+        dag_path = iterator.getPath()
+        if not transform_only or dag_path.node().hasFn( om.MFn.kTransform ):
+            yield DagRecord( dag_path )
+        iterator.next()
+
+def empty_groups( root, include_root=True, recursive=True ):
+    """Finds the empty groups (transform nodes without any shape) in the subtree.
+    If recursive, groups containing only empty groups are empty too,
+    otherwise only the groups without any child are.
+    Returns the MDagPath of the top-most empty groups.
+
+    This is a post-order computation done during a single walk, in linear time:
+    no path string is built except for the returned groups."""
+    root_path = get_dag_path( root )
+    if root_path is None:
+        return []
+
+    iterator = om.MItDag( om.MItDag.kDepthFirst )
+    iterator.reset( root_path, om.MItDag.kDepthFirst )
+
+    # The nodes being visited, from the root to the current one.
+    # Each entry is a list: [ depth, MObject, not empty, top-most empty groups inside ]
+    stack = []
+    groups = []
+
+    def close_node():
+        _, obj, not_empty, empty_children = stack.pop()
+        is_empty = not not_empty and obj.apiType() == om.MFn.kTransform
+        if len(stack) == 0:
+            # The root
+            if is_empty and include_root:
+                groups.append( obj )
+            else:
+                groups.extend( empty_children )
+            return
+        parent = stack[-1]
+        if is_empty:
+            parent[3].append( obj )
+        else:
+            parent[2] = True
+            parent[3].extend( empty_children )
+        if not recursive:
+            # Any child makes the parent not empty
+            parent[2] = True
+
+    while not iterator.isDone():
+        depth = iterator.depth()
+        # Leaving the previous nodes, their children have all been checked
+        while len(stack) > 0 and stack[-1][0] >= depth:
+            close_node()
+        obj = iterator.currentItem()
+        stack.append( [ depth, obj, obj.apiType() != om.MFn.kTransform, [] ] )
+        iterator.next()
+    while len(stack) > 0:
+        close_node()
+
+    return [ om.MDagPath.getAPathTo(obj) for obj in groups ]
+
+def _walk_transforms( root, include_root, skip_attribute, plain_only=False ):
+    """Yields an MFnDependencyNode for each transform node of the subtree,
+    except the ones which have the skip_attribute checked.
+    If plain_only, the types derived from transform (joints, ik handles, constraints...) are skipped."""
+    root_path = get_dag_path( root )
+    if root_path is None:
+        return
+
+    iterator = om.MItDag( om.MItDag.kDepthFirst, om.MFn.kTransform )
+    iterator.reset( root_path, om.MItDag.kDepthFirst, om.MFn.kTransform )
+    root_obj = root_path.node()
+    fn_node = om.MFnDependencyNode()
+    while not iterator.isDone():
+        obj = iterator.currentItem()
+        iterator.next()
+        if not include_root and obj == root_obj:
+            continue
+        fn_node.setObject( obj )
+        if plain_only and fn_node.typeName != 'transform':
+            continue
+        if skip_attribute != '' and fn_node.hasAttribute( skip_attribute ):
+            if fn_node.findPlug( skip_attribute, False ).asBool():
+                continue
+        yield fn_node
+
+def lock_transform( root, lock=True, include_root=True, skip_attribute='' ):
+    """Locks (or unlocks) the transformation channels of all the plain transforms in the subtree
+    (not the joints, ik handles...), in a single walk.
+    The nodes which have the (boolean) skip_attribute checked are skipped, but not their children."""
+    plugs = []
+    for fn_node in _walk_transforms( root, include_root, skip_attribute, plain_only=True ):
+        for attr in TRANSFORM_ATTRIBUTES:
+            _add_lock_plug( plugs, fn_node, attr, lock )
+    lock_plugs( plugs, lock )
+
+def is_transform_locked( root, include_root=True ):
+    """Checks if the transformation channels of all the plain transforms in the subtree are locked
+    (the joints, ik handles... are ignored). Stops at the first unlocked channel."""
+    for fn_node in _walk_transforms( root, include_root, '', plain_only=True ):
+        for attr in TRANSFORM_ATTRIBUTES:
+            if not fn_node.findPlug( attr, False ).isLocked:
+                return False
+    return True
+
+def lock_visibility( root, lock=True, include_root=True, only_hidden=False, skip_attribute='' ):
+    """Locks (or unlocks) the visibility of all the transforms in the subtree, in a single walk.
+    If only_hidden, the visible nodes are left untouched.
+    The nodes which have the (boolean) skip_attribute checked are skipped, but not their children."""
+    plugs = []
+    for fn_node in _walk_transforms( root, include_root, skip_attribute ):
+        if only_hidden and fn_node.findPlug( 'visibility', False ).asBool():
+            continue
+        _add_lock_plug( plugs, fn_node, 'visibility', lock )
+    lock_plugs( plugs, lock )
+
+def _add_lock_plug( plugs, fn_node, attr, lock ):
+    """Adds the plug of the attribute to the list if its lock state has to change"""
+    plug = fn_node.findPlug( attr, False )
+    if plug.isLocked != lock:
+        plugs.append( plug )
+
+class NameMatcher():
+    """Checks node names against a list of patterns, compiled once.
+    A pattern starting with 're:' is a regular expression,
+    a pattern containing '*', '?' or '[' is a glob pattern,
+    and any other pattern matches the names containing it."""
+
+    def __init__(self, patterns=(), case_sensitive=False):
+        self.__case_sensitive = case_sensitive
+        self.__substrings = []
+        # Globs must match the whole name, regular expressions can match anywhere
+        self.__globs = []
+        self.__regexes = []
+        flags = 0
+        if not case_sensitive:
+            flags = re.IGNORECASE
+        if patterns is None:
+            patterns = ()
+        for pattern in patterns:
+            if pattern == '':
+                continue
+            if pattern.startswith('re:'):
+                self.__regexes.append( re.compile( pattern[3:], flags ) )
+            elif any( c in pattern for c in '*?[' ):
+                self.__globs.append( re.compile( fnmatch.translate( pattern ), flags ) )
+            else:
+                self.__substrings.append( self.__fold( pattern ) )
+
+    def match(self, name):
+        """Checks if the name matches any of the patterns"""
+        folded = self.__fold( name )
+        for substring in self.__substrings:
+            if substring in folded:
+                return True
+        for glob in self.__globs:
+            if glob.match( name ):
+                return True
+        for regex in self.__regexes:
+            if regex.search( name ):
+                return True
+        return False
+
+    def __fold(self, name):
+        if self.__case_sensitive:
+            return name
+        return name.casefold()
+
+def freeze_transform( root, whitelist=(), case_sensitive=False ):
+    """Freezes the transformations of all the transform nodes in the subtree, in a single call,
+    and moves their pivots to the origin.
+    The nodes whose names (without namespace) match the whitelist are not frozen,
+    the whitelist can contain glob patterns and 're:' regular expressions."""
+    matcher = NameMatcher( whitelist, case_sensitive )
+
+    paths = []
+    # Only plain transform nodes (not joints...)
+    for fn_node in _walk_transforms( root, True, '', plain_only=True ):
+        if matcher.match( fn_node.name().split(':')[-1] ):
+            continue
+        paths.append( fn_node.uniqueName() )
+    if len(paths) == 0:
+        return
+
+    # Children first
+    paths.reverse()
+    try:
+        cmds.makeIdentity( paths, apply=True, normal=0, preserveNormals=True )
+    except RuntimeError:
+        # Some nodes can't be frozen, try them one by one
+        for path in paths:
+            try:
+                cmds.makeIdentity( path, apply=True, normal=0, preserveNormals=True )
+            except RuntimeError:
+                pass
+
+    # Center pivots
+    origin = om.MPoint(0, 0, 0)
+    for path in paths:
+        dag_path = get_dag_path( path )
+        if dag_path is None:
+            continue
+        fn_transform = om.MFnTransform( dag_path )
+        fn_transform.setRotatePivot( origin, om.MSpace.kWorld, True )
+        fn_transform.setScalePivot( origin, om.MSpace.kWorld, True )
+
+class DeleteBatch():
+    """Collect-then-delete mode: while this context is active,
+    all the nodes passed to delete() are kept and deleted at once when it exits.
+
+    with DeleteBatch():
+        for node in nodes:
+            Node(node).remove()
+    """
+
+    _current = None
+
+    def __init__(self):
+        self.__handles = []
+        self.__previous = None
+
+    @classmethod
+    def current(cls):
+        """The active batch, or None"""
+        return cls._current
+
+    def add(self, dag_path):
+        """Adds a node to be deleted"""
+        self.__handles.append( om.MObjectHandle( dag_path.node() ) )
+
+    def __enter__(self):
+        self.__previous = DeleteBatch._current
+        DeleteBatch._current = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        DeleteBatch._current = self.__previous
+        if exc_type is not None:
+            self.__handles = []
+            return False
+        dag_paths = []
+        for handle in self.__handles:
+            if handle.isValid():
+                dag_paths.append( om.MDagPath.getAPathTo( handle.object() ) )
+        self.__handles = []
+        delete( dag_paths )
+        return False
+
+def delete( dag_paths ):
+    """Deletes all the nodes with a single delete command.
+    Nodes inside the hierarchy of other nodes to delete are skipped,
+    and the references they contain are imported first.
+    If a DeleteBatch is active, the nodes are deleted when it exits."""
+
+    dag_paths = [ get_dag_path(p) for p in dag_paths ]
+    dag_paths = [ p for p in dag_paths if p is not None ]
+
+    batch = DeleteBatch.current()
+    if batch is not None:
+        for dag_path in dag_paths:
+            batch.add( dag_path )
+        return
+
+    paths = set( p.fullPathName() for p in dag_paths )
+    if len(paths) == 0:
+        return
+
+    # Keep only the top-most ones, the children are deleted with them
+    handles = []
+    for path in paths:
+        parent = path.rpartition('|')[0]
+        skip = False
+        while parent != '':
+            if parent in paths:
+                skip = True
+                break
+            parent = parent.rpartition('|')[0]
+        if skip:
+            continue
+        handles.append( om.MObjectHandle( get_dag_path(path).node() ) )
+
+    # Referenced nodes can't be deleted
+    reference_files = []
+    iterator = om.MItDag( om.MItDag.kDepthFirst )
+    for handle in handles:
+        iterator.reset( om.MDagPath.getAPathTo(handle.object()), om.MItDag.kDepthFirst )
+        while not iterator.isDone():
+            if om.MFnDependencyNode( iterator.currentItem() ).isFromReferencedFile:
+                reference_file = cmds.referenceQuery( iterator.fullPathName(), filename=True )
+                if reference_file not in reference_files:
+                    reference_files.append( reference_file )
+            iterator.next()
+    for reference_file in reference_files:
+        cmds.file( reference_file, importReference=True )
+
+    to_delete = []
+    for handle in handles:
+        if handle.isValid():
+            to_delete.append( om.MDagPath.getAPathTo(handle.object()).fullPathName() )
+    if len(to_delete) > 0:
+        cmds.delete( to_delete )
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# ====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# ======================= END GPL LICENSE BLOCK ========================
+
+"""A scene-scoped cache of the nodes found by UUID or full path"""
+
+import re
+from collections import OrderedDict
+import maya.api.OpenMaya as om  # pylint: disable=import-error
+
+UUID_RE = re.compile('^[0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12}$')
+
+class NodeCache():
+    """Keeps the MObjectHandle (and MDagPath) of the nodes already found,
+    by UUID and by full path, to avoid resolving the same strings again and again.
+    The paths are forgotten when any node is renamed or reparented,
+    and everything is forgotten when a scene is opened or created.
+    Deleted nodes are detected with their handles.
+    Above MAX_NODES nodes, the least recently used ones are forgotten."""
+
+    # The maximum number of nodes kept by UUID, and by full path
+    MAX_NODES = 200000
+
+    def __init__(self):
+        # uuid -> MObjectHandle
+        self.__uuids = OrderedDict()
+        # full path -> (MObjectHandle, MDagPath)
+        self.__paths = OrderedDict()
+        self.__callbacks = []
+        self.hits = 0
+        self.misses = 0
+
+    # <== Public ==>
+
+    @staticmethod
+    def is_uuid(key):
+        """Checks if this string is a node UUID"""
+        return UUID_RE.match(key) is not None
+
+    @staticmethod
+    def is_cacheable(key):
+        """Checks if this string can be cached (a UUID or a full path)"""
+        if not isinstance(key, str):
+            return False
+        return key.startswith('|') or NodeCache.is_uuid(key)
+
+    def get(self, key):
+        """Gets the node for this UUID or full path.
+        Returns a tuple (MObjectHandle, MDagPath or None) or None if it's not in the cache"""
+        self.install_callbacks()
+        if key in self.__paths:
+            handle, dag_path = self.__paths[key]
+            if handle.isValid() and dag_path.isValid():
+                self.hits = self.hits + 1
+                self.__paths.move_to_end( key )
+                return (handle, om.MDagPath(dag_path))
+            del self.__paths[key]
+        elif key in self.__uuids:
+            handle = self.__uuids[key]
+            if handle.isValid():
+                self.hits = self.hits + 1
+                self.__uuids.move_to_end( key )
+                dag_path = None
+                if handle.object().hasFn( om.MFn.kDagNode ):
+                    dag_path = om.MDagPath.getAPathTo( handle.object() )
+                return (handle, dag_path)
+            del self.__uuids[key]
+        self.misses = self.misses + 1
+        return None
+
+    def add(self, key, handle, dag_path=None):
+        """Adds a node found with a UUID or a full path"""
+        if not self.is_cacheable(key):
+            return
+        # A node can be in both dicts, each one is limited to MAX_NODES
+        if key.startswith('|'):
+            if dag_path is not None:
+                self.__paths[key] = (handle, om.MDagPath(dag_path))
+                self.__paths.move_to_end( key )
+                if len(self.__paths) > self.MAX_NODES:
+                    self.__paths.popitem( last=False )
+        else:
+            self.__uuids[key] = handle
+            self.__uuids.move_to_end( key )
+            if len(self.__uuids) > self.MAX_NODES:
+                self.__uuids.popitem( last=False )
+
+    def clear(self):
+        """Empties the cache"""
+        self.__uuids = OrderedDict()
+        self.__paths = OrderedDict()
+
+    def stats(self):
+        """Returns the hits, misses and size of the cache as a dict"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.__uuids) + len(self.__paths),
+        }
+
+    def install_callbacks(self):
+        """Starts listening to the scene changes"""
+        if len(self.__callbacks) > 0:
+            return
+        self.__callbacks = [
+            om.MNodeMessage.addNameChangedCallback( om.MObject.kNullObj, self.__name_changed ),
+            om.MDagMessage.addAllDagChangesCallback( self.__dag_changed ),
+            om.MSceneMessage.addCallback( om.MSceneMessage.kAfterOpen, self.__scene_changed ),
+            om.MSceneMessage.addCallback( om.MSceneMessage.kAfterNew, self.__scene_changed ),
+        ]
+        # We've missed everything which happened before
+        self.clear()
+
+    def remove_callbacks(self):
+        """Stops listening to the scene changes (call this before unloading the plug-in)"""
+        for callback_id in self.__callbacks:
+            om.MMessage.removeCallback(callback_id)
+        self.__callbacks = []
+        self.clear()
+
+    # <== Callbacks ==>
+
+    def __name_changed(self, node, previous_name, client_data): # pylint: disable=unused-argument
+        # The paths of the node and all its children have changed
+        if len(self.__paths) > 0:
+            self.__paths = OrderedDict()
+
+    def __dag_changed(self, msg, child, parent, client_data): # pylint: disable=unused-argument
+        if len(self.__paths) > 0:
+            self.__paths = OrderedDict()
+
+    def __scene_changed(self, client_data=None): # pylint: disable=unused-argument
+        self.clear()
+
+# The cache used by the Node class
+NODE_CACHE = NodeCache()
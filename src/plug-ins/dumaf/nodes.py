@@ -27,10 +27,24 @@ from .paths import (
     baseName,
     sanitizeName
 )
+from .sets import get_memberships
+from . import dag
+from .node_cache import NodeCache, NODE_CACHE
 
 class Node():
     """A wrapper class for maya nodes"""
 
+    # Many nodes may be created, keep them small
+    __slots__ = (
+        '__handle',
+        '__dagPath',
+        '__fnDagNode',
+        '__uuid',
+        )
+
+    # Used to find the nodes, instead of creating a new list for each one
+    _selection = om.MSelectionList()
+
     non_deletable_objects = [
         '|frontShape',
         '|front',
@@ -51,26 +65,60 @@ class Node():
 
     def __init__(self, node_path):
 
-        self.__fnDagNode = None
+        # The node is kept as an MObjectHandle (and an MDagPath for DAG nodes)
+        # so that it's found back quickly even if it's renamed or reparented
+        self.__handle = None
         self.__dagPath = None
+        # These ones are created only when needed
+        self.__fnDagNode = None
+        self.__uuid = ''
 
         if isinstance(node_path, Node):
             # Copy constructor
-            self.__dagPath = node_path.dagPath()
-            self.__uuid = node_path.uuid()
+            self.__handle = node_path.handle()
+            dagPath = node_path.dagPath()
+            if dagPath is not None:
+                self.__dagPath = om.MDagPath( dagPath )
+        elif isinstance(node_path, om.MDagPath):
+            self.__handle = om.MObjectHandle( node_path.node() )
+            self.__dagPath = om.MDagPath( node_path )
         else:
-            self.__dagPath = Node.get_dagPath( node_path )
-            if self.__dagPath:
-                self.__fnDagNode = om.MFnDagNode( self.__dagPath )
+            cacheable = NodeCache.is_cacheable( node_path )
+            cached = None
+            if cacheable:
+                cached = NODE_CACHE.get( node_path )
+            if cached is not None:
+                self.__handle, self.__dagPath = cached
             else:
-                # For some reason, Maya returns the short names if queried with uuid,
-                # We need to get the full paths first...
-                node_paths = cmds.ls(node_path, long=True)
-                if len(node_paths) > 0:
-                    self.__uuid = cmds.ls(node_paths, uuid=True)[0]
+                found = Node._select( node_path )
+                if not found:
+                    # For some reason, Maya returns the short names if queried with uuid,
+                    # We need to get the full paths first...
+                    node_paths = cmds.ls(node_path, long=True)
+                    if node_paths:
+                        found = Node._select( node_paths[0] )
+                if not found:
+                    return
+                obj = Node._selection.getDependNode( 0 )
+                self.__handle = om.MObjectHandle( obj )
+                if obj.hasFn( om.MFn.kDagNode ):
+                    self.__dagPath = Node._selection.getDagPath( 0 )
+                if cacheable:
+                    NODE_CACHE.add( node_path, self.__handle, self.__dagPath )
 
     # <== Static ==>
 
+    @staticmethod
+    def _select( node_path ):
+        """Puts only this node in the shared selection list.
+        Returns False if it does not exist"""
+        Node._selection.clear()
+        try:
+            Node._selection.add( node_path )
+        except:
+            return False
+        return Node._selection.length() == 1
+
     @staticmethod
     def get_dagPath( node_path ):
         """Creates an MDagPath from a path string"""
@@ -90,10 +138,7 @@ class Node():
         """Returns a list of Nodes"""
         if node_paths_or_uuids is None:
             return []
-        nodes = []
-        for nodePath in node_paths_or_uuids:
-            nodes.append(Node(nodePath))
-        return nodes
+        return [ Node(nodePath) for nodePath in node_paths_or_uuids ]
 
     @staticmethod
     def get_create_group(group_name, parent_node=None):
@@ -128,47 +173,30 @@ class Node():
 
     @staticmethod
     def get_empty_groups(parent_node=None):
-        """Gets all empty groups children of the parent node or in the scene"""
-        nodes = ()
+        """Gets all empty groups children of the parent node or in the scene.
+        Groups containing only empty groups are empty too, only the top-most ones are returned."""
         emptyGroups = []
-
         if parent_node is None:
-            nodes = cmds.ls(type='transform')
-            nodes = Node.get_nodes(nodes)
+            for root in cmds.ls(assemblies=True, long=True):
+                emptyGroups.extend( dag.empty_groups(root) )
         else:
-            parent_node = Node(parent_node)
-            nodes = parent_node.children(transform_only=True)
-
-        for testNode in nodes:
-            if not testNode.isGroup():
-                continue
-            if not testNode.hasChildren():
-                emptyGroups.append(testNode)
-        return emptyGroups
+            emptyGroups = dag.empty_groups(Node(parent_node), include_root=False)
+        return Node.get_nodes(emptyGroups)
 
     @staticmethod
     def remove_empty_groups(parent_node=None):
         """Removes all empty groups from the scene or the given parent node"""
         emptyGroups = Node.get_empty_groups(parent_node)
-        while len(emptyGroups) > 0:
-            for group in emptyGroups:
-                group.remove()
-            emptyGroups = Node.get_empty_groups(parent_node)
+        dag.delete( [ group.dagPath() for group in emptyGroups ] )
 
     @staticmethod
     def lock_hidden_nodes(parent_node=None):
         """Locks the visibility of all hidden nodes."""
-        nodes = ()
         if parent_node is None:
-            nodes = cmds.ls(long=True)
+            for root in cmds.ls(assemblies=True, long=True):
+                dag.lock_visibility( root, True, only_hidden=True )
         else:
-            parent_node = Node(parent_node)
-            nodes = parent_node.children()
-
-        for node in nodes:
-            node = Node(node)
-            if node.is_hidden():
-                node.lock_visibility( True )
+            dag.lock_visibility( Node(parent_node), True, include_root=False, only_hidden=True )
 
     @staticmethod
     def remove_hidden_nodes(parent_node=None):
@@ -243,33 +271,41 @@ class Node():
         return True
 
     def children(self, recursive=True, transform_only=False):
-        """Gets the children of this node"""
-        if not self.exists():
+        """Gets the children of this node.
+        The order is the same as listRelatives: when recursive, the deepest nodes come first."""
+        dagPath = self.dagPath()
+        if dagPath is None:
             return []
+
         children = []
-        nodePath = self.path()
-        if transform_only:
-            children = cmds.listRelatives(
-                nodePath,
-                ad=recursive,
-                type='transform',
-                fullPath=True
-            )
+        if recursive:
+            iterator = om.MItDag( om.MItDag.kDepthFirst )
+            iterator.reset( dagPath, om.MItDag.kDepthFirst )
+            # Skip this node
+            iterator.next()
+            while not iterator.isDone():
+                childPath = iterator.getPath()
+                if not transform_only or childPath.node().hasFn( om.MFn.kTransform ):
+                    children.append( Node(childPath) )
+                iterator.next()
+            children.reverse()
         else:
-            children = cmds.listRelatives(
-                nodePath,
-                ad=recursive,
-                fullPath=True
-            )
-        if children is None:
-            return []
-        return Node.get_nodes(children)
-
-    def create_root_controller(self, ctrl_name, no_root_shape = False):
+            for i in range( dagPath.childCount() ):
+                child = dagPath.child(i)
+                if transform_only and not child.hasFn( om.MFn.kTransform ):
+                    continue
+                childPath = om.MDagPath( dagPath )
+                childPath.push( child )
+                children.append( Node(childPath) )
+        return children
+
+    def create_root_controller(self, ctrl_name, no_root_shape = False, fast_bounding_box = False):
         """Creates and returns a curve to be used as a controller for this node
         NOTE: for some reason, connections may break just after importing nodes
         if we create the shape before adding to a new group, so we must first group,
-        then create a shape to be added to the transform node/group"""
+        then create a shape to be added to the transform node/group.
+        If fast_bounding_box, the size of the curve is computed from the approximate bounds
+        (see world_bounding_box)"""
         if not self.exists():
             return None
         nodePath = self.path()
@@ -282,7 +318,7 @@ class Node():
 
         if not no_root_shape:
             # Get the bounding box
-            boundingBox = cmds.exactWorldBoundingBox( nodePath )
+            boundingBox = self.world_bounding_box( exact=not fast_bounding_box )
             xmax = boundingBox[3]
             xmin = boundingBox[0]
             zmax = boundingBox[5]
@@ -307,10 +343,46 @@ class Node():
 
         return controller
 
+    def world_bounding_box(self, exact=True):
+        """Returns the bounding box of the node and its children in world space,
+        as a tuple (xmin, ymin, zmin, xmax, ymax, zmax) like cmds.exactWorldBoundingBox.
+        If not exact, the bounding box stored in the DAG nodes is transformed to world space instead:
+        it's much faster, but may be a bit larger than the exact one."""
+        if exact:
+            return tuple(cmds.exactWorldBoundingBox( self.path() ))
+
+        dagPath = self.dagPath()
+        if dagPath is None:
+            return (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        boundingBox = self.fnDagNode().boundingBox
+        boundingBox.transformUsing( dagPath.inclusiveMatrix() )
+        bbmin = boundingBox.min
+        bbmax = boundingBox.max
+        return (bbmin.x, bbmin.y, bbmin.z, bbmax.x, bbmax.y, bbmax.z)
+
     def dagPath(self):
-        """Returns the MDagPath for this node"""
+        """Returns the MDagPath for this node, None if it does not exist or is not a DAG node"""
+        if self.__dagPath is None:
+            return None
+        if not self.exists():
+            return None
+        # The path changes when the node or one of its parents is reparented
+        if not self.__dagPath.isValid():
+            self.__dagPath = om.MDagPath.getAPathTo( self.__handle.object() )
         return self.__dagPath
 
+    def fnDagNode(self):
+        """Returns the MFnDagNode for this node (created when first needed),
+        None if it does not exist or is not a DAG node"""
+        dagPath = self.dagPath()
+        if dagPath is None:
+            return None
+        if self.__fnDagNode is None:
+            self.__fnDagNode = om.MFnDagNode( dagPath )
+        else:
+            self.__fnDagNode.setObject( dagPath )
+        return self.__fnDagNode
+
     def delete_history(self, recursive=False):
         """Deletes the construction history of the node"""
         if not self.exists():
@@ -331,10 +403,9 @@ class Node():
 
     def exists(self):
         """Checks if this node still exists in the scene"""
-        nodePath = self.path()
-        if nodePath == '':
+        if self.__handle is None:
             return False
-        return cmds.objExists(nodePath)
+        return self.__handle.isValid()
 
     def freeze_transform(self):
         """Resets the transformation matrix to 0"""
@@ -368,11 +439,17 @@ class Node():
             return False
         return len(self.children(transform_only=True)) != 0
 
+    def handle(self):
+        """Returns the MObjectHandle for this node"""
+        return self.__handle
+
     def has_parent(self):
         """Checks if the node has a parent"""
-        if not self.exists():
+        dagPath = self.dagPath()
+        if dagPath is None:
             return False
-        return cmds.listRelatives(self.path(), p=True, f=True) is not None
+        # The world is not a parent
+        return dagPath.length() > 1
 
     def has_attr(self, attribute):
         """Checks if the nodes has the given Maya attribute"""
@@ -417,8 +494,7 @@ class Node():
         if not self.is_transform():
             return False
         # And it does not have any child shape
-        nodePath = self.path()
-        return cmds.listRelatives(nodePath, s=True, f=True) is None
+        return len(self.shapes()) == 0
 
     def is_hidden(self):
         """Checks if the node is hidden.
@@ -441,7 +517,7 @@ class Node():
         """Checks if this is a transform node"""
         if not self.exists():
             return False
-        return cmds.nodeType(self.path()) == 'transform'
+        return om.MFnDependencyNode( self.__handle.object() ).typeName == 'transform'
 
     def is_transform_locked(self, recursive=False):
         """Checks if the transformation are locked"""
@@ -450,16 +526,10 @@ class Node():
         if not self.is_transform():
             return True
 
-        node_path = self.path()
-
         if recursive:
-            children = cmds.listRelatives(node_path, type='transform', ad=True)
-            if children:
-                for child in children:
-                    child = Node(child)
-                    if not child.is_transform_locked():
-                        return False
+            return dag.is_transform_locked(self)
 
+        node_path = self.path()
         for attr in ['.tx', '.ty', '.tz', '.rx', '.ry', '.rz', '.sx', '.sy', '.sz']:
             locked = cmds.getAttr(node_path + attr, lock=True)
             if not locked:
@@ -479,13 +549,11 @@ class Node():
 
     def keep_types(self, types_list):
         """Keeps all shapes (self and children) only if they're in the type list"""
-        children = self.children(transform_only=True)
-        for child in children:
-            child = Node(child)
-            if child.shape_type() not in types_list:
-                child.remove_shape()
-        if self.shape_type() not in types_list:
-            self.remove_shape()
+        shapes = []
+        for record in dag.walk(self, transform_only=True, include_root=True):
+            if record.shape_type() not in types_list:
+                shapes.extend( record.shapes() )
+        dag.delete(shapes)
 
     def lock_transform(self, lock_node=True, lock_children=False):
         """Locks all transformation of the node"""
@@ -495,9 +563,8 @@ class Node():
         if not self.is_transform():
             return
         if lock_children:
-            children = self.children(transform_only=True)
-            for child in children:
-                child.lock_transform(lock_node)
+            dag.lock_transform(self, lock_node)
+            return
 
         nodePath = self.path()
         for attr in ['.tx', '.ty', '.tz', '.rx', '.ry', '.rz', '.sx', '.sy', '.sz']:
@@ -508,10 +575,11 @@ class Node():
         if not self.exists():
             return
 
+        if lock_children and self.is_transform():
+            dag.lock_visibility(self, lock_node, only_hidden=only_hidden)
+            return
         if lock_children:
-            children = self.children(transform_only=True)
-            for child in children:
-                child.lock_visibility(lock_node, only_hidden)
+            dag.lock_visibility(self, lock_node, include_root=False, only_hidden=only_hidden)
 
         node_path = self.path()
         if not cmds.attributeQuery('visibility', n=node_path, exists=True):
@@ -547,16 +615,12 @@ class Node():
 
     def parent(self):
         """Gets the parent node"""
-        if not self.exists():
+        if not self.has_parent():
             return None
 
-        node_path = self.path()
-        prnt = cmds.listRelatives(node_path, p=True, f=True)
-
-        if prnt is not None:
-            return Node(prnt[0])
-
-        return None
+        parentPath = om.MDagPath( self.dagPath() )
+        parentPath.pop()
+        return Node(parentPath)
 
     def parent_to(self, parent, rel=False):
         """Parents the node to the parent"""
@@ -582,14 +646,15 @@ class Node():
 
     def path(self):
         """Returns the full path for the node"""
+        if not self.exists():
+            return ''
 
-        if not self.__dagPath:
-            paths = cmds.ls(self.uuid(), long=True)
-            if len(paths) == 0:
-                return ''
-            return paths[0]
+        dagPath = self.dagPath()
+        if dagPath is None:
+            # Not a DAG node
+            return om.MFnDependencyNode( self.__handle.object() ).name()
 
-        return self.__dagPath.fullPathName()
+        return dagPath.fullPathName()
 
     def reference_file(self):
         """Gets the source file of the reference if this node is part of a reference"""
@@ -616,15 +681,18 @@ class Node():
     def remove(self):
         """Deletes the node from the scene,
         even if it's in a reference or contains a reference.
-        Warning: this will import the reference!"""
+        Warning: this will import the reference!
+        Inside a dag.DeleteBatch, the node is deleted when the batch exits."""
         if not self.exists():
             return
 
-        children = self.children(transform_only=True)
-        for child in children:
-            child.import_reference()
-        node_path = self.path()
-        cmds.delete(node_path)
+        dagPath = self.dagPath()
+        if dagPath is None:
+            # Not a DAG node
+            cmds.delete(self.path())
+            return
+
+        dag.delete([dagPath])
 
     def remove_shape(self):
         """Removes the shape from this node"""
@@ -637,60 +705,45 @@ class Node():
 
     def remove_empty(self, recursive=True):
         """Removes all empty groups"""
-        for child in self.children():
-            child = Node(child)
-            if child.is_empty(recursive):
-                child.remove()
-        if self.is_empty(recursive):
-                self.remove()
+        if not self.exists():
+            return
+        dag.delete( dag.empty_groups(self, recursive=recursive) )
 
     def remove_extra_shapes(self, recursive=True):
         """Removes all extra shapes from this node"""
         if not self.exists():
             return
 
+        records = (dag.DagRecord(self.dagPath()),)
         if recursive:
-            children = self.children(transform_only=True)
-            for child in children:
-                shapes = child.shapes()
-                if len(shapes) > 1:
-                    for shape in shapes[1:]:
-                        shape.remove()
+            records = dag.walk(self, transform_only=True, include_root=True)
 
-        # The shape(s) of this node
-        shapes = self.shapes()
         # Remove supplementary shapes
         # (Maya may store more than a single shape in transform nodes
         # because of the dependency graph)
-        if len(shapes) > 1:
-            for shape in shapes[1:]:
-                shape.remove()
+        extra_shapes = []
+        for record in records:
+            extra_shapes.extend( record.shapes()[1:] )
+        dag.delete(extra_shapes)
 
     def remove_hidden_children(self):
         """Removes all hidden children"""
-        children = self.children()
-        for child in reversed(children):
-            child = Node(child)
-            if child.is_hidden():
-                child.remove()
+        hidden = []
+        for record in dag.walk(self):
+            if record.is_hidden():
+                hidden.append(record.path)
+        dag.delete(hidden)
 
     def remove_types(self, types_list):
         """Removes all shapes (self and children) if they're one of these types"""
-        children = self.children(transform_only=True)
-
-        for child in children:
-            child = Node(child)
-            shape_type = child.shape_type()
+        shapes = []
+        for record in dag.walk(self, transform_only=True, include_root=True):
+            shape_type = record.shape_type()
             if shape_type in types_list:
-                print("Removing shape from " + child.name())
+                print("Removing shape from " + baseName(record.full_path()))
                 print("    Because it is of type " + shape_type)
-                child.remove_shape()
-
-        shape_type = self.shape_type()
-        if shape_type in types_list:
-            print("Removing shape from " + self.name())
-            print("    Because it is of type " + shape_type)
-            self.remove_shape()
+                shapes.extend( record.shapes() )
+        dag.delete(shapes)
 
     def rename_shapes(self):
         """Automatically renames the shapes after the transform node name"""
@@ -716,26 +769,23 @@ class Node():
         if not self.exists():
             return ()
         # We need to transfer the deformers and rendering sets to the new geo
-        current_nodes = cmds.listRelatives(self.path(), ad = True, f=True)
-        if current_nodes is None:
-            return {}
-        node_sets = {}
-        for node in current_nodes:
-            sets = cmds.listSets(object=node, ets= True)
-            if sets is not None:
-                node_name = baseName(node)
-                node_sets[node_name] = sets
-
-        return node_sets
+        return get_memberships( self.path() )
 
     def shapes(self):
         """Gets all the shapes of this node"""
-        if not self.exists():
+        dagPath = self.dagPath()
+        if dagPath is None:
             return []
-        nodePath = self.path()
         # The shapes of this node
-        shapePaths = cmds.listRelatives(nodePath,s=True,f=True)
-        return Node.get_nodes(shapePaths)
+        shapes = []
+        for i in range( dagPath.childCount() ):
+            child = dagPath.child(i)
+            if not child.hasFn( om.MFn.kShape ):
+                continue
+            shapePath = om.MDagPath( dagPath )
+            shapePath.push( child )
+            shapes.append( Node(shapePath) )
+        return shapes
 
     def shape(self):
         """Gets the main shape of this node"""
@@ -778,7 +828,8 @@ class Node():
         self.parent_to('|')
 
     def uuid(self):
-        """Returns the uuid of this node"""
-        if not self.__fnDagNode:
-            return self.__uuid
-        return self.__fnDagNode.uuid()
+        """Returns the uuid of this node, as a string"""
+        if self.__uuid == '' and self.exists():
+            self.__uuid = om.MFnDependencyNode( self.__handle.object() ).uuid().asString()
+            NODE_CACHE.add( self.__uuid, self.__handle )
+        return self.__uuid
@@ -4,6 +4,7 @@
 
 import maya.cmds as cmds # pylint: disable=import-error
 import maya.api.OpenMaya as om # pylint: disable=import-error
+from .paths import baseName
 
 def getNodes( setName ):
     """Gets all the nodes from a given set"""
@@ -42,3 +43,81 @@ def create_if_not_exists(setName):
     if exists(setName):
         return
     cmds.sets(name=setName, empty=True)
+
+def get_memberships( root ):
+    """Gets the sets (including shading engines and deformer sets)
+    the descendants of the root node belong to, with a single pass over the sets of the scene.
+    As with listSets(extendToShape), transform nodes also get the sets of their shapes.
+    Returns a dict: node name -> list of set names"""
+    descendants = cmds.listRelatives( root, ad=True, f=True )
+    if descendants is None:
+        return {}
+    descendants = set(descendants)
+
+    memberships = {}
+    all_sets = cmds.ls( type='objectSet' )
+    if not all_sets:
+        return memberships
+
+    selectionList = om.MSelectionList()
+    for set_name in all_sets:
+        selectionList.add( set_name )
+
+    for i in range( selectionList.length() ):
+        fn_set = om.MFnSet( selectionList.getDependNode(i) )
+        set_name = fn_set.name()
+        members = fn_set.getMembers( False )
+        for j in range( members.length() ):
+            try:
+                dag_path = members.getDagPath(j)
+            except TypeError:
+                # Not a DAG node
+                continue
+            path = dag_path.fullPathName()
+            if path not in descendants:
+                continue
+            names = [ baseName(path) ]
+            # Shapes: the transform is in the set too
+            if not dag_path.node().hasFn( om.MFn.kTransform ):
+                dag_path.pop()
+                names.append( baseName(dag_path.fullPathName()) )
+            for name in names:
+                node_sets = memberships.setdefault( name, [] )
+                if set_name not in node_sets:
+                    node_sets.append( set_name )
+
+    return memberships
+
+def restore_memberships( root, memberships ):
+    """Adds the root node and its descendants to the sets they belonged to,
+    matching them by name, with one sets command per set.
+    memberships is a dict: node name -> list of set names, as returned by get_memberships"""
+    nodes = cmds.listRelatives( root, ad=True, f=True )
+    if nodes is None:
+        nodes = []
+    nodes.append( root )
+
+    # set name -> members
+    set_members = {}
+    for node in nodes:
+        for set_name in memberships.get( baseName(node), () ):
+            set_members.setdefault( set_name, [] ).append( node )
+
+    for set_name, members in set_members.items():
+        if _add_to_set( members, set_name ):
+            continue
+        # Something went wrong with some of the members, try them one by one
+        for member in members:
+            _add_to_set( member, set_name )
+
+def _add_to_set( members, set_name ):
+    try:
+        cmds.sets( members, add=set_name )
+        return True
+    except: # Shaders have to be forced as an object can't be in two shader sets at once # pylint: disable=bare-except
+        pass
+    try: # There may still be special sets
+        cmds.sets( members, forceElement=set_name )
+        return True
+    except: # pylint: disable=bare-except
+        return False
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# ====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# ======================= END GPL LICENSE BLOCK ========================
+
+"""Runs API modifiers and plug lock changes through an undoable command, so they reach the undo queue"""
+
+import maya.cmds as cmds  # pylint: disable=import-error
+import maya.api.OpenMaya as om  # pylint: disable=import-error
+
+class ApplyModifierCmd( om.MPxCommand ):
+    """dumafApplyModifier Maya command: runs the pending edits (see apply_modifier).
+    It has to be registered by the plug-in using dumaf."""
+    name = "dumafApplyModifier"
+
+    # The edits to run by the next call of the command:
+    # a tuple (plugs to unlock, modifier, plugs to lock)
+    pending_edits = None
+
+    def __init__(self):
+        om.MPxCommand.__init__(self)
+        self.__unlock_plugs = ()
+        self.__modifier = None
+        self.__lock_plugs = ()
+        # Lists of (MPlug, previous lock state), to revert the changes
+        self.__unlocked = []
+        self.__locked = []
+
+    @staticmethod
+    def createCommand():
+        """Creates the command"""
+        return ApplyModifierCmd()
+
+    @staticmethod
+    def createSyntax():
+        """Creates the Mel Syntax"""
+        return om.MSyntax()
+
+    def doIt(self, args):
+        """Runs the pending edits"""
+        if ApplyModifierCmd.pending_edits is None:
+            return
+        self.__unlock_plugs, self.__modifier, self.__lock_plugs = ApplyModifierCmd.pending_edits
+        ApplyModifierCmd.pending_edits = None
+        try:
+            self.redoIt()
+        except RuntimeError:
+            # Don't leave half of it done, it can't be undone
+            self.undoIt()
+            self.__modifier = None
+            self.__unlock_plugs = ()
+            self.__lock_plugs = ()
+            raise
+
+    def redoIt(self):
+        """Runs the edits again"""
+        # Filled while running, to revert what has been done if it fails
+        self.__unlocked = []
+        self.__locked = []
+        set_plugs_locked( self.__unlock_plugs, False, self.__unlocked )
+        if self.__modifier is not None:
+            self.__modifier.doIt()
+        set_plugs_locked( self.__lock_plugs, True, self.__locked )
+
+    def undoIt(self):
+        """Reverts the edits, in reverse order"""
+        restore_plugs_locked( self.__locked )
+        self.__locked = []
+        if self.__modifier is not None:
+            self.__modifier.undoIt()
+        restore_plugs_locked( self.__unlocked )
+        self.__unlocked = []
+
+    def isUndoable(self):
+        """The edits are kept for undo"""
+        return self.__modifier is not None or len(self.__unlock_plugs) > 0 or len(self.__lock_plugs) > 0
+
+def set_plugs_locked( plugs, lock, changed=None ):
+    """Locks or unlocks the plugs.
+    Returns the list of (MPlug, previous lock state) of the changed plugs,
+    appended to changed if it's a list"""
+    if changed is None:
+        changed = []
+    for plug in plugs:
+        previous = plug.isLocked
+        if previous == lock:
+            continue
+        plug.isLocked = lock
+        changed.append( (plug, previous) )
+    return changed
+
+def restore_plugs_locked( changed ):
+    """Restores the lock states returned by set_plugs_locked"""
+    for plug, previous in reversed(changed):
+        plug.isLocked = previous
+
+def is_registered():
+    """Checks if the undoable command is available"""
+    return cmds.exists( ApplyModifierCmd.name )
+
+def apply_modifier( modifier=None, unlock=(), lock=() ):
+    """Unlocks the MPlug list unlock, runs the MDGModifier (or MDagModifier),
+    then locks the MPlug list lock, so that it can be undone with the other commands.
+    If the command is not registered, the edits are just run and can't be undone."""
+    if not is_registered():
+        set_plugs_locked( unlock, False )
+        if modifier is not None:
+            modifier.doIt()
+        set_plugs_locked( lock, True )
+        return
+    ApplyModifierCmd.pending_edits = ( unlock, modifier, lock )
+    try:
+        cmds.dumafApplyModifier() # pylint: disable=no-member
+    finally:
+        ApplyModifierCmd.pending_edits = None
+
+def lock_plugs( plugs, lock=True ):
+    """Locks (or unlocks) the MPlug list, in a single undoable command"""
+    if lock:
+        apply_modifier( lock=plugs )
+    else:
+        apply_modifier( unlock=plugs )
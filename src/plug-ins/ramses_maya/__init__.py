@@ -18,6 +18,8 @@ from .save_manager import (
     templateSaver
 )
 from . import utils
+from .utils_attributes import RAMSES_NODE_INDEX
+from .utils_items import RAMSES_ITEM_CACHE
 from . import ui_publish
 from . import ui_import
 from . import ui_scene_setup
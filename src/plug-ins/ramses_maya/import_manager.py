@@ -7,10 +7,11 @@ from maya import cmds # pylint: disable=import-error
 import yaml
 import ramses as ram
 from dumaf import ProgressDialog, Node, Plugin
+from dumaf.dag import lock_transform as lock_transform_channels
 from dupyf.string import intToStr
 from .ui_import import ImportSettingsDialog
 from .utils_options import get_option
-from .utils_attributes import RamsesAttribute, get_ramses_attr, set_import_attributes, is_ramses_managed
+from .utils_attributes import RamsesAttribute, read_ramses_attrs, set_import_attributes
 
 def importer( file_paths, item, step, import_options=None, show_import_options=False):
     """The entry point for importing assets"""
@@ -37,6 +38,16 @@ def importer( file_paths, item, step, import_options=None, show_import_options=F
             return
         import_options = import_dialog.get_options()
 
+    # The whole import can be undone at once
+    cmds.undoInfo(openChunk=True, chunkName="Ramses Import")
+    try:
+        import_files(file_paths, item, step, import_options)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+def import_files( file_paths, item, step, import_options ):
+    """Imports the files, then the shaders, with the given options"""
+
     # Progress
     progress_dialog = ProgressDialog()
     progress_dialog.show()
@@ -75,13 +86,14 @@ def importer( file_paths, item, step, import_options=None, show_import_options=F
         autoreload_reference = get_option("autoreload_reference", options, False)
         as_reference = get_option("as_reference", options, False)
         no_root_shape = get_option("no_root_shape", options, False)
+        fast_bounding_box = get_option("fast_bounding_box", options, False)
         create_namespace = get_option("create_namespace", options, True)
 
         ns = get_import_namespace(item)
         if not create_namespace:
             ns = ""
 
-        new_nodes = import_file(file_path, as_reference, lock_transform, no_root_shape, item, ns, item_group, step, autoreload_reference)
+        new_nodes = import_file(file_path, as_reference, lock_transform, no_root_shape, item, ns, item_group, step, autoreload_reference, fast_bounding_box)
         geo_nodes = geo_nodes + new_nodes
 
     # Import shaders
@@ -167,7 +179,7 @@ def get_import_namespace( item ):
 
     return import_namespace
 
-def import_file(file_path, as_reference, lock_transform, no_root_shape, item, item_namespace, item_group, step, autoreload_reference=False):
+def import_file(file_path, as_reference, lock_transform, no_root_shape, item, item_namespace, item_group, step, autoreload_reference=False, fast_bounding_box=False):
     """Imports the items in the file"""
     ram.log("Importing: " + file_path, ram.LogLevel.Debug)
     # Check the extension to load needed plugins
@@ -236,7 +248,7 @@ def import_file(file_path, as_reference, lock_transform, no_root_shape, item, it
 
         # Create root control
         rootName = node.name() + '_' + step.shortName()
-        ctrl = node.create_root_controller( rootName, no_root_shape)
+        ctrl = node.create_root_controller( rootName, no_root_shape, fast_bounding_box )
         # Set its color
         ctrl_shape = cmds.listRelatives(ctrl.path(), shapes=True, f=True, type='nurbsCurve')
         if ctrl_shape:
@@ -251,20 +263,16 @@ def import_file(file_path, as_reference, lock_transform, no_root_shape, item, it
         # Parent to the item group
         ctrl.parent_to( item_group )
 
-        # Store Ramses Data!
-        set_import_attributes( ctrl, item, step, file_path )
-
         # Lock transform except ramses managed children
         if  not as_reference and lock_transform:
-            children = cmds.listRelatives(ctrl.path(), ad=True, f=True, type='transform')
-            if children:
-                for child in children:
-                    if not is_ramses_managed(child):
-                        child = Node(child)
-                        child.lock_transform(True)
+            lock_transform_channels( ctrl, True, include_root=False, skip_attribute=RamsesAttribute.MANAGED )
 
         root_nodes.append(ctrl.path())
 
+    # Store Ramses Data! All the roots at once
+    if len(root_nodes) > 0:
+        set_import_attributes( root_nodes, item, step, file_path )
+
     # We need to reload the reference, because maya breaks stuff
     # with references during the previous steps...
     if as_reference and autoreload_reference:
@@ -276,6 +284,7 @@ def import_file(file_path, as_reference, lock_transform, no_root_shape, item, it
 def apply_shaders(shaders, geo_nodes, ignore_namespace=True):
     """Applies the shaders to the nodes, using the name of the objects stored by Ramses"""
     ram.log("Applying shaders to geometry")
+    shader_records = read_ramses_attrs( shaders )
     for node in geo_nodes:
         ram.log("checking: " + node, ram.LogLevel.Debug)
         # For all mesh
@@ -290,7 +299,7 @@ def apply_shaders(shaders, geo_nodes, ignore_namespace=True):
             name = transform_node.name(keep_namespace = not ignore_namespace)
             # Look for a shader
             for shader in shaders:
-                shaded_objects = get_ramses_attr(shader, RamsesAttribute.SHADED_OBJECTS)
+                shaded_objects = shader_records[shader].get(RamsesAttribute.SHADED_OBJECTS)
                 if shaded_objects is None:
                     continue
                 shaded_objects = shaded_objects.split(",")
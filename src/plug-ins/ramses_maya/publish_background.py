@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""Publishes the nodes in the background, with mayapy worker processes"""
+
+import os
+import platform
+import tempfile
+import shutil
+import subprocess
+import yaml
+
+try:
+    from PySide2 import QtCore as qc
+except:  # pylint: disable=bare-except
+    from PySide6 import QtCore as qc
+
+from maya import cmds # pylint: disable=import-error
+import ramses as ram
+import dumaf as maf
+from .utils import MODULE_PATH, PLUGIN_PATH
+from .publish_export import set_export_metadata, write_export_metadata
+
+# The maximum number of worker processes used by default
+PUBLISH_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+# The prefix of the lines the workers print to report their progress
+REPORT_PREFIX = "RAMSES_PUBLISH|"
+
+# The publishers still running, to keep them alive
+RUNNING_PUBLISHERS = []
+
+def get_mayapy_path():
+    """Gets the path to the mayapy executable of the current Maya"""
+    maya_location = os.environ.get('MAYA_LOCATION', '')
+    executable = 'mayapy'
+    if platform.system() == 'Windows':
+        executable = 'mayapy.exe'
+    return os.path.join(maya_location, 'bin', executable)
+
+def write_publish_job(snapshot_path, nodes, publish_options, publish_info, mode='nodes'):
+    """Writes the job file for the workers and returns its path.
+    nodes is a list of tuples (node path, node name).
+    In 'nodes' mode, the workers share the nodes and publish them;
+    in 'formats' mode, the nodes are already cleaned and the workers share the formats."""
+    job = {
+        'mode': mode,
+        'scene': snapshot_path,
+        'nodes': [ [path, name] for path, name in nodes ],
+        'options': publish_options,
+        # The workers just need it to build the file paths
+        'publish_info': dump_publish_info(publish_info),
+    }
+    job_file, job_path = tempfile.mkstemp(prefix='RamsesPublishJob', suffix='.yml')
+    with os.fdopen(job_file, 'w', encoding='utf8') as f:
+        yaml.safe_dump(job, f)
+    return job_path
+
+def read_publish_job(job_path):
+    """Reads a job file written by write_publish_job.
+    Returns the scene path, the nodes, the options, the publish info and the mode"""
+    with open(job_path, 'r', encoding='utf8') as f:
+        job = yaml.safe_load(f)
+    publish_info = load_publish_info(job['publish_info'])
+    nodes = [ (node[0], node[1]) for node in job['nodes'] ]
+    return job['scene'], nodes, job['options'], publish_info, job.get('mode', 'nodes')
+
+def dump_publish_info(publish_info):
+    """Gets the attributes of the publish info (a RamFileInfo) as plain data, to be written in a job file"""
+    return dict( vars(publish_info) )
+
+def load_publish_info(data):
+    """Rebuilds the publish info (a RamFileInfo) from the data returned by dump_publish_info"""
+    publish_info = ram.RamFileInfo()
+    for key, value in data.items():
+        setattr(publish_info, key, value)
+    return publish_info
+
+def read_report(line):
+    """Parses a line printed by a worker.
+    Returns a tuple (kind, value), kind is None if it's not a report"""
+    if not line.startswith(REPORT_PREFIX):
+        return (None, line)
+    report = line[len(REPORT_PREFIX):].split('|', 1)
+    if len(report) > 1:
+        return (report[0], report[1])
+    return (report[0], '')
+
+def export_formats_in_parallel(node_path, name, formats, publish_info, workers=0):
+    """Exports a cleaned node to several formats at once.
+    The current scene is saved as an intermediate file, then each format is exported
+    from this file by a mayapy process, with at most workers processes.
+    Waits for all the exports to finish; raises a RuntimeError if any of them failed."""
+    if workers <= 0:
+        workers = PUBLISH_WORKERS
+    worker_count = min(workers, len(formats))
+
+    # Save the intermediate scene, without changing the current scene name
+    temp_dir = tempfile.mkdtemp(prefix='RamsesPublish')
+    current_name = cmds.file( q=True, sn=True )
+    scene_path = os.path.join(temp_dir, 'intermediate.mb')
+    cmds.file( rename=scene_path )
+    cmds.file( save=True, type='mayaBinary', options="v=1;" )
+    cmds.file( rename=current_name )
+
+    job_path = write_publish_job(
+        scene_path,
+        [ (node_path, name) ],
+        { 'formats': formats },
+        publish_info,
+        mode='formats'
+        )
+
+    ram.log("Exporting " + name + " to " + str(len(formats)) + " formats with " + str(worker_count) + " worker(s).", ram.LogLevel.Info)
+
+    environment = dict(os.environ)
+    python_path = environment.get('PYTHONPATH', '')
+    if python_path != '':
+        python_path = os.pathsep + python_path
+    environment['PYTHONPATH'] = PLUGIN_PATH + python_path
+
+    # The output goes to files, we don't need to read the pipes while the workers run
+    worker_script = os.path.join(MODULE_PATH, 'publish_worker.py')
+    processes = []
+    try:
+        for i in range(worker_count):
+            output_path = os.path.join(temp_dir, 'worker' + str(i) + '.log')
+            with open(output_path, 'w', encoding='utf8') as output_file:
+                process = subprocess.Popen(
+                    [ get_mayapy_path(), worker_script, job_path, str(i), str(worker_count) ],
+                    stdout=output_file,
+                    stderr=subprocess.STDOUT,
+                    env=environment
+                    )
+            processes.append( (process, output_path) )
+
+        errors = []
+        for process, output_path in processes:
+            exit_code = process.wait()
+            with open(output_path, 'r', encoding='utf8', errors='replace') as output_file:
+                for line in output_file:
+                    kind, value = read_report(line.strip())
+                    if kind == 'EXPORTED':
+                        set_export_metadata(value, publish_info)
+                    elif kind == 'ERROR':
+                        errors.append(value)
+                    elif kind is None and value != '':
+                        ram.log(value, ram.LogLevel.Debug)
+            if exit_code != 0:
+                errors.append("A format export worker exited with code " + str(exit_code))
+    finally:
+        # If something went wrong, don't leave workers behind
+        for process, output_path in processes:
+            if process.poll() is None:
+                process.kill()
+        os.remove(job_path)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if len(errors) > 0:
+        raise RuntimeError("Can't export " + name + ":\n" + "\n".join(errors))
+
+def publish_in_background(snapshot_path, nodes, publish_options, publish_info, workers=0, node_hashes=None):
+    """Publishes the nodes from the snapshot scene with mayapy worker processes.
+    Returns immediately: the progress is shown while the artist keeps working.
+    node_hashes are the hashes of the nodes by file path, stored in the metadata of the published files."""
+    if len(nodes) == 0:
+        return None
+    publisher = BackgroundPublisher(snapshot_path, nodes, publish_options, publish_info, workers, node_hashes)
+    RUNNING_PUBLISHERS.append(publisher)
+    publisher.finished.connect( lambda success: RUNNING_PUBLISHERS.remove(publisher) )
+    publisher.start()
+    return publisher
+
+class BackgroundPublisher( qc.QObject ):
+    """Runs the mayapy workers and follows their progress.
+    The workers don't write the metadata of the published files,
+    they report them and the metadata is set here, one file at a time."""
+
+    finished = qc.Signal(bool)
+
+    def __init__(self, snapshot_path, nodes, publish_options, publish_info, workers=0, node_hashes=None, parent=None):
+        super(BackgroundPublisher, self).__init__(parent)
+        self.__publish_info = publish_info
+        self.__node_hashes = node_hashes
+        self.__nodes = nodes
+        self.__job_path = write_publish_job(snapshot_path, nodes, publish_options, publish_info)
+
+        if workers <= 0:
+            workers = PUBLISH_WORKERS
+        self.__worker_count = min(workers, len(nodes))
+
+        self.__processes = []
+        self.__buffers = {}
+        self.__errors = []
+        self.__progress_dialog = None
+        self.__started = False
+
+    def start(self):
+        """Launches the workers"""
+        ram.log("Publishing " + str(len(self.__nodes)) + " nodes in the background with " + str(self.__worker_count) + " worker(s).", ram.LogLevel.Info)
+
+        self.__progress_dialog = maf.ProgressDialog()
+        self.__progress_dialog.setWindowTitle("Ramses is publishing in the background...")
+        self.__progress_dialog.setMaximum(len(self.__nodes))
+        self.__progress_dialog.setText("Publishing")
+        self.__progress_dialog.show()
+
+        environment = qc.QProcessEnvironment.systemEnvironment()
+        python_path = environment.value('PYTHONPATH', '')
+        if python_path != '':
+            python_path = os.pathsep + python_path
+        environment.insert('PYTHONPATH', PLUGIN_PATH + python_path)
+
+        worker_script = os.path.join(MODULE_PATH, 'publish_worker.py')
+        for i in range(self.__worker_count):
+            process = qc.QProcess(self)
+            process.setProcessEnvironment(environment)
+            process.setProcessChannelMode(qc.QProcess.MergedChannels)
+            process.readyReadStandardOutput.connect( lambda p=process: self.__read_output(p) )
+            process.finished.connect( lambda code, status, p=process: self.__process_finished(p, code) )
+            process.errorOccurred.connect( lambda error, p=process: self.__process_error(p, error) )
+            self.__processes.append(process)
+            self.__buffers[process] = ''
+            process.start(get_mayapy_path(), [
+                worker_script,
+                self.__job_path,
+                str(i),
+                str(self.__worker_count),
+                ])
+        self.__started = True
+        # Some of them may have failed to start already
+        self.__check_finished()
+
+    def __read_output(self, process):
+        data = bytes(process.readAllStandardOutput()).decode('utf8', errors='replace')
+        data = self.__buffers[process] + data
+        lines = data.split('\n')
+        # Keep the last, incomplete line
+        self.__buffers[process] = lines.pop()
+        for line in lines:
+            self.__read_line(line.strip())
+
+    def __read_line(self, line):
+        kind, value = read_report(line)
+
+        if kind is None:
+            if value != '':
+                ram.log(value, ram.LogLevel.Debug)
+        elif kind == 'START':
+            ram.log("Publishing " + value + "...")
+            self.__progress_dialog.setText("Publishing " + value)
+        elif kind == 'EXPORTED':
+            # Not deferred: a publish may be running in this session at the same time
+            write_export_metadata(value, self.__publish_info, self.__node_hashes)
+        elif kind == 'DONE':
+            self.__progress_dialog.increment()
+        elif kind == 'ERROR':
+            self.__errors.append(value)
+            ram.log("Publish error: " + value, ram.LogLevel.Critical)
+            self.__progress_dialog.increment()
+
+    def __process_finished(self, process, exit_code):
+        # Read what's left
+        self.__read_output(process)
+        if self.__buffers[process] != '':
+            self.__read_line(self.__buffers[process].strip())
+            self.__buffers[process] = ''
+        if exit_code != 0:
+            self.__errors.append("A publish worker exited with code " + str(exit_code))
+            ram.log("A publish worker exited with code " + str(exit_code), ram.LogLevel.Critical)
+
+        self.__check_finished()
+
+    def __process_error(self, process, error):
+        # Other errors also emit finished
+        if error != qc.QProcess.FailedToStart:
+            return
+        message = "Can't start the publish worker: " + process.program() + " (" + process.errorString() + ")"
+        self.__errors.append(message)
+        ram.log(message, ram.LogLevel.Critical)
+        self.__check_finished()
+
+    def __check_finished(self):
+        if not self.__started or self.__progress_dialog is None:
+            return
+        for p in self.__processes:
+            if p.state() != qc.QProcess.NotRunning:
+                return
+
+        # All done!
+        self.__progress_dialog.close()
+        self.__progress_dialog = None
+        if os.path.isfile(self.__job_path):
+            os.remove(self.__job_path)
+
+        success = len(self.__errors) == 0
+        if success:
+            ram.log("Successful background publish, Yay!", ram.LogLevel.Info)
+            cmds.inViewMessage( msg='Background publish <hl>finished</hl>', pos='midCenterBot', fade=True )
+        else:
+            cmds.inViewMessage( msg='Background publish finished with <hl>errors</hl>, see the script editor', pos='midCenterBot', fade=True )
+        self.finished.emit(success)
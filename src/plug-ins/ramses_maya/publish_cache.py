@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""Fingerprints of the published data, to avoid publishing the same thing again"""
+
+import os
+import re
+import shutil
+import hashlib
+import yaml
+import ramses as ram
+import dumaf as maf
+from maya import cmds # pylint: disable=import-error
+import maya.api.OpenMaya as om # pylint: disable=import-error
+import maya.api.OpenMayaAnim as oma # pylint: disable=import-error
+from .constants import VERSION
+
+# The metadata key of the backup fingerprint
+BACKUP_FINGERPRINT_KEY = 'backupFingerprint'
+# The metadata key of the hash of the published node
+NODE_HASH_KEY = 'nodeHash'
+
+# The size of the chunks read to hash the files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# The publish options which change how the files are exported, but not their content
+NON_CONTENT_OPTIONS = ('format_workers', 'single_job')
+
+# The version number in the name of a published version folder: [resource_]version[_state]
+RE_VERSION_FOLDER = re.compile('(?:^|_)(\\d+)(?:_[^_]+)?$')
+
+def hash_file( file_path, digest ):
+    """Updates the digest with the content of the file"""
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+
+def get_content_options( options ):
+    """Copies the options, without the ones which don't change the published data"""
+    if isinstance(options, dict):
+        return {
+            key: get_content_options(value) for key, value in options.items()
+            if key not in NON_CONTENT_OPTIONS
+            }
+    if isinstance(options, list):
+        return [ get_content_options(value) for value in options ]
+    return options
+
+def hash_options( options, digest ):
+    """Updates the digest with the options which change the published data,
+    whatever the order of their keys"""
+    digest.update( yaml.safe_dump(get_content_options(options), sort_keys=True).encode('utf8') )
+
+def hash_attributes( node, digest ):
+    """Updates the digest with the values of the settable scalar attributes of the node"""
+    attributes = cmds.listAttr( node, settable=True, scalar=True )
+    if not attributes:
+        return
+    for attribute in attributes:
+        try:
+            value = cmds.getAttr( node + '.' + attribute )
+        except (RuntimeError, ValueError):
+            continue
+        digest.update( attribute.encode('utf8') )
+        digest.update( str(value).encode('utf8') )
+
+def hash_anim_curve( fn_curve, digest ):
+    """Updates the digest with the keys of the animation curve"""
+    unitless = fn_curve.isUnitlessInput
+    for i in range( fn_curve.numKeys ):
+        # Driven keys don't have a time input
+        if unitless:
+            key_input = fn_curve.unitlessInput(i)
+        else:
+            key_input = fn_curve.input(i).value
+        digest.update( str( (
+            key_input,
+            fn_curve.value(i),
+            fn_curve.inTangentType(i),
+            fn_curve.outTangentType(i)
+            ) ).encode('utf8') )
+
+def get_backup_fingerprint( source_path, publish_options ):
+    """Gets the fingerprint of the published backup of a scene:
+    a hash of the source file, the files it references, the publish options
+    and the versions of Maya and of the add-on.
+    Call it before changing anything in the scene."""
+    digest = hashlib.sha256()
+    digest.update( VERSION.encode('utf8') )
+    digest.update( cmds.about(version=True).encode('utf8') )
+    hash_options( publish_options, digest )
+    hash_file( source_path, digest )
+
+    # The references may have changed too
+    references = cmds.file(q=True, reference=True)
+    if references:
+        for reference in sorted(references):
+            reference_path = cmds.referenceQuery(reference, filename=True, withoutCopyNumber=True)
+            digest.update( reference_path.encode('utf8') )
+            if os.path.isfile(reference_path):
+                stat = os.stat(reference_path)
+                digest.update( str(stat.st_size).encode('utf8') )
+                digest.update( str(stat.st_mtime_ns).encode('utf8') )
+
+    return digest.hexdigest()
+
+def get_folder_version( folder_name ):
+    """Gets the version number from the name of a published version folder, or -1"""
+    match = RE_VERSION_FOLDER.search( folder_name )
+    if match is None:
+        return -1
+    return int( match.group(1) )
+
+def get_previous_publish_folders( publish_folder ):
+    """Lists the other published version folders next to this one, latest version first.
+    The folders without a version number are ignored."""
+    published_folder = os.path.dirname(publish_folder)
+    if not os.path.isdir(published_folder):
+        return []
+    folders = []
+    for folder_name in os.listdir(published_folder):
+        folder = os.path.join(published_folder, folder_name)
+        if folder == publish_folder or not os.path.isdir(folder):
+            continue
+        version = get_folder_version( folder_name )
+        if version < 0:
+            continue
+        folders.append( (version, folder) )
+    folders.sort(reverse=True)
+    return [ folder for _, folder in folders ]
+
+def find_previous_backup( backup_path, fingerprint ):
+    """Looks for a backup with the same fingerprint in the other published versions.
+    Returns its path or an empty string"""
+    file_name = os.path.basename(backup_path)
+    folders = get_previous_publish_folders( os.path.dirname(backup_path) )
+
+    for folder in folders:
+        previous_path = os.path.join(folder, file_name)
+        if not os.path.isfile(previous_path):
+            continue
+        if ram.RamMetaDataManager.getValue( previous_path, BACKUP_FINGERPRINT_KEY ) == fingerprint:
+            return previous_path
+    return ''
+
+def reuse_published_file( previous_path, file_path ):
+    """Hard-links (or copies if it's not possible) a previously published file.
+    Returns the size of the reused file, in bytes"""
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        os.link(previous_path, file_path)
+    except OSError:
+        # Not on the same file system, or not supported
+        shutil.copyfile(previous_path, file_path)
+    return os.path.getsize(file_path)
+
+def find_unchanged_files( file_paths, node_hash ):
+    """Checks if all these files were published from a node with the same hash
+    in the latest published version.
+    Returns the paths of the previous files (in the same order), or an empty list"""
+    if len(file_paths) == 0 or node_hash == '':
+        return []
+    folders = get_previous_publish_folders( os.path.dirname(file_paths[0]) )
+    if len(folders) == 0:
+        return []
+
+    previous_paths = []
+    for file_path in file_paths:
+        previous_path = os.path.join(folders[0], os.path.basename(file_path))
+        if not os.path.isfile(previous_path):
+            return []
+        if ram.RamMetaDataManager.getValue( previous_path, NODE_HASH_KEY ) != node_hash:
+            return []
+        previous_paths.append(previous_path)
+    return previous_paths
+
+class NodeHasher():
+    """Computes the hash of the content of the published nodes:
+    hierarchy, transforms (and the world matrix of the parent), geometry, shading,
+    animation, extra attributes, and the playback range used by the Alembic export.
+    The upstream history of the nodes and of their parents (rigs, constraints, deformers
+    and their animation) is hashed too, as it changes the exported data.
+    The shading networks and the history are hashed once per hasher,
+    use the same one for all the nodes of a publish."""
+
+    def __init__(self, publish_options):
+        options_digest = hashlib.sha256()
+        options_digest.update( VERSION.encode('utf8') )
+        hash_options( publish_options, options_digest )
+        # The Alembic frame range comes from the playback range
+        options_digest.update( str( (
+            cmds.playbackOptions(q=True, ast=True),
+            cmds.playbackOptions(q=True, aet=True)
+            ) ).encode('utf8') )
+        self.__options_hash = options_digest.digest()
+        self.__shading_hashes = {}
+        self.__history_hashes = {}
+
+    def hash(self, node, name):
+        """Gets the hash of the node published with this name, as an hex string.
+        Call it on the cleaned scene, before changing the node."""
+        root_path = maf.dag.get_dag_path( node )
+        if root_path is None:
+            return ''
+
+        digest = hashlib.sha256()
+        digest.update( self.__options_hash )
+        digest.update( name.encode('utf8') )
+        # The world space data depends on the parents too
+        digest.update( str( root_path.exclusiveMatrix() ).encode('utf8') )
+
+        # Paths relative to the parent of the root
+        root_name = root_path.fullPathName()
+        prefix_length = len( root_name.rsplit('|', 1)[0] )
+
+        node_paths = []
+        for record in maf.dag.walk( root_path, include_root=True ):
+            node_paths.append( record.full_path() )
+            digest.update( record.full_path()[prefix_length:].encode('utf8') )
+            digest.update( record.node_type().encode('utf8') )
+            self.__hash_dependency_node( record.path, digest )
+            if record.is_transform():
+                matrix = om.MFnTransform( record.path ).transformation().asMatrix()
+                digest.update( str(matrix).encode('utf8') )
+            else:
+                self.__hash_shape( record.path, digest )
+
+        # The parents, rigs, constraints and deformers outside of the node change it too
+        parent_paths = []
+        parent_path = root_name.rsplit('|', 1)[0]
+        while parent_path != '':
+            parent_paths.append( parent_path )
+            parent_path = parent_path.rsplit('|', 1)[0]
+        self.__hash_history( node_paths, parent_paths, digest )
+
+        return digest.hexdigest()
+
+    def __hash_history(self, node_paths, parent_paths, digest):
+        # All the upstream nodes which are not part of the published node
+        history = cmds.listHistory( node_paths + parent_paths )
+        if not history:
+            return
+        published_paths = set( node_paths )
+        for node in sorted( set( cmds.ls( history, long=True ) ) ):
+            if node in published_paths:
+                continue
+            digest.update( self.__history_hash( node ) )
+
+    def __history_hash(self, node):
+        # The name, type and values of an upstream node, with its keys or its geometry
+        if node in self.__history_hashes:
+            return self.__history_hashes[node]
+
+        digest = hashlib.sha256()
+        digest.update( node.encode('utf8') )
+        digest.update( cmds.nodeType(node).encode('utf8') )
+
+        selection = om.MSelectionList()
+        selection.add( node )
+        node_object = selection.getDependNode(0)
+        if node_object.hasFn( om.MFn.kAnimCurve ):
+            hash_anim_curve( oma.MFnAnimCurve( node_object ), digest )
+        else:
+            hash_attributes( node, digest )
+            if node_object.hasFn( om.MFn.kExpression ):
+                digest.update( str( cmds.getAttr( node + '.expression' ) ).encode('utf8') )
+            elif node_object.hasFn( om.MFn.kShape ):
+                self.__hash_shape( selection.getDagPath(0), digest )
+
+        self.__history_hashes[node] = digest.digest()
+        return self.__history_hashes[node]
+
+    def __hash_dependency_node(self, dag_path, digest):
+        # Visibility, animation and extra attributes
+        fn_node = om.MFnDependencyNode( dag_path.node() )
+        if fn_node.hasAttribute( 'visibility' ):
+            digest.update( str(fn_node.findPlug( 'visibility', False ).asBool()).encode('utf8') )
+
+        if oma.MAnimUtil.isAnimated( dag_path ):
+            for curve in oma.MAnimUtil.findAnimation( dag_path ):
+                hash_anim_curve( oma.MFnAnimCurve( curve ), digest )
+
+        node_path = dag_path.fullPathName()
+        for i in range( fn_node.attributeCount() ):
+            attribute = fn_node.attribute(i)
+            fn_attribute = om.MFnAttribute( attribute )
+            if not fn_attribute.dynamic or not fn_attribute.parent.isNull():
+                continue
+            digest.update( fn_attribute.name.encode('utf8') )
+            try:
+                value = cmds.getAttr( node_path + '.' + fn_attribute.name )
+            except (RuntimeError, ValueError):
+                # Message attributes, for example
+                continue
+            digest.update( str(value).encode('utf8') )
+
+    def __hash_shape(self, dag_path, digest):
+        node = dag_path.node()
+        if node.hasFn( om.MFn.kMesh ):
+            fn_mesh = om.MFnMesh( dag_path )
+            digest.update( str( fn_mesh.getPoints( om.MSpace.kObject ) ).encode('utf8') )
+            counts, connects = fn_mesh.getVertices()
+            digest.update( str(counts).encode('utf8') )
+            digest.update( str(connects).encode('utf8') )
+            for uv_set in fn_mesh.getUVSetNames():
+                digest.update( uv_set.encode('utf8') )
+                digest.update( str( fn_mesh.getUVs(uv_set) ).encode('utf8') )
+            shading_engines, face_shaders = fn_mesh.getConnectedShaders( dag_path.instanceNumber() )
+            for shading_engine in shading_engines:
+                digest.update( self.__shading_hash( shading_engine ) )
+            # The index of the shading engine of each face
+            digest.update( str( face_shaders ).encode('utf8') )
+        elif node.hasFn( om.MFn.kNurbsCurve ):
+            fn_curve = om.MFnNurbsCurve( dag_path )
+            digest.update( str( fn_curve.cvPositions( om.MSpace.kObject ) ).encode('utf8') )
+        elif node.hasFn( om.MFn.kNurbsSurface ):
+            fn_surface = om.MFnNurbsSurface( dag_path )
+            digest.update( str( fn_surface.cvPositions( om.MSpace.kObject ) ).encode('utf8') )
+
+    def __shading_hash(self, shading_engine):
+        # The name, types and values of the whole network
+        engine_name = om.MFnDependencyNode( shading_engine ).name()
+        if engine_name in self.__shading_hashes:
+            return self.__shading_hashes[engine_name]
+
+        digest = hashlib.sha256()
+        digest.update( engine_name.encode('utf8') )
+        history = cmds.listHistory( engine_name )
+        if history:
+            for node in sorted(history):
+                digest.update( node.encode('utf8') )
+                digest.update( cmds.nodeType(node).encode('utf8') )
+                hash_attributes( node, digest )
+
+        self.__shading_hashes[engine_name] = digest.digest()
+        return self.__shading_hashes[engine_name]
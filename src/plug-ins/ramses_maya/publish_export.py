@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""Cleans and exports the published nodes.
+This module is used by the mayapy publish workers too:
+it must not import the UI nor anything which initializes the add-on."""
+
+import ramses as ram
+import dumaf as maf
+from maya import cmds # pylint: disable=import-error
+from .utils_attributes import (
+    RamsesAttribute,
+    set_ramses_managed,
+    get_ramses_attr,
+    set_ramses_attr
+)
+from .publish_cache import NODE_HASH_KEY
+from .utils_options import (
+    get_option
+)
+
+def get_publish_file_path(publish_info, extension, name):
+    """Gets the path for publishing the file"""
+    scene_info = publish_info.copy()
+    scene_info.version = -1
+    scene_info.state = ''
+    scene_info.extension = extension
+    if scene_info.resource != '':
+        scene_info.resource = scene_info.resource + '-'
+    scene_info.resource = scene_info.resource + name
+
+    return scene_info.filePath()
+
+# When set to a list, the exported files are added to it
+# instead of setting their metadata right away (see defer_export_metadata)
+_DEFERRED_METADATA = None
+
+def defer_export_metadata( exported_files ):
+    """Adds the paths of the exported files to the given list instead of setting their metadata.
+    Used by the background workers: the metadata is set by the main session, one file at a time,
+    and by the publisher to add the node hashes of the publish.
+    Set to None to set the metadata again. Returns the previous list."""
+    global _DEFERRED_METADATA # pylint: disable=global-statement
+    previous = _DEFERRED_METADATA
+    _DEFERRED_METADATA = exported_files
+    return previous
+
+def set_export_metadata( filepath, publish_info, node_hashes=None ):
+    """Sets the metadata for the published file, unless it's deferred (see defer_export_metadata).
+    node_hashes is a dict of the hashes of the published nodes by file path (see skip_unchanged_nodes)"""
+    if _DEFERRED_METADATA is not None:
+        _DEFERRED_METADATA.append( filepath )
+        return
+    write_export_metadata( filepath, publish_info, node_hashes )
+
+def write_export_metadata( filepath, publish_info, node_hashes=None ):
+    """Sets the metadata for the published file right away, even while it's deferred.
+    Used for the files published in the background, which don't belong to the publish running in this session."""
+    if node_hashes is not None and filepath in node_hashes:
+        ram.RamMetaDataManager.setValue( filepath, NODE_HASH_KEY, node_hashes[filepath] )
+    #pipeType = pipeType.split('-')[-1]
+    #☺ram.RamMetaDataManager.setPipeType( filePath, pipeType )
+    ram.RamMetaDataManager.setVersion( filepath, publish_info.version )
+    ram.RamMetaDataManager.setState( filepath, publish_info.state )
+    ram.RamMetaDataManager.setResource( filepath, publish_info.resource )
+
+def get_format_file_path( frmt, publish_info, name ):
+    """Gets the path of the file published for one of the formats of the publish options"""
+    kind, _, extension = parse_format(frmt)
+    if kind == 'maya_shaders':
+        return get_publish_file_path( publish_info, extension, name + "_shaders-shaders" )
+    return get_publish_file_path( publish_info, extension, name )
+
+def prepare_publish_node( node, publish_options ):
+    """Cleans the node before exporting it, according to the publish options.
+    Returns the (dumaf) Node"""
+    node = maf.Node(node)
+
+    ram.log("  processing: " + node.path())
+
+    # Move to center of the scene
+    node.move_to_zero()
+
+    # Remove hidden
+    if get_option("remove_hidden_nodes", publish_options, True):
+        node.remove_hidden_children()
+
+    # Types
+    if "types" in publish_options:
+        types_options = publish_options["types"]
+        if "list" in types_options:
+            types_list = types_options["list"]
+            if len(types_list) > 0:
+                if get_option("mode", types_options, "remove") == "remove":
+                    node.remove_types(types_list)
+                else:
+                    node.keep_types(types_list)
+
+    # Extra shapes
+    if get_option("remove_extra_shapes", publish_options, False):
+        node.remove_extra_shapes()
+
+    # Delete history
+    if get_option("delete_history", publish_options, False):
+        node.delete_history()
+
+    # Remove empty
+    if get_option("remove_empty_groups", publish_options, False):
+        node.remove_empty()
+
+    # Freeze transform
+    if "freeze_transform" in publish_options:
+        case_sensitive = get_option("case_sensitive", publish_options["freeze_transform"], False)
+        whitelist = get_option("whitelist", publish_options["freeze_transform"], ())
+        maf.dag.freeze_transform(node, whitelist, case_sensitive)
+
+    return node
+
+def parse_format( frmt ):
+    """Detects the format of an item of the "formats" publish option.
+    Returns a tuple (kind, options, extension), kind being one of
+    'maya_scene', 'maya_shaders', 'abc', 'ass', 'obj' or None if it's unknown"""
+    if frmt == "ma" or frmt == "mb":
+        return ('maya_scene', frmt, frmt)
+    if "ma" in frmt or "mb" in frmt:
+        extension = "mb"
+        if "ma" in frmt:
+            extension = "ma"
+        frmt = frmt[extension]
+        if get_option("only_shaders", frmt, False):
+            return ('maya_shaders', frmt, extension)
+        return ('maya_scene', frmt, extension)
+    if frmt == "abc":
+        return ('abc', frmt, 'abc')
+    if "abc" in frmt:
+        return ('abc', frmt["abc"], 'abc')
+    if frmt == "ass" or "ass" in frmt:
+        return ('ass', frmt, 'ass')
+    if frmt == "obj":
+        return ('obj', frmt, 'obj')
+    if "obj" in frmt:
+        return ('obj', frmt["obj"], 'obj')
+    return (None, frmt, '')
+
+def is_single_alembic_job( frmt ):
+    """Checks if this format is an Alembic export to be run in a single job with the other nodes"""
+    kind, options, _ = parse_format(frmt)
+    return kind == 'abc' and get_option("single_job", options, False)
+
+def export_format(node, frmt, publish_info, name):
+    """Exports the node to one of the formats of the publish options"""
+    kind, options, extension = parse_format(frmt)
+
+    if kind == 'maya_scene':
+        publish_maya_scene(node, options, extension, publish_info, name)
+    elif kind == 'maya_shaders':
+        publish_maya_shaders(node, options, extension, publish_info, name + "_shaders")
+    elif kind == 'abc':
+        publish_alembic(node, options, publish_info, name)
+    elif kind == 'ass':
+        publish_ass(node, options, publish_info, name)
+    elif kind == 'obj':
+        publish_obj(node, options, publish_info, name)
+
+def take_alembic_jobs(node, formats, publish_info, name, alembic_jobs=None):
+    """If alembic_jobs is a list, the Alembic exports set to be run in a single job
+    are added to it (see export_alembic_jobs). Returns the other formats"""
+    if alembic_jobs is None:
+        return formats
+    for frmt in formats:
+        if is_single_alembic_job(frmt):
+            alembic_jobs.append( get_alembic_job(node, parse_format(frmt)[1], publish_info, name) )
+    return [ frmt for frmt in formats if not is_single_alembic_job(frmt) ]
+
+def export_formats(node, formats, publish_info, name, alembic_jobs=None):
+    """Exports the (cleaned) node to all the formats, one after the other.
+    If alembic_jobs is a list, the Alembic exports set to be run in a single job are added to it"""
+    for frmt in take_alembic_jobs(node, formats, publish_info, name, alembic_jobs):
+        export_format(node, frmt, publish_info, name)
+
+def publish_maya_scene(node, options, extension, publish_info, name):
+    """Publishes the node as a maya scene"""
+    # manage joints
+    joints_mode = get_option("joints", options, "disable")
+    if joints_mode in ("disable", "lock", "hide"):
+        joints = cmds.ls(type='joint')
+        if joints is not None:
+            for joint in joints:
+                if joints_mode in ("hide", "lock"):
+                    cmds.setAttr( joint + '.visibility', False )
+                    if joints_mode == "lock":
+                        cmds.setAttr(joint + '.visibility', lock=True)
+                else:
+                    cmds.setAttr( joint + '.drawStyle', 2 )
+
+    # Lock hidden
+    if get_option("lock_hidden_nodes", options, True):
+        node.lock_visibility(True, lock_children=True, only_hidden=True)
+
+    if get_option("lock_transformations", options, True):
+        node.lock_transform(True, lock_children=True)
+
+    # Get path and save
+    file_path = get_publish_file_path( publish_info, extension, name )
+    cmds.select(clear=True)
+    node.select()
+    maya_type = 'mayaBinary'
+    if extension == 'ma':
+        maya_type = 'mayaAscii'
+    cmds.file( rename=file_path )
+    cmds.file( exportSelected=True, options="v=1;", typ=maya_type)
+    set_export_metadata( file_path, publish_info)
+
+def publish_maya_shaders(node, options, extension, publish_info, name):
+    """Publishes the shaders as a maya file"""
+
+    # If there's no mesh, nothing to do
+    meshes = node.meshes()
+    if len(meshes) == 0:
+        return
+
+    # Prepare the data info we're exporting
+    all_shading_engines = []
+
+    # Get shading info
+    for mesh in meshes:
+        node_history = cmds.listHistory( mesh, f=True )
+        node_shading_engines = cmds.listConnections( node_history, type='shadingEngine')
+
+        # Get the name from parent (transform node for this mesh)
+        object_name = cmds.listRelatives(mesh, p=True)[0]
+        # Remove namespace if any
+        object_name = object_name.split(':')[-1]
+
+        if node_shading_engines is not None:
+            for shading_engine in node_shading_engines:
+                # Get the first surface shader to rename the engine
+                try:
+                    surface_shaders = cmds.listConnections(shading_engine + '.surfaceShader')
+                    if surface_shaders:
+                        surface_shader = surface_shaders[0]
+                        surface_shader_name = surface_shader.split(':')[-1]
+                        # Rename
+                        if shading_engine != 'initialShadingGroup':
+                            shading_engine = cmds.rename( shading_engine, surface_shader_name + "_Engine")
+
+                        # List the objects this engine is shading
+                        set_ramses_managed( shading_engine )
+                        object_names = get_ramses_attr( shading_engine, RamsesAttribute.SHADED_OBJECTS )
+                        if object_names is None:
+                            object_names = ''
+                        else:
+                            object_names = object_names + ','
+                        object_names = object_names + object_name
+                        set_ramses_attr( shading_engine, RamsesAttribute.SHADED_OBJECTS, object_names, 'string')
+                except: # pylint: disable=bare-except
+                    pass
+
+                if not shading_engine in all_shading_engines:
+                    all_shading_engines.append(shading_engine)
+
+    if len(all_shading_engines) == 0:
+        ram.log("Sorry, I did not find any shader to publish...", ram.LogLevel.Info)
+        return
+
+    # Select and export shadingEngines
+    # Get path and save
+    file_path = get_publish_file_path( publish_info, extension, name + "-shaders" )
+
+    cmds.select(clear=True)
+    spheres = []
+    offset = 0
+    for shading_engine in all_shading_engines:
+        if not cmds.objExists(shading_engine):
+            continue
+        try:
+            # create a sphere per shader and export that
+            sphere = cmds.polySphere(name=shading_engine.replace("_Engine","") + "_shader", constructionHistory=False)[0]
+            # Assign shader
+            cmds.sets(sphere, e=True, forceElement=shading_engine)
+        except RuntimeError:
+            # Can't assign the shader to the sphere
+            ram.log("I Can't publish this shader, for some reason it can't be assigned to our 'sphere shader' mesh: " + shading_engine, ram.LogLevel.Critical)
+            continue
+        # Move on the X axis
+        cmds.setAttr(sphere + ".translateX", offset)
+        offset = offset + 2
+        spheres.append(sphere)
+
+    # Nothing to publish
+    if len(spheres) == 0:
+        ram.log("I can't find any shader to publish, sorry! Skipping shaders...")
+        return
+    root_group = cmds.group(spheres, name=name)
+    cmds.select(root_group)
+
+    maya_type = 'mayaBinary'
+    if extension == 'ma':
+        maya_type = 'mayaAscii'
+
+    cmds.file( rename=file_path )
+    cmds.file( exportSelected=True, options="v=1;", typ=maya_type)
+    set_export_metadata( file_path, publish_info)
+
+def publish_alembic(node, options, publish_info, name):
+    """Publishes the node as alembic"""
+    export_alembic_jobs( [ get_alembic_job(node, options, publish_info, name) ], publish_info )
+
+def export_alembic_jobs(jobs, publish_info):
+    """Runs the Alembic jobs (tuples (job string, file path)) with a single AbcExport,
+    so the timeline is evaluated only once for all of them"""
+    # We need ABC Export, of course
+    maf.Plugin.load("AbcExport")
+
+    if len(jobs) > 1:
+        ram.log("Exporting " + str(len(jobs)) + " Alembic files at once.", ram.LogLevel.Info)
+
+    # Export
+    cmds.AbcExport(j=[ job[0] for job in jobs ])
+    # Meta data
+    for job in jobs:
+        set_export_metadata( job[1], publish_info)
+
+def get_alembic_job(node, options, publish_info, name):
+    """Gets the AbcExport job string to publish the node.
+    Returns a tuple (job string, file path)"""
+    file_path = get_publish_file_path( publish_info, 'abc', name )
+
+    # Collect options
+    in_frame = 1
+    out_frame = 1
+    frame_step = 1.0
+    if "animation" in options:
+        in_frame = int(cmds.playbackOptions(q=True,ast=True))
+        out_frame = int(cmds.playbackOptions(q=True,aet=True))
+        handle_in = get_option("handle_in", options["animation"], 0)
+        handle_out = get_option("handle_out", options["animation"], 0)
+        in_frame = in_frame - handle_in
+        out_frame = out_frame - handle_out
+        frame_step = get_option("frame_step", options["animation"], 1.0)
+
+    filter_euler = ''
+    if get_option("filter_euler_rotations", options, True):
+        filter_euler = '-eulerFilter'
+
+    renderable = ''
+    if get_option("renderable_only", options, True):
+        renderable = '-renderableOnly'
+
+    worldSpace = ''
+    if get_option("world_space", options, True):
+        worldSpace = '-worldSpace'
+
+    attributes = set()
+    if get_option("add_extra_attributes", options, False):
+        # List all the extra attributes on all the nodes
+        attributes = maf.attributes.get_all_extra(node.path(), recursive=True)
+
+    attributes.update( get_option(
+        "attributes",
+        options,
+        set())
+        )
+
+    attrs_prefix = set(get_option(
+        "attributes_prefix",
+        options,
+        set())
+        )
+
+    abc_options = []
+    for attr in attributes:
+        attr = attr.strip()
+        if attr == '':
+            continue
+        abc_options.append("-attr")
+        abc_options.append(attr)
+
+    for pref in attrs_prefix:
+        pref = pref.strip()
+        if pref == '':
+            continue
+        abc_options.append("-attrPrefix ")
+        abc_options.append(pref)
+
+    abc_options = abc_options + [
+        '-frameRange', str(in_frame), str(out_frame),
+        filter_euler,
+        worldSpace,
+        '-step', str(frame_step),
+        '-autoSubd', # crease
+        '-uvWrite',
+        '-writeUVSets',
+        '-writeVisibility',
+        '-dataFormat hdf',
+        renderable,
+        '-root', node.path(),
+        '-file', '"' + file_path + '"',
+    ]
+
+    abc_options_str = ' '.join( abc_options )
+
+    ram.log("These are the alembic options:\n" + abc_options_str, ram.LogLevel.Info)
+
+    return (abc_options_str, file_path)
+
+def publish_ass(node, options, publish_info, name):
+    """Publishes the node as an arnold scene source"""
+    # We need Arnold, of course
+    maf.Plugin.load('mtoa')
+
+    node.select()
+    file_path = get_publish_file_path( publish_info, 'ass', name )
+
+    cmds.arnoldExportAss(f=file_path, s=True, mask=223, lightLinks=0, shadowLinks=0, cam="perspShape" )
+    set_export_metadata( file_path, publish_info)
+
+def publish_obj(node, options, publish_info, name):
+    """Publishes the node as obj"""
+    # We need OBJ Export, of course
+    maf.Plugin.load("objExport")
+
+    file_path = get_publish_file_path( publish_info, 'obj', name )
+
+    # Collect options
+    mtl = "1"
+    if "materials" in options:
+        mtl = get_option("materials", options, True)
+        if mtl:
+            mtl = "1"
+        else:
+            mtl = "0"
+
+    obj_options = ';'.join([
+        "groups=1",
+        "ptgroups=1",
+        "materials=" + mtl,
+        "smoothing=1",
+        "normals=1",
+    ])
+
+    ram.log("These are the obj options:\n" + obj_options, ram.LogLevel.Info)
+
+    #Export
+    cmds.select(clear=True)
+    node.select()
+
+    cmds.file(file_path, force=True, options=obj_options, typ="OBJexport", preserveReferences=True, exportSelected=True)
+    # Meta data
+    set_export_metadata( file_path, publish_info)
@@ -13,38 +13,33 @@ from .utils_nodes import (
     delete_ramses_sets
 )
 from .utils import end_process
-from .utils_attributes import (
-    RamsesAttribute,
-    set_ramses_managed,
-    get_ramses_attr,
-    set_ramses_attr
+from .publish_background import publish_in_background, export_formats_in_parallel
+from .publish_export import (
+    defer_export_metadata,
+    set_export_metadata,
+    get_format_file_path,
+    prepare_publish_node,
+    take_alembic_jobs,
+    export_formats,
+    export_alembic_jobs
+)
+from .publish_cache import (
+    BACKUP_FINGERPRINT_KEY,
+    get_backup_fingerprint,
+    NodeHasher,
+    find_previous_backup,
+    find_unchanged_files,
+    reuse_published_file
 )
 from .utils_options import (
     get_option
 )
 
-def get_publish_file_path(publish_info, extension, name):
-    """Gets the path for publishing the file"""
-    scene_info = publish_info.copy()
-    scene_info.version = -1
-    scene_info.state = ''
-    scene_info.extension = extension
-    if scene_info.resource != '':
-        scene_info.resource = scene_info.resource + '-'
-    scene_info.resource = scene_info.resource + name
-
-    return scene_info.filePath()
-
-def set_export_metadata( filepath, publish_info ):
-    """Sets the metadata for the published file"""
-    #pipeType = pipeType.split('-')[-1]
-    #☺ram.RamMetaDataManager.setPipeType( filePath, pipeType )
-    ram.RamMetaDataManager.setVersion( filepath, publish_info.version )
-    ram.RamMetaDataManager.setState( filepath, publish_info.state )
-    ram.RamMetaDataManager.setResource( filepath, publish_info.resource )
-
-def publisher(file_path, item, step, publish_options=None, show_publish_options=False):
-    """The publish entry point"""
+def publisher(file_path, item, step, publish_options=None, show_publish_options=False, background=False, workers=0, force=False):
+    """The publish entry point.
+    If background, the nodes are published by mayapy worker processes (see publish_background),
+    using at most workers processes (0 for the default number).
+    The nodes which did not change since the latest publish are not exported again, unless force is True."""
 
     # Get options
     publish_nodes = ()
@@ -90,23 +85,78 @@ def publisher(file_path, item, step, publish_options=None, show_publish_options=
     progress_dialog.show()
     progress_dialog.setText("Publishing...")
 
+    # The backup can be reused only if the scene is the same as the file
+    backup_fingerprint = ''
+    if not cmds.file(q=True, modified=True) and os.path.isfile(file_path):
+        backup_fingerprint = get_backup_fingerprint( file_path, publish_options )
+
     # Prepare the scene
     temp_data = maf.Scene.createTempScene()
+    progress_dialog.setText("Cleaning scene...")
+    snapshot_path = prepare_publish_scene( publish_options, publish_info, backup_fingerprint )
+
+    progress_dialog.setText("Checking changes...")
+    publish_nodes, node_hashes = skip_unchanged_nodes( publish_nodes, publish_options, publish_info, force )
+
+    if background:
+        # Keep the node paths before leaving this scene
+        nodes = [ (node[0].path(), node[1]) for node in reversed(publish_nodes) if node[0].exists() ]
+        end_process(temp_data, progress_dialog)
+        publish_in_background(snapshot_path, nodes, publish_options, publish_info, workers, node_hashes)
+        return
+
+    progress_dialog.setMaximum(len(publish_nodes) + 1)
+    progress_dialog.setText("Publishing nodes...")
+    progress_dialog.increment()
+
+    # The Alembic exports to run all at once
+    alembic_jobs = []
+
+    # The metadata is set after each export, with the hashes of this publish
+    exported_files = []
+    previous_exported_files = defer_export_metadata( exported_files )
+    try:
+        # Publish each node
+        for node in reversed(publish_nodes):
+            # node is a tuple (Node, node_name)
+            if not node[0].exists():
+                ram.log("Skipping node: '" + node[0].path() + "' (it seems it doesn't exist anymore?)")
+                continue
+            ram.log("Publishing " + node[1] + "...")
+            progress_dialog.setText("Publishing " + node[1] + "...")
+            progress_dialog.increment()
+            publish_node(node, publish_options, publish_info, alembic_jobs)
+
+        if len(alembic_jobs) > 0:
+            progress_dialog.setText("Exporting Alembic files...")
+            export_alembic_jobs(alembic_jobs, publish_info)
+    finally:
+        defer_export_metadata( previous_exported_files )
+        for exported_file in exported_files:
+            set_export_metadata( exported_file, publish_info, node_hashes )
+
+    end_process(temp_data, progress_dialog)
+    ram.log("Successful publish, Yay!")
+
+def prepare_publish_scene( publish_options, publish_info, backup_fingerprint='' ):
+    """Cleans the current (temporary) scene before publishing the nodes,
+    and saves it as a backup in the published folder.
+    If a previous backup has the same fingerprint, it is reused instead of saving the scene.
+    Returns the path of the backup file"""
 
     # Remove nodes to del on publish (if not in publish!)
     del_nodes = get_del_on_publish_nodes()
-    for node in del_nodes:
-        nodeSets = cmds.listSets(object=node)
-        if nodeSets:
-            if "Ramses_Publish" in nodeSets:
-                continue
-        node = maf.Node(node)
-        node.remove()
+    with maf.dag.DeleteBatch():
+        for node in del_nodes:
+            nodeSets = cmds.listSets(object=node)
+            if nodeSets:
+                if "Ramses_Publish" in nodeSets:
+                    continue
+            node = maf.Node(node)
+            node.remove()
 
     # Scene pre-processing
 
-    progress_dialog.setText("Cleaning scene...")
-
     # Import references
     if get_option("import_references", publish_options, True):
         maf.Reference.importAll()
@@ -127,384 +177,83 @@ def publisher(file_path, item, step, publish_options=None, show_publish_options=
     # Save
     published_filepath = backup_info.filePath()
     cmds.file( rename = published_filepath )
-    cmds.file( save=True, options="v=1;" )
+    previous_backup = ''
+    if backup_fingerprint != '':
+        previous_backup = find_previous_backup( published_filepath, backup_fingerprint )
+    if previous_backup != '':
+        saved_bytes = reuse_published_file( previous_backup, published_filepath )
+        ram.log(
+            "Nothing changed since the publish of " + previous_backup + ", I've reused its backup instead of saving the scene " +
+            "(" + str(round(saved_bytes / 1024 / 1024, 1)) + " MB not written again).",
+            ram.LogLevel.Info
+            )
+    else:
+        cmds.file( save=True, options="v=1;" )
+    if backup_fingerprint != '':
+        ram.RamMetaDataManager.setValue( published_filepath, BACKUP_FINGERPRINT_KEY, backup_fingerprint )
     ram.RamMetaDataManager.appendHistoryDate( published_filepath )
     ram.RamMetaDataManager.setVersion( published_filepath, publish_info.version )
 
-    progress_dialog.setMaximum(len(publish_nodes) + 1)
-    progress_dialog.setText("Publishing nodes...")
-    progress_dialog.increment()
+    return published_filepath
+
+def skip_unchanged_nodes( publish_nodes, publish_options, publish_info, force=False ):
+    """Computes the hash of the nodes, to be stored in the metadata of the published files.
+    Unless force is True, the nodes with the same hash as in the latest published version
+    are not exported again: the previous files are reused.
+    Returns the nodes which still have to be published,
+    and the hashes of all the nodes by published file path, for set_export_metadata."""
+    node_hashes = {}
+    hasher = NodeHasher( publish_options )
+    changed_nodes = []
+    reused_bytes = 0
 
-    # Publish each node
-    for node in reversed(publish_nodes):
-        # node is a tuple (Node, node_name)
+    for node in publish_nodes:
         if not node[0].exists():
-            ram.log("Skipping node: '" + node[0].path() + "' (it seems it doesn't exist anymore?)")
+            changed_nodes.append(node)
+            continue
+        node_hash = hasher.hash( node[0], node[1] )
+        file_paths = [ get_format_file_path(frmt, publish_info, node[1]) for frmt in publish_options["formats"] ]
+        for file_path in file_paths:
+            node_hashes[file_path] = node_hash
+
+        previous_paths = []
+        if not force:
+            previous_paths = find_unchanged_files( file_paths, node_hash )
+        if len(previous_paths) == 0:
+            changed_nodes.append(node)
             continue
-        ram.log("Publishing " + node[1] + "...")
-        progress_dialog.setText("Publishing " + node[1] + "...")
-        progress_dialog.increment()
-        publish_node(node, publish_options, publish_info)
-
-    end_process(temp_data, progress_dialog)
-    ram.log("Successful publish, Yay!")
 
-def publish_node( published_node, publish_options, publish_info ):
-    """Publishes a specific node"""
-    node = maf.Node(published_node[0])
-
-    ram.log("  processing: " + node.path())
-
-    # Move to center of the scene
-    node.move_to_zero()
-
-    # Remove hidden
-    if get_option("remove_hidden_nodes", publish_options, True):
-        node.remove_hidden_children()
-
-    # Types
-    if "types" in publish_options:
-        types_options = publish_options["types"]
-        if "list" in types_options:
-            types_list = types_options["list"]
-            if len(types_list) > 0:
-                if get_option("mode", types_options, "remove") == "remove":
-                    node.remove_types(types_list)
-                else:
-                    node.keep_types(types_list)
-
-    # Extra shapes
-    if get_option("remove_extra_shapes", publish_options, False):
-        node.remove_extra_shapes()
-
-    # Delete history
-    if get_option("delete_history", publish_options, False):
-        node.delete_history()
-
-    # Remove empty
-    if get_option("remove_empty_groups", publish_options, False):
-        node.remove_empty()
-
-    # Freeze transform
-    if "freeze_transform" in publish_options:
-        case_sensitive = get_option("case_sensitive", publish_options["freeze_transform"], False)
-        whitelist = get_option("whitelist", publish_options["freeze_transform"], ())
-        freeze = True
-        children = node.children(transform_only=True)
-        children.append(node)
-        for child in children:
-            child = maf.Node(child)
-            child_name = child.name()
-            for name in whitelist:
-                if case_sensitive:
-                    name = name.lower()
-                    child_name = child_name.lower()
-                if name in child_name:
-                    freeze = False
-                    break
-            if freeze:
-                child.freeze_transform()
+        ram.log("Skipping " + node[1] + ", it did not change since the latest publish.", ram.LogLevel.Info)
+        for previous_path, file_path in zip(previous_paths, file_paths):
+            reused_bytes = reused_bytes + reuse_published_file( previous_path, file_path )
+            set_export_metadata( file_path, publish_info, node_hashes )
+            # The OBJ materials
+            previous_mtl = os.path.splitext(previous_path)[0] + '.mtl'
+            if file_path.endswith('.obj') and os.path.isfile(previous_mtl):
+                reuse_published_file( previous_mtl, os.path.splitext(file_path)[0] + '.mtl' )
+
+    skipped_count = len(publish_nodes) - len(changed_nodes)
+    if skipped_count > 0:
+        ram.log(
+            "Reused the files of " + str(skipped_count) + " unchanged node(s) " +
+            "(" + str(round(reused_bytes / 1024 / 1024, 1)) + " MB).",
+            ram.LogLevel.Info
+            )
+    return changed_nodes, node_hashes
+
+def publish_node( published_node, publish_options, publish_info, alembic_jobs=None ):
+    """Publishes a specific node.
+    If alembic_jobs is a list, the Alembic exports set to be run in a single job
+    are added to it (see export_alembic_jobs) instead of being exported"""
+    name = published_node[1]
+    node = prepare_publish_node( published_node[0], publish_options )
 
     # And publish types!
-    for frmt in publish_options["formats"]:
-        # Detect format
-        maya_scene = False
-        maya_shaders = False
-        maya_extension = "mb"
-        alembic = False
-        ass = False
-        obj = False
-
-        if frmt == "ma" or frmt == "mb":
-            maya_scene = True
-            maya_extension = frmt
-        elif "ma" in frmt or "mb" in frmt:
-            if "ma" in frmt:
-                frmt = frmt["ma"]
-                maya_extension = "ma"
-            else:
-                frmt = frmt["mb"]
-                maya_extension = "mb"
-            maya_shaders = get_option("only_shaders", frmt, False)
-            maya_scene = not maya_shaders
-        elif frmt == "abc":
-            alembic = True
-        elif "abc" in frmt:
-            alembic = True
-            frmt = frmt["abc"]
-        elif frmt == "ass" or "ass" in frmt:
-            ass = True
-        elif frmt == "obj":
-            obj = True
-        elif "obj" in frmt:
-            obj = True
-            frmt = frmt["obj"]
-
-        if maya_scene:
-            publish_maya_scene(node, frmt, maya_extension, publish_info, published_node[1])
-        elif maya_shaders:
-            publish_maya_shaders(node, frmt, maya_extension, publish_info, published_node[1] + "_shaders")
-        elif alembic:
-            publish_alembic(node, frmt, publish_info, published_node[1])
-        elif ass:
-            publish_ass(node, frmt, publish_info, published_node[1])
-        elif obj:
-            publish_obj(node, frmt, publish_info, published_node[1])
-
-def publish_maya_scene(node, options, extension, publish_info, name):
-    """Publishes the node as a maya scene"""
-    # manage joints
-    joints_mode = get_option("joints", options, "disable")
-    if joints_mode in ("disable", "lock", "hide"):
-        joints = cmds.ls(type='joint')
-        if joints is not None:
-            for joint in joints:
-                if joints_mode in ("hide", "lock"):
-                    cmds.setAttr( joint + '.visibility', False )
-                    if joints_mode == "lock":
-                        cmds.setAttr(joint + '.visibility', lock=True)
-                else:
-                    cmds.setAttr( joint + '.drawStyle', 2 )
-
-    # Lock hidden
-    if get_option("lock_hidden_nodes", options, True):
-        node.lock_visibility(True, lock_children=True, only_hidden=True)
-
-    if get_option("lock_transformations", options, True):
-        node.lock_transform(True, lock_children=True)
-
-    # Get path and save
-    file_path = get_publish_file_path( publish_info, extension, name )
-    cmds.select(clear=True)
-    node.select()
-    maya_type = 'mayaBinary'
-    if extension == 'ma':
-        maya_type = 'mayaAscii'
-    cmds.file( rename=file_path )
-    cmds.file( exportSelected=True, options="v=1;", typ=maya_type)
-    set_export_metadata( file_path, publish_info)
-
-def publish_maya_shaders(node, options, extension, publish_info, name):
-    """Publishes the shaders as a maya file"""
-
-    # If there's no mesh, nothing to do
-    meshes = node.meshes()
-    if len(meshes) == 0:
+    formats = take_alembic_jobs(node, publish_options["formats"], publish_info, name, alembic_jobs)
+    if len(formats) == 0:
         return
-
-    # Prepare the data info we're exporting
-    all_shading_engines = []
-
-    # Get shading info
-    for mesh in meshes:
-        node_history = cmds.listHistory( mesh, f=True )
-        node_shading_engines = cmds.listConnections( node_history, type='shadingEngine')
-
-        # Get the name from parent (transform node for this mesh)
-        object_name = cmds.listRelatives(mesh, p=True)[0]
-        # Remove namespace if any
-        object_name = object_name.split(':')[-1]
-
-        if node_shading_engines is not None:
-            for shading_engine in node_shading_engines:
-                # Get the first surface shader to rename the engine
-                try:
-                    surface_shaders = cmds.listConnections(shading_engine + '.surfaceShader')
-                    if surface_shaders:
-                        surface_shader = surface_shaders[0]
-                        surface_shader_name = surface_shader.split(':')[-1]
-                        # Rename
-                        if shading_engine != 'initialShadingGroup':
-                            shading_engine = cmds.rename( shading_engine, surface_shader_name + "_Engine")
-
-                        # List the objects this engine is shading
-                        set_ramses_managed( shading_engine )
-                        object_names = get_ramses_attr( shading_engine, RamsesAttribute.SHADED_OBJECTS )
-                        if object_names is None:
-                            object_names = ''
-                        else:
-                            object_names = object_names + ','
-                        object_names = object_names + object_name
-                        set_ramses_attr( shading_engine, RamsesAttribute.SHADED_OBJECTS, object_names, 'string')
-                except: # pylint: disable=bare-except
-                    pass
-
-                if not shading_engine in all_shading_engines:
-                    all_shading_engines.append(shading_engine)
-
-    if len(all_shading_engines) == 0:
-        ram.log("Sorry, I did not find any shader to publish...", ram.LogLevel.Info)
+    workers = get_option("format_workers", publish_options, 1)
+    if workers > 1 and len(formats) > 1:
+        export_formats_in_parallel(node.path(), name, formats, publish_info, workers)
         return
-
-    # Select and export shadingEngines
-    # Get path and save
-    file_path = get_publish_file_path( publish_info, extension, name + "-shaders" )
-
-    cmds.select(clear=True)
-    spheres = []
-    offset = 0
-    for shading_engine in all_shading_engines:
-        if not cmds.objExists(shading_engine):
-            continue
-        try:
-            # create a sphere per shader and export that
-            sphere = cmds.polySphere(name=shading_engine.replace("_Engine","") + "_shader", constructionHistory=False)[0]
-            # Assign shader
-            cmds.sets(sphere, e=True, forceElement=shading_engine)
-        except RuntimeError:
-            # Can't assign the shader to the sphere
-            ram.log("I Can't publish this shader, for some reason it can't be assigned to our 'sphere shader' mesh: " + shading_engine, ram.LogLevel.Critical)
-            continue
-        # Move on the X axis
-        cmds.setAttr(sphere + ".translateX", offset)
-        offset = offset + 2
-        spheres.append(sphere)
-
-    # Nothing to publish
-    if len(spheres) == 0:
-        ram.log("I can't find any shader to publish, sorry! Skipping shaders...")
-        return
-    root_group = cmds.group(spheres, name=name)
-    cmds.select(root_group)
-
-    maya_type = 'mayaBinary'
-    if extension == 'ma':
-        maya_type = 'mayaAscii'
-
-    cmds.file( rename=file_path )
-    cmds.file( exportSelected=True, options="v=1;", typ=maya_type)
-    set_export_metadata( file_path, publish_info)
-
-def publish_alembic(node, options, publish_info, name):
-    """Publishes the node as alembic"""
-    # We need ABC Export, of course
-    maf.Plugin.load("AbcExport")
-
-    file_path = get_publish_file_path( publish_info, 'abc', name )
-
-    # Collect options
-    in_frame = 1
-    out_frame = 1
-    frame_step = 1.0
-    if "animation" in options:
-        in_frame = int(cmds.playbackOptions(q=True,ast=True))
-        out_frame = int(cmds.playbackOptions(q=True,aet=True))
-        handle_in = get_option("handle_in", options["animation"], 0)
-        handle_out = get_option("handle_out", options["animation"], 0)
-        in_frame = in_frame - handle_in
-        out_frame = out_frame - handle_out
-        frame_step = get_option("frame_step", options["animation"], 1.0)
-
-    filter_euler = ''
-    if get_option("filter_euler_rotations", options, True):
-        filter_euler = '-eulerFilter'
-
-    renderable = ''
-    if get_option("renderable_only", options, True):
-        renderable = '-renderableOnly'
-
-    worldSpace = ''
-    if get_option("world_space", options, True):
-        worldSpace = '-worldSpace'
-
-    attributes = set()
-    if get_option("add_extra_attributes", options, False):
-        # List all the extra attributes on all the nodes
-        attributes = maf.attributes.get_all_extra(node.path(), recursive=True)
-
-    attributes.update( get_option(
-        "attributes",
-        options,
-        set())
-        )
-
-    attrs_prefix = set(get_option(
-        "attributes_prefix",
-        options,
-        set())
-        )
-
-    abc_options = []
-    for attr in attributes:
-        attr = attr.strip()
-        if attr == '':
-            continue
-        abc_options.append("-attr")
-        abc_options.append(attr)
-
-    for pref in attrs_prefix:
-        pref = pref.strip()
-        if pref == '':
-            continue
-        abc_options.append("-attrPrefix ")
-        abc_options.append(pref)
-
-    abc_options = abc_options + [
-        '-frameRange', str(in_frame), str(out_frame),
-        filter_euler,
-        worldSpace,
-        '-step', str(frame_step),
-        '-autoSubd', # crease
-        '-uvWrite',
-        '-writeUVSets',
-        '-writeVisibility',
-        '-dataFormat hdf',
-        renderable,
-        '-root', node.path(),
-        '-file', '"' + file_path + '"',
-    ]
-
-    abc_options_str = ' '.join( abc_options )
-
-    ram.log("These are the alembic options:\n" + abc_options_str, ram.LogLevel.Info)
-
-    # Export
-    cmds.AbcExport(j=abc_options_str)
-    # Meta data
-    set_export_metadata( file_path, publish_info)
-
-def publish_ass(node, options, publish_info, name):
-    """Publishes the node as an arnold scene source"""
-    # We need Arnold, of course
-    maf.Plugin.load('mtoa')
-
-    node.select()
-    file_path = get_publish_file_path( publish_info, 'ass', name )
-
-    cmds.arnoldExportAss(f=file_path, s=True, mask=223, lightLinks=0, shadowLinks=0, cam="perspShape" )
-    set_export_metadata( file_path, publish_info)
-
-def publish_obj(node, options, publish_info, name):
-    """Publishes the node as obj"""
-    import json
-    # We need OBJ Export, of course
-    maf.Plugin.load("objExport")
-
-    file_path = get_publish_file_path( publish_info, 'obj', name )
-
-    # Collect options
-    mtl = "1"
-    if "materials" in options:
-        mtl = get_option("materials", options, True)
-        if mtl:
-            mtl = "1"
-        else:
-            mtl = "0"
-
-    obj_options = ';'.join([
-        "groups=1",
-        "ptgroups=1",
-        "materials=" + mtl,
-        "smoothing=1",
-        "normals=1",
-    ])
-
-    ram.log("These are the obj options:\n" + obj_options, ram.LogLevel.Info)
-
-    #Export
-    cmds.select(clear=True)
-    node.select()
-
-    cmds.file(file_path, force=True, options=obj_options, typ="OBJexport", preserveReferences=True, exportSelected=True)
-    # Meta data
-    set_export_metadata( file_path, publish_info)
+    export_formats(node, formats, publish_info, name)
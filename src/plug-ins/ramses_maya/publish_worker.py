@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+A background publish worker, run by mayapy:
+    mayapy publish_worker.py job_file worker_index worker_count
+
+Opens the snapshot scene of the job, and publishes one node out of worker_count,
+starting at worker_index, with the same logic as the publish in the Maya session.
+In 'formats' mode, the scene has already been cleaned and the worker exports
+the node to one format out of worker_count instead.
+The progress is reported on stdout, see publish_background.
+"""
+
+import os
+import sys
+import types
+
+# The ramses_maya folder, and the plug-ins folder to import its dependencies
+MODULE_PATH = os.path.dirname(os.path.realpath(__file__))
+PLUGIN_PATH = os.path.dirname(MODULE_PATH)
+if PLUGIN_PATH not in sys.path:
+    sys.path.insert(0, PLUGIN_PATH)
+
+def load_package():
+    """Registers the ramses_maya package without running its __init__,
+    which initializes the whole add-on (UI, commands, connection to the Ramses daemon).
+    The workers only import the modules they need."""
+    package = types.ModuleType('ramses_maya')
+    package.__path__ = [ MODULE_PATH ]
+    sys.modules['ramses_maya'] = package
+
+def report(kind, value=''):
+    """Reports progress to the Maya session"""
+    # Keep it on a single line
+    value = str(value).replace('\n', ' ').replace('\r', ' ')
+    sys.stdout.write("RAMSES_PUBLISH|" + kind + "|" + value + "\n")
+    sys.stdout.flush()
+
+def main(job_path, worker_index, worker_count):
+    """Publishes the nodes of this worker"""
+    import maya.standalone # pylint: disable=import-error,import-outside-toplevel
+    maya.standalone.initialize(name='python')
+
+    # pylint: disable=import-outside-toplevel
+    from maya import cmds # pylint: disable=import-error
+    import dumaf as maf
+    load_package()
+    from ramses_maya.publish_background import read_publish_job
+    from ramses_maya.publish_export import (
+        prepare_publish_node,
+        export_formats,
+        export_alembic_jobs,
+        defer_export_metadata
+    )
+
+    scene_path, nodes, publish_options, publish_info, mode = read_publish_job(job_path)
+
+    cmds.file(scene_path, open=True, force=True)
+
+    # The metadata is set by the Maya session
+    exported_files = []
+    defer_export_metadata(exported_files)
+
+    if mode == 'formats':
+        success = export_worker_formats(nodes[0], publish_options["formats"], publish_info, worker_index, worker_count, exported_files)
+        maya.standalone.uninitialize()
+        return success
+
+    # The Alembic exports to run all at once, after the other formats
+    alembic_jobs = []
+
+    success = True
+    for i, (node_path, node_name) in enumerate(nodes):
+        if i % worker_count != worker_index:
+            continue
+        report('START', node_name)
+        node = maf.Node(node_path)
+        if not node.exists():
+            report('ERROR', node_name + ": the node can't be found in the scene (" + node_path + ")")
+            success = False
+            continue
+        try:
+            # The workers already run in parallel: the formats are exported one after the other,
+            # more processes would multiply the number of Maya processes (and licences)
+            node = prepare_publish_node(node, publish_options)
+            export_formats(node, publish_options["formats"], publish_info, node_name, alembic_jobs)
+        except Exception as error: # pylint: disable=broad-except
+            report('ERROR', node_name + ": " + str(error))
+            success = False
+            continue
+        finally:
+            for exported_file in exported_files:
+                report('EXPORTED', exported_file)
+            del exported_files[:]
+        report('DONE', node_name)
+
+    if len(alembic_jobs) > 0:
+        try:
+            export_alembic_jobs(alembic_jobs, publish_info)
+        except Exception as error: # pylint: disable=broad-except
+            report('ERROR', "Alembic export: " + str(error))
+            success = False
+        finally:
+            for exported_file in exported_files:
+                report('EXPORTED', exported_file)
+            del exported_files[:]
+
+    maya.standalone.uninitialize()
+    return success
+
+def export_worker_formats(published_node, formats, publish_info, worker_index, worker_count, exported_files):
+    """Exports the node to the formats of this worker"""
+    # pylint: disable=import-outside-toplevel
+    import dumaf as maf
+    from ramses_maya.publish_export import export_format
+
+    node_path, node_name = published_node
+    node = maf.Node(node_path)
+    if not node.exists():
+        report('ERROR', node_name + ": the node can't be found in the scene (" + node_path + ")")
+        return False
+
+    success = True
+    for i, frmt in enumerate(formats):
+        if i % worker_count != worker_index:
+            continue
+        report('START', node_name)
+        try:
+            export_format(node, frmt, publish_info, node_name)
+        except Exception as error: # pylint: disable=broad-except
+            report('ERROR', node_name + ": " + str(error))
+            success = False
+            continue
+        finally:
+            for exported_file in exported_files:
+                report('EXPORTED', exported_file)
+            del exported_files[:]
+        report('DONE', node_name)
+    return success
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        sys.stderr.write("Usage: mayapy publish_worker.py job_file worker_index worker_count\n")
+        sys.exit(2)
+    if not main(sys.argv[1], int(sys.argv[2]), int(sys.argv[3])):
+        sys.exit(1)
@@ -6,6 +6,7 @@ import platform
 import subprocess
 import tempfile
 import shutil
+import yaml
 
 import maya.api.OpenMaya as om # pylint: disable=import-error
 import maya.cmds as cmds # pylint: disable=import-error
@@ -21,11 +22,13 @@ from .ui_comment import CommentDialog # pylint: disable=import-error,no-name-in-
 from .ui_import import ImportDialog # pylint: disable=import-error,no-name-in-module
 from .ui_saveas import SaveAsDialog # pylint: disable=import-error,no-name-in-module
 from .ui_preview import PreviewDialog # pylint: disable=import-error,no-name-in-module
-from .utils_attributes import get_item, get_step, set_import_attributes, list_ramses_nodes
+from .utils_attributes import get_item, get_step, list_ramses_nodes, read_ramses_attrs
+from .utils_items import RAMSES_ITEM_CACHE
 from .ui_update import UpdateDialog
 from .replace_manager import replacer
-from .update_manager import get_update_file
+from .update_manager import get_update_files, update_references
 from .ui_publish import PublishDialog
+from .publish_manager import publisher
 from .save_manager import setup_scene
 from .utils import getVideoPlayer
 
@@ -524,6 +527,114 @@ class RamSaveVersionCmd( om.MPxCommand ):
         if self.preview:
             cmds.ramPreview()
 
+class RamPublishCmd( om.MPxCommand ):
+    """ramPublish Maya command: publishes the current scene,
+    in this session or in the background with mayapy workers"""
+    name = "ramPublish"
+
+    # Defaults
+    background = False
+    workers = 0
+    edit_publish_settings = False
+    force = False
+
+    def __init__(self):
+        om.MPxCommand.__init__(self)
+
+    @staticmethod
+    def createCommand():
+        """Creates the command"""
+        return RamPublishCmd()
+
+    @staticmethod
+    def createSyntax():
+        """Creates the Mel Syntax"""
+        syntax = om.MSyntax()
+        syntax.addFlag('-b', "-background", om.MSyntax.kBoolean )
+        syntax.addFlag('-w', "-workers", om.MSyntax.kLong )
+        syntax.addFlag('-eps', "-editPublishSettings", om.MSyntax.kBoolean )
+        syntax.addFlag('-f', "-force", om.MSyntax.kBoolean )
+        return syntax
+
+    def parseArgs(self, args):
+        """Parses the Mel args"""
+        parser = om.MArgParser( self.syntax(), args)
+
+        if parser.isFlagSet( '-f' ):
+            self.force = parser.flagArgumentBool('-f', 0)
+        else:
+            self.force = False
+
+        if parser.isFlagSet( '-b' ):
+            self.background = parser.flagArgumentBool('-b', 0)
+        else:
+            self.background = False
+
+        if parser.isFlagSet( '-w' ):
+            self.workers = parser.flagArgumentInt('-w', 0)
+        else:
+            self.workers = 0
+
+        if parser.isFlagSet( '-eps' ):
+            self.edit_publish_settings = parser.flagArgumentBool('-eps', 0)
+        else:
+            self.edit_publish_settings = False
+
+    def doIt(self, args):
+        """Runs the command or raise an error"""
+        check_update()
+        try:
+            self.run(args)
+        except:
+            ram.printException()
+            if SETTINGS.debugMode:
+                raise
+
+    def run(self, args):
+        """Runs the command"""
+        # The current maya file
+        currentFilePath = cmds.file( q=True, sn=True )
+
+        # Check if the Daemon is available
+        if not check_daemon():
+            return
+
+        # Get the save path
+        save_filepath = get_save_filepath( currentFilePath )
+        if save_filepath == '':
+            return
+
+        self.parseArgs(args)
+
+        # The publish works on the saved file
+        if not dumaf.Scene.checkSaveState():
+            return
+
+        currentStep = ram.RamStep.fromPath( save_filepath )
+        currentItem = ram.RamItem.fromPath( save_filepath, True )
+
+        if currentItem is None or currentStep is None:
+            ram.log( "I can't publish this item, I don't know which step it is.", ram.LogLevel.Critical )
+            cmds.inViewMessage( msg="Can't publish: unknown step.", pos='midCenterBot', fade=True )
+            return
+
+        publish_options = None
+        settings = currentStep.publishSettings()
+        if settings:
+            publish_options = yaml.safe_load( settings )
+
+        ram.log("Publishing file: " + save_filepath)
+        publisher(
+            save_filepath,
+            currentItem,
+            currentStep,
+            publish_options,
+            self.edit_publish_settings,
+            background=self.background,
+            workers=self.workers,
+            force=self.force
+            )
+
 class RamRetrieveVersionCmd( om.MPxCommand ):
     """ramRetrieveVersion Maya cmd"""
     name = "ramRetrieveVersion"
@@ -1079,6 +1190,7 @@ class RamUpdateCmd( om.MPxCommand ):
     # Defaults
     updateAll = False
     updateSelection = False
+    fastReferences = True
 
     def __init__(self):
         om.MPxCommand.__init__(self)
@@ -1094,6 +1206,7 @@ class RamUpdateCmd( om.MPxCommand ):
         syntax = om.MSyntax()
         syntax.addFlag('-a', "-updateAll", om.MSyntax.kBoolean )
         syntax.addFlag('-s', "-updateSelection", om.MSyntax.kBoolean )
+        syntax.addFlag('-fr', "-fastReferences", om.MSyntax.kBoolean )
         return syntax
 
     def parseArgs(self, args):
@@ -1110,6 +1223,11 @@ class RamUpdateCmd( om.MPxCommand ):
         else:
             self.updateSelection = False
 
+        if parser.isFlagSet( '-fr' ):
+            self.fastReferences = parser.flagArgumentBool('-fr', 0)
+        else:
+            self.fastReferences = True
+
     def doIt(self, args):
         """Runs the command or raise an error in debug mode"""
         check_update()
@@ -1158,35 +1276,46 @@ class RamUpdateCmd( om.MPxCommand ):
                 )
 
             # Check if there are updates
-            for ram_node in ram_nodes:
-                update_file = get_update_file( ram_node )
-                if update_file != '':
-                    nodes.append( (ram_node, update_file) )
+            nodes = get_update_files( ram_nodes )
+
+        # Referenced nodes just need to load the new file in their reference
+        if self.fastReferences:
+            nodes = update_references( nodes )
 
         if len(nodes) == 0:
             return
 
+        # Group the nodes by update file, so that each file is imported only once
+        # update file -> [ nodes ]
+        files = {}
+        for node, updateFile in nodes:
+            if updateFile not in files:
+                files[updateFile] = []
+            files[updateFile].append(node)
+
         progressDialog = dumaf.ProgressDialog()
         progressDialog.setText("Updating items...")
-        progressDialog.setMaximum(len(nodes))
+        progressDialog.setMaximum(len(files))
         progressDialog.show()
 
-        for n in nodes:
-            node = n[0]
-            updateFile = n[1]
+        # Items and steps are cached, but may belong to another project
+        RAMSES_ITEM_CACHE.check_project()
+        records = read_ramses_attrs( [ n[0] for n in nodes ] )
 
-            # Get the item and step
-            ram_item = get_item( node )
-            ram_step = get_step( node )
+        for updateFile, file_nodes in files.items():
+            # Get the item and step, they're the same for all the nodes using this file
+            node = file_nodes[0]
+            ram_item = get_item( node, records[node] )
+            ram_step = get_step( node, records[node] )
 
             progressDialog.setText("Updating: " + dumaf.paths.baseName(node) )
-            ram.log("Updating: " + dumaf.paths.baseName(node) + "\nwith: " + updateFile )
+            ram.log("Updating " + str(len(file_nodes)) + " node(s) with: " + updateFile )
             progressDialog.increment()
 
             # Let's update!
             # Replace
-            # the replacer replaces selected nodes: select it!
-            cmds.select(node, replace=True)
+            # the replacer replaces selected nodes: select them!
+            cmds.select(file_nodes, replace=True)
             replacer(updateFile, ram_item, ram_step, import_options=None, show_import_options=False)
 
         progressDialog.close()
@@ -1256,6 +1385,8 @@ cmds_classes = (
     RamSetupSceneCmd,
     RamUpdateCmd,
     RamPublishSettings,
+    RamPublishCmd,
+    dumaf.undo.ApplyModifierCmd,
 )
 
 cmds_menuItems = []
@@ -54,6 +54,11 @@ def replacer(file_path, item, step, import_options, show_import_options=False):
     lock_transform = options.get("lock_transformations", "Not set")
     as_reference = options.get("as_reference", "Not set")
     no_root_shape = options.get("no_root_shape", "Not set")
+    fast_bounding_box = options.get("fast_bounding_box", False)
+
+    # The nodes to replace by importing the file, grouped by import options
+    # options -> [ original nodes ]
+    replacements = {}
 
     for original_node in original_nodes:
         # Get the current node settings
@@ -80,11 +85,8 @@ def replacer(file_path, item, step, import_options, show_import_options=False):
 
             # check if transforms are locked
             if lock_transform == "Not set":
-                for child in children:
-                    child = dumaf.Node(child)
-                    if not child.is_transform_locked(recursive=True):
-                        lock_transform = False
-                        break
+                if not dumaf.dag.is_transform_locked(original_node, include_root=False):
+                    lock_transform = False
 
         # check if there's a root shape
         if no_root_shape == "Not set":
@@ -101,7 +103,82 @@ def replacer(file_path, item, step, import_options, show_import_options=False):
         if as_reference == "Not set":
             as_reference = False
 
-        new_nodes = import_file(file_path, as_reference, lock_transform, no_root_shape, item, item_namespace, item_group, step, autoreload_reference=False)
-        update(original_node, new_nodes)
-        original_node = dumaf.Node(original_node)
-        original_node.remove()
+        key = (as_reference, lock_transform, no_root_shape)
+        if key not in replacements:
+            replacements[key] = []
+        replacements[key].append(original_node)
+
+    saved_reads = 0
+    for key, nodes in replacements.items():
+        as_reference, lock_transform, no_root_shape = key
+
+        # References have to be loaded once per node
+        if as_reference:
+            for original_node in nodes:
+                new_nodes = import_file(file_path, as_reference, lock_transform, no_root_shape, item, item_namespace, item_group, step, autoreload_reference=False, fast_bounding_box=fast_bounding_box)
+                replace(original_node, new_nodes)
+            continue
+
+        # Import the file only once, and duplicate the new nodes for the other ones.
+        # The last node gets the imported nodes themselves,
+        # so that they're not moved before they're duplicated.
+        imported_nodes = import_file(file_path, as_reference, lock_transform, no_root_shape, item, item_namespace, item_group, step, autoreload_reference=False, fast_bounding_box=fast_bounding_box)
+        # Rigged or animated nodes can't be duplicated without sharing their rig
+        can_duplicate = is_static(imported_nodes)
+        for i, original_node in enumerate(nodes):
+            if i == len(nodes) - 1:
+                new_nodes = imported_nodes
+            elif can_duplicate:
+                new_nodes = duplicate_nodes(imported_nodes)
+                saved_reads = saved_reads + 1
+            else:
+                new_nodes = import_file(file_path, as_reference, lock_transform, no_root_shape, item, item_namespace, item_group, step, autoreload_reference=False, fast_bounding_box=fast_bounding_box)
+            replace(original_node, new_nodes)
+
+    if saved_reads > 0:
+        ramses.log("Duplicated the imported nodes instead of reading " + file_name + " " + str(saved_reads) + " more times.")
+
+def replace(original_node, new_nodes):
+    """Replaces the original node by the new nodes"""
+    update(original_node, new_nodes)
+    original_node = dumaf.Node(original_node)
+    original_node.remove()
+
+# The types of nodes which can't be shared between duplicated nodes (with their inherited types)
+RIG_NODE_TYPES = (
+    'geometryFilter', # skinClusters, blendShapes and other deformers
+    'constraint',
+    'animCurve', # animation and driven keys
+    'expression',
+    'ikHandle',
+    )
+
+def is_static(nodes):
+    """Checks if the nodes are static or cached content (e.g. Alembic caches),
+    without deformers, constraints, animation or expressions, so they can be duplicated"""
+    if len(nodes) == 0:
+        return True
+    dag_nodes = cmds.listRelatives(nodes, allDescendents=True, fullPath=True)
+    if dag_nodes is None:
+        dag_nodes = []
+    dag_nodes = dag_nodes + list(nodes)
+    history = cmds.listHistory(dag_nodes)
+    if history is None:
+        return True
+    for node in set(history):
+        node_types = cmds.nodeType(node, inherited=True)
+        if node_types is None:
+            continue
+        for node_type in RIG_NODE_TYPES:
+            if node_type in node_types:
+                return False
+    return True
+
+def duplicate_nodes(nodes):
+    """Duplicates the imported nodes with their Ramses attributes.
+    Input connections (e.g. the Alembic caches) are shared with the copies:
+    check the nodes with is_static() first."""
+    if len(nodes) == 0:
+        return []
+    new_nodes = cmds.duplicate(nodes, returnRootsOnly=True, inputConnections=True)
+    return cmds.ls(new_nodes, long=True)
@@ -1131,6 +1131,11 @@ class ImportSettingsWidget( qw.QWidget ):
         self.__ui_no_root_shape_box = qw.QCheckBox("Don't add shape")
         self.__ui_no_root_shape_box.setChecked(False)
         main_layout.addRow("Root node:", self.__ui_no_root_shape_box)
+
+        self.__ui_fast_bounding_box_box = qw.QCheckBox("Fast shape size")
+        self.__ui_fast_bounding_box_box.setToolTip("Size the root shape with the approximate bounding box,\ninstead of evaluating the exact one (faster for heavy assets).")
+        self.__ui_fast_bounding_box_box.setChecked(False)
+        main_layout.addRow("", self.__ui_fast_bounding_box_box)
     
 
         self.__ui_apply_shaders_box = qw.QCheckBox("Apply to selected nodes")
@@ -1156,6 +1161,8 @@ class ImportSettingsWidget( qw.QWidget ):
         self.__ui_lock_transform_box.toggled.connect( self.__update_preset )
         self.__ui_apply_shaders_box.toggled.connect( self.__update_preset )
         self.__ui_no_root_shape_box.toggled.connect( self.__update_preset )
+        self.__ui_no_root_shape_box.toggled.connect( self.__ui_fast_bounding_box_box.setDisabled )
+        self.__ui_fast_bounding_box_box.toggled.connect( self.__update_preset )
         self.__ui_namespace_box.toggled.connect( self.__update_preset )
 
     @qc.Slot()
@@ -1193,6 +1200,8 @@ class ImportSettingsWidget( qw.QWidget ):
 
         options["no_root_shape"] = self.__ui_no_root_shape_box.isChecked()
 
+        options["fast_bounding_box"] = self.__ui_fast_bounding_box_box.isChecked()
+
         options["create_namespace"] = self.__ui_namespace_box.isChecked()
         
         return options
@@ -1205,6 +1214,7 @@ class ImportSettingsWidget( qw.QWidget ):
         load_bool_preset("as_reference", options, self.__ui_reference_box, False)
         load_bool_preset("apply_shaders", options, self.__ui_apply_shaders_box, True)
         load_bool_preset("no_root_shape", options, self.__ui_no_root_shape_box, False)
+        load_bool_preset("fast_bounding_box", options, self.__ui_fast_bounding_box_box, False)
         load_bool_preset("create_namespace", options, self.__ui_namespace_box, True)
 
         self.__format = get_option("format", options, "*")
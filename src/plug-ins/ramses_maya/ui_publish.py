@@ -142,6 +142,17 @@ class PublishDialog(Dialog):
         self.__ui_obj_box = qw.QCheckBox("OBJ")
         format_layout.addWidget(self.__ui_obj_box)
 
+        self.__ui_format_workers_box = qw.QSpinBox()
+        self.__ui_format_workers_box.setMinimum(1)
+        self.__ui_format_workers_box.setMaximum(16)
+        self.__ui_format_workers_box.setValue(1)
+        self.__ui_format_workers_box.setToolTip(
+            "The number of formats exported at the same time, by separate Maya processes.\n"
+            "With 1, all the formats are exported one after the other in this session.\n"
+            "Not used when publishing in the background, the nodes are already published in parallel."
+            )
+        general_layout.addRow("Parallel exports:", self.__ui_format_workers_box)
+
         # <-- Nodes -->
 
         nodes_widget = qw.QWidget()
@@ -217,6 +228,7 @@ class PublishDialog(Dialog):
         freeze_white_list_label = qw.QLabel("Ignore names containing:")
         freeze_white_list_layout.addWidget(freeze_white_list_label)
         self.__ui_freeze_white_list_edit = qw.QLineEdit("_eye_, _eyes_")
+        self.__ui_freeze_white_list_edit.setToolTip("Comma separated list of names.\nGlob patterns (e.g. *_eye?_*) and regular expressions starting with re: can be used too.")
         freeze_white_list_layout.addWidget( self.__ui_freeze_white_list_edit )
         self.__ui_freeze_white_list_case_box = qw.QCheckBox("Case sensitive")
         freeze_white_list_layout.addWidget(self.__ui_freeze_white_list_case_box )
@@ -311,6 +323,13 @@ class PublishDialog(Dialog):
         self.__ui_alembic_filter_euler_box = qw.QCheckBox("Filter Euler rotations")
         alembic_layout.addRow("Rotations:", self.__ui_alembic_filter_euler_box)
 
+        self.__ui_alembic_single_job_box = qw.QCheckBox("Export all nodes at once")
+        self.__ui_alembic_single_job_box.setToolTip(
+            "Exports all the nodes with a single Alembic job, evaluating the timeline only once.\n"
+            "There's still one file per node."
+            )
+        alembic_layout.addRow("Performance:", self.__ui_alembic_single_job_box)
+
         self.__ui_abc_custom_attr_box = qw.QCheckBox("Automatically add all custom/extra attributes")
         alembic_layout.addRow("Custom Attributes:", self.__ui_abc_custom_attr_box)
 
@@ -363,6 +382,7 @@ class PublishDialog(Dialog):
         self.__ui_types_box.currentIndexChanged.connect( self.__update_preset )
         self.__ui_types_edit.textChanged.connect( self.__update_preset )
         self.__ui_remove_empty_groups_box.toggled.connect( self.__update_preset )
+        self.__ui_format_workers_box.valueChanged.connect( self.__update_preset )
         # nodes
         self.__ui_select_no_nodes.clicked.connect( self.__ui_nodes_tree.clearSelection )
         self.__ui_select_all_nodes.clicked.connect( self.__ui_nodes_tree.selectAll )
@@ -380,6 +400,7 @@ class PublishDialog(Dialog):
         self.__ui_alembic_handle_end_box.valueChanged.connect( self.__update_preset )
         self.__ui_alembic_frame_step_box.valueChanged.connect( self.__update_preset )
         self.__ui_alembic_filter_euler_box.toggled.connect( self.__update_preset )
+        self.__ui_alembic_single_job_box.toggled.connect( self.__update_preset )
         self.__ui_abc_custom_attr_box.toggled.connect( self.__update_preset )
         self.__ui_abc_attr_edit.textChanged.connect( self.__update_preset )
         self.__ui_abc_prefix_edit.textChanged.connect( self.__update_preset )
@@ -403,6 +424,7 @@ class PublishDialog(Dialog):
         self.__ui_alembic_handle_end_box.setValue(0)
         self.__ui_alembic_frame_step_box.setValue(1)
         self.__ui_alembic_filter_euler_box.setChecked(True)
+        self.__ui_alembic_single_job_box.setChecked(False)
         self.__ui_abc_attr_edit.setText("")
         self.__ui_abc_prefix_edit.setText("")
         self.__ui_abc_custom_attr_box.setChecked(False)
@@ -523,6 +545,9 @@ class PublishDialog(Dialog):
         else:
             self.__ui_freeze_white_list_widget.setEnabled(False)
 
+        if self.__ui_format_workers_box.value() > 1:
+            options["format_workers"] = self.__ui_format_workers_box.value()
+
         options["formats"] = []
 
         maya_options = self.get_maya_options()
@@ -598,6 +623,7 @@ class PublishDialog(Dialog):
             self.__ui_alembic_frame_step_box.setEnabled(False)
 
         abc["filter_euler_rotations"] = self.__ui_alembic_filter_euler_box.isChecked()
+        abc["single_job"] = self.__ui_alembic_single_job_box.isChecked()
 
         abc["add_extra_attributes"] = self.__ui_abc_custom_attr_box.isChecked()
         abc["attributes"] = self.__ui_abc_attr_edit.toPlainText().split("\n")
@@ -678,6 +704,7 @@ class PublishDialog(Dialog):
         load_bool_preset( "remove_hidden_nodes", options, self.__ui_remove_hidden_nodes_box, True )
         load_bool_preset( "remove_namespaces", options, self.__ui_remove_namespaces_box, True )
         load_bool_preset( "remove_empty_groups", options, self.__ui_remove_empty_groups_box, True )
+        load_number_preset( "format_workers", options, self.__ui_format_workers_box, 1 )
 
         # Formats
         # Uncheck all
@@ -734,6 +761,7 @@ class PublishDialog(Dialog):
                     self.__set_alembic_defaults()
                     frmt = frmt["abc"]
                     load_bool_preset( "filter_euler_rotations", frmt, self.__ui_alembic_filter_euler_box, True)
+                    load_bool_preset( "single_job", frmt, self.__ui_alembic_single_job_box, False)
                     load_bool_preset( "renderable_only", frmt, self.__ui_alembic_filter_euler_box, True)
                     load_bool_preset( "world_space", frmt, self.__ui_alembic_worldSpace_box, True)
                     if "animation" in frmt:
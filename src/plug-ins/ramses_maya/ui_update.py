@@ -10,21 +10,63 @@ except:  # pylint: disable=bare-except
     from PySide6 import QtCore as qc
 
 from maya import cmds # pylint: disable=import-error
-from ramses_maya.utils_attributes import list_ramses_nodes, get_item, get_state, get_step, get_ramses_attr, RamsesAttribute
+from ramses_maya.utils_attributes import list_ramses_nodes, get_item, get_state, get_step, read_ramses_attrs, RamsesAttribute
 from ramses_maya.ui_dialog import Dialog
+from ramses_maya.utils_items import RAMSES_ITEM_CACHE
+from ramses_maya.update_manager import get_update_jobs, find_latest_published_all
 import ramses
 import dumaf
 
 RAMSES = ramses.Ramses.instance()
 
+# The canceled check threads still running, kept alive until they finish
+STOPPED_CHECK_THREADS = []
+
+def release_check_thread( thread ):
+    """Deletes a canceled check thread once it has finished"""
+    if thread in STOPPED_CHECK_THREADS:
+        STOPPED_CHECK_THREADS.remove( thread )
+        thread.deleteLater()
+
+class UpdateCheckThread( qc.QThread ):
+    """Looks for the latest published versions in the background"""
+
+    # Emitted for each job: (job key, latest)
+    resolved = qc.Signal(object, object)
+
+    def __init__(self, jobs, parent = None):
+        super(UpdateCheckThread, self).__init__(parent)
+        self.__jobs = jobs
+        self.__canceled = False
+
+    def cancel(self):
+        """Stops the check as soon as possible"""
+        self.__canceled = True
+
+    def isCanceled(self):
+        """Checks if the check has been canceled"""
+        return self.__canceled
+
+    def run(self):
+        """Runs the check"""
+        for key, latest in find_latest_published_all( self.__jobs, cancel=self.isCanceled ):
+            if self.__canceled:
+                return
+            self.resolved.emit( key, latest )
+
 class UpdateDialog( Dialog ):
     """The Dialog to update items in the scene"""
 
     def __init__(self, parent = None):
         super(UpdateDialog, self).__init__(parent)
+        self.__jobItems = {}
+        self.__checkThread = None
+        self.__numJobs = 0
+        self.__numResolved = 0
         self.__setupUi()
-        self.__listItems()
         self.__connectEvents()
+        # List the nodes once the dialog is shown
+        qc.QTimer.singleShot(0, self.__listItems)
 
     def __setupUi(self):
 
@@ -57,6 +99,9 @@ class UpdateDialog( Dialog ):
         self.currentDetailsLabel = qw.QLabel("")
         currentLayout.addWidget(self.currentDetailsLabel)
 
+        self.checkingLabel = qw.QLabel("Listing items...")
+        currentLayout.addWidget(self.checkingLabel)
+
         columnLayout.addLayout(currentLayout)
 
         updateLayout = qw.QVBoxLayout()
@@ -103,6 +148,11 @@ class UpdateDialog( Dialog ):
     def _updateSelected(self):
         self.done(2)
 
+    def done(self, r):
+        """Stops the background check before closing"""
+        self.__stopCheck()
+        super(UpdateDialog, self).done(r)
+
     qc.Slot()
     def selectionChanged(self):
         """Updates displayed info according to the selection"""
@@ -182,9 +232,11 @@ class UpdateDialog( Dialog ):
 
             node = listItem.data(qc.Qt.UserRole)
             updated = listItem.text().startswith('New: ')
+            checked = listItem.data(qc.Qt.UserRole + 11)
             selected = node in selection
 
-            if onlyUpdated and not updated:
+            # Keep the items being checked visible
+            if onlyUpdated and checked and not updated:
                 listItem.setHidden(True)
                 continue
             if onlySelected and not selected:
@@ -194,26 +246,38 @@ class UpdateDialog( Dialog ):
             listItem.setHidden(False)
 
     def __listItems(self):
-        """List the items found in the scene"""
+        """List the items found in the scene, then check for updates in the background"""
         nodes = list_ramses_nodes('')
         if len(nodes) == 0:
             self._updateButton.setEnabled(False)
             self._updateSelectedButton.setEnabled(False)
+            self.checkingLabel.setText("No item found.")
             return
-        self._updateButton.setEnabled(True)
+        # Items and steps are cached, but may belong to another project
+        RAMSES_ITEM_CACHE.check_project()
+        # Read all the attributes at once
+        records = read_ramses_attrs( nodes )
+        node_jobs, jobs = get_update_jobs( nodes, records )
+        # The list items for each job
+        self.__jobItems = {}
         for node in nodes:
+            if node not in node_jobs: continue
             nodeName = dumaf.paths.baseName(node)
+            attrs = records[node]
 
-            ramItem = get_item( node )
-            ramStep = get_step( node )
-            ramState = get_state( node )
-
-            if ramItem is None or ramStep is None: continue
+            ramItem = get_item( node, attrs )
+            ramStep = get_step( node, attrs )
+            ramState = get_state( node, attrs )
 
             # Check source info
-            sourceFile = get_ramses_attr( node, RamsesAttribute.SOURCE_FILE )
-            version = get_ramses_attr( node, RamsesAttribute.VERSION )
-            resource = get_ramses_attr(node, RamsesAttribute.RESOURCE )
+            sourceFile = attrs.get( RamsesAttribute.SOURCE_FILE, '' )
+            version = attrs.get( RamsesAttribute.VERSION, '' )
+            resource = attrs.get( RamsesAttribute.RESOURCE, '' )
+
+            itemText = ramItem.name() + ' | ' + ramStep.name()
+            if resource != '':
+                itemText = itemText + ' | ' + resource
+            itemText = itemText + ' (' + nodeName + ')'
 
             listItem = qw.QListWidgetItem( self.itemList )
             listItem.setData(qc.Qt.UserRole, node)
@@ -225,36 +289,84 @@ class UpdateDialog( Dialog ):
             listItem.setData(qc.Qt.UserRole + 6, resource )
             listItem.setData(qc.Qt.UserRole + 7, '-Not found-')
             listItem.setData(qc.Qt.UserRole + 8, None )
+            listItem.setData(qc.Qt.UserRole + 10, itemText )
+            listItem.setData(qc.Qt.UserRole + 11, False )
             listItem.setToolTip( node )
+            listItem.setText(itemText + ' - checking...')
 
-            itemText = ramItem.name() + ' | ' + ramStep.name()
-            if resource != '':
-                itemText = itemText + ' | ' + resource
-            itemText = itemText + ' (' + nodeName + ')'
+            self.__jobItems.setdefault( node_jobs[node], [] ).append( listItem )
+
+        ramses.log("Item cache: " + str(RAMSES_ITEM_CACHE.stats()), ramses.LogLevel.Debug)
+
+        # Get the latest versions in the background, shared assets are checked only once
+        self.__numJobs = len(jobs)
+        self.__numResolved = 0
+        self.__updateCheckingLabel()
+        self.__checkThread = UpdateCheckThread( jobs, self )
+        self.__checkThread.resolved.connect( self.__setLatest )
+        self.__checkThread.finished.connect( self.__checkFinished )
+        self.__checkThread.start()
+
+    def __stopCheck(self):
+        """Cancels the background check, if it's running"""
+        if self.__checkThread is None:
+            return
+        thread = self.__checkThread
+        self.__checkThread = None
+        thread.cancel()
+        thread.resolved.disconnect( self.__setLatest )
+        thread.finished.disconnect( self.__checkFinished )
+        # Don't block the UI until the current query finishes:
+        # the thread is detached from the dialog and deleted when it's done
+        thread.setParent( None )
+        STOPPED_CHECK_THREADS.append( thread )
+        thread.finished.connect( lambda t=thread: release_check_thread(t) )
+        if not thread.isRunning():
+            release_check_thread( thread )
+
+    def __updateCheckingLabel(self):
+        self.checkingLabel.setText(
+            "Checking for updates... (" + str(self.__numResolved) + "/" + str(self.__numJobs) + ")"
+            )
+
+    @qc.Slot()
+    def __checkFinished(self):
+        self.checkingLabel.setText("")
+        self._updateButton.setEnabled(True)
+
+    @qc.Slot(object, object)
+    def __setLatest(self, key, latest):
+        """Shows the latest published version of the items of this job"""
+        self.__numResolved = self.__numResolved + 1
+        self.__updateCheckingLabel()
+
+        latestFile = latest['file']
+        updateState = None
+        if latest['state'] != '':
+            updateState = ramses.Ramses.instance().state( latest['state'] )
 
-            updated = False
-
-            if sourceFile is not None:
-                # Get the latest one and check its version and state
-                fileName = os.path.basename( sourceFile )
-                latestFolder = ramItem.latestPublishedVersionFolderPath( ramStep, fileName, resource )
-                latestFile = ramses.RamFileManager.buildPath((latestFolder, fileName))
-                if latestFile != sourceFile and latestFile != '':
-                    updated = True
-                updateVersion = ramses.RamMetaDataManager.getVersion(latestFile)
-                updateState = ramses.RamMetaDataManager.getState( latestFile )
-                updateState = ramses.Ramses.instance().state(updateState)
-                listItem.setData(qc.Qt.UserRole + 7, updateVersion)
+        for listItem in self.__jobItems.get(key, ()):
+            sourceFile = listItem.data(qc.Qt.UserRole + 5)
+            itemText = listItem.data(qc.Qt.UserRole + 10)
+            listItem.setData(qc.Qt.UserRole + 11, True )
+
+            if latestFile != '':
+                listItem.setData(qc.Qt.UserRole + 7, latest['version'])
                 listItem.setData(qc.Qt.UserRole + 8, updateState)
                 listItem.setData(qc.Qt.UserRole + 9, latestFile )
-            if updated:
-                itemText = 'New: ' + itemText 
 
+            if latestFile != sourceFile and latestFile != '':
+                itemText = 'New: ' + itemText
             elif self.onlyNewButton.isChecked():
                 listItem.setHidden(True)
 
             listItem.setText(itemText)
 
+        # Refresh the details if needed
+        currentItem = self.itemList.currentItem()
+        if currentItem is not None and currentItem in self.__jobItems.get(key, ()):
+            self.selectionChanged()
+
     def getAllNodes(self):
         nodes = []
         for i in range(0, self.itemList.count()):
@@ -274,6 +386,9 @@ class UpdateDialog( Dialog ):
             return nodes
 
         for item in self.itemList.selectedItems():
+            # Not checked yet, or not found
+            if item.data(qc.Qt.UserRole + 9) is None:
+                continue
             nodes.append( ( item.data(qc.Qt.UserRole), item.data(qc.Qt.UserRole + 9) ) )
         return nodes
 
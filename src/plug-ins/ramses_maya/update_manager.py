@@ -2,90 +2,129 @@
 """The entry point for updating items"""
 
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from maya import cmds # pylint: disable=import-error
+import maya.api.OpenMaya as om # pylint: disable=import-error
 import dumaf
 import ramses
-from .utils_attributes import is_ramses_managed, get_ramses_attr, RamsesAttribute, get_step, get_item
+from .utils_items import RAMSES_ITEM_CACHE
+from .utils_attributes import (
+    is_ramses_managed,
+    read_ramses_attrs,
+    set_import_attributes,
+    RamsesAttribute,
+    get_step,
+    get_item
+)
+
+# The maximum number of threads used to look for the published versions
+UPDATE_CHECK_THREADS = 8
 
 def update( node, new_nodes ):
     """Updates the node (and children) with the new nodes"""
-    # Get a locator for the current node
-    root_locator = create_update_locator( node )
+    # Keep the current world matrix
+    root_matrix = get_world_matrix( node )
 
     # Keep current deformer and rendering sets
     node = dumaf.Node(node)
     node_sets = node.sets()
 
-    # Get ramses locators
-    node_locators = get_node_locators( node.path() )
-
-    new_root_ctrls = update_nodes( node.path(), new_nodes, root_locator, node_sets, node_locators )
-
-    cmds.delete(root_locator)
-    for loc in node_locators:
-        cmds.delete(loc)
+    # Get the matrices of the ramses children
+    node_matrices = get_node_matrices( node.path() )
 
-    return new_root_ctrls
+    return update_nodes( node.path(), new_nodes, root_matrix, node_sets, node_matrices )
 
-def create_update_locator( node ):
-    """Creates a locator to update the node"""
-    # Create a locator to keep current transform
-    root_locator = cmds.spaceLocator(name='_ramsesTempLocator_')
-    # Snap!
-    root_locator = dumaf.Node(root_locator)
-    root_locator.snap( node )
+def get_dag_path( node ):
+    """Gets the MDagPath of a node"""
+    selection = om.MSelectionList()
+    selection.add( node )
+    return selection.getDagPath(0)
 
-    return root_locator.path()
+def get_world_matrix( node ):
+    """Gets the world matrix of a node"""
+    return get_dag_path( node ).inclusiveMatrix()
 
-def get_node_locators( root_node ):
-    """Gets the locators for all child ramses nodes"""
-    current_nodes = cmds.listRelatives(root_node, ad = True, f=True)
+def get_node_matrices( root_node ):
+    """Gets the world matrices of all the ramses children, by name"""
+    current_nodes = cmds.listRelatives(root_node, ad = True, f=True, type='transform')
     if current_nodes is None:
-        return []
-    locators = []
+        return {}
+    matrices = {}
     for node in current_nodes:
         if is_ramses_managed( node ):
-            node_name = dumaf.paths.baseName(node, True)
-            loc = cmds.spaceLocator(name=node_name + '_ramsesTempLocator_')
-            loc = dumaf.Node(loc)
-            loc.snap( node )
-            locators.append(loc.path())
-    return locators
-
-def update_nodes( old_node, new_nodes, root_locator, node_sets, node_locators ):
+            node_name = dumaf.paths.baseName(node)
+            matrices[node_name] = get_world_matrix( node )
+    return matrices
+
+def snap_to_matrix( node, matrix ):
+    """Moves the node to the world matrix.
+    The current local transformation is kept as an offset, like when parenting to a locator there.
+    The channels are set with an undoable command, even if they're locked."""
+    dag_path = get_dag_path( node )
+    fn_transform = om.MFnTransform( dag_path )
+    current = fn_transform.transformation()
+
+    # New local matrix: offset * target world * inverse of the parent world
+    local_matrix = current.asMatrix() * matrix * dag_path.exclusiveMatrixInverse()
+
+    transformation = om.MTransformationMatrix( local_matrix )
+    # Keep the rotation order and the pivots (balanced, the matrix doesn't change)
+    transformation.reorderRotation( current.rotationOrder() )
+    transformation.setScalePivot( current.scalePivot( om.MSpace.kTransform ), om.MSpace.kTransform, True )
+    transformation.setRotatePivot( current.rotatePivot( om.MSpace.kTransform ), om.MSpace.kTransform, True )
+
+    rotation = transformation.rotation()
+    rotate_axis = transformation.rotationOrientation().asEulerRotation()
+    # attribute, values, unit (None for plain numbers)
+    channels = (
+        ( 'translate', transformation.translation( om.MSpace.kTransform ), om.MDistance ),
+        ( 'rotate', ( rotation.x, rotation.y, rotation.z ), om.MAngle ),
+        ( 'scale', transformation.scale( om.MSpace.kTransform ), None ),
+        ( 'shear', transformation.shear( om.MSpace.kTransform ), None ),
+        ( 'rotateAxis', ( rotate_axis.x, rotate_axis.y, rotate_axis.z ), om.MAngle ),
+        ( 'rotatePivotTranslate', transformation.rotatePivotTranslation( om.MSpace.kTransform ), om.MDistance ),
+        ( 'scalePivotTranslate', transformation.scalePivotTranslation( om.MSpace.kTransform ), om.MDistance ),
+    )
+
+    modifier = om.MDGModifier()
+    locked_plugs = []
+    for attr, values, unit in channels:
+        plug = fn_transform.findPlug( attr, False )
+        if plug.isLocked:
+            locked_plugs.append( plug )
+        for i in range(3):
+            child = plug.child(i)
+            if child.isLocked:
+                locked_plugs.append( child )
+            if unit is om.MDistance:
+                modifier.newPlugValueMDistance( child, om.MDistance( values[i] ) )
+            elif unit is om.MAngle:
+                modifier.newPlugValueMAngle( child, om.MAngle( values[i] ) )
+            else:
+                modifier.newPlugValueDouble( child, values[i] )
+    dumaf.undo.apply_modifier( modifier, unlock=locked_plugs, lock=locked_plugs )
+
+def update_nodes( old_node, new_nodes, root_matrix, node_sets, node_matrices ):
     """Replaces the old node by the new nodes"""
     root_ctrls = []
     for new_node in new_nodes:
 
-        # Move to the locator
+        # Move to the old node
+        snap_to_matrix( new_node, root_matrix )
         new_node = dumaf.Node(new_node)
-        new_node.snap( root_locator )
 
         # Re-set deformers and rendering sets
-        children = cmds.listRelatives( new_node.path(), ad = True, f = True)
+        dumaf.sets.restore_memberships( new_node.path(), node_sets )
+
+        # Move the children to the old ones, parents first
+        children = cmds.listRelatives( new_node.path(), ad = True, f = True, type='transform')
         if children is not None:
-            children.append(new_node.path())
+            children.sort( key=lambda c: c.count('|') )
             for child in children:
                 new_name = dumaf.paths.baseName(child)
-                # Reset deformers and shaders
-                if new_name in node_sets:
-                    new_sets = node_sets[new_name]
-                    for new_set in new_sets:
-                        try:
-                            cmds.sets( child, add=new_set )
-                        except: # Shaders have to be forced as an object can't be in two shader sets at once # pylint: disable=bare-except
-                            try: # There may still be special sets
-                                cmds.sets( child, forceElement=new_set )
-                            except:
-                                pass
-                # Snap to locator
-                if is_ramses_managed( child ):
-                    for loc in node_locators:
-                        loc_name = dumaf.paths.baseName(loc, True)
-                        loc_name = loc_name.split('_ramsesTempLocator_')[0]
-                        if loc_name == new_name:
-                            child = dumaf.Node(child)
-                            child.snap( loc )
+                if new_name in node_matrices and is_ramses_managed( child ):
+                    snap_to_matrix( child, node_matrices[new_name] )
 
         # Re-parent the root to the previous parent
         root_parent = cmds.listRelatives( old_node, parent=True, f=True, type='transform')
@@ -100,24 +139,190 @@ def update_nodes( old_node, new_nodes, root_locator, node_sets, node_locators ):
 
     return root_ctrls
 
-def get_update_file( maya_node ):
-    """Gets the asset file updating this node"""
-
-     # Check source info
-    source_file = get_ramses_attr( maya_node, RamsesAttribute.SOURCE_FILE )
-    if source_file is None or source_file == '':
+def get_reference_node( maya_node ):
+    """Gets the reference node if the content of this Ramses node is referenced, '' otherwise"""
+    children = cmds.listRelatives( maya_node, children=True, type='transform', fullPath=True )
+    if not children:
         return ''
+    child = children[0]
+    if not cmds.referenceQuery( child, isNodeReferenced=True ):
+        return ''
+    return cmds.referenceQuery( child, referenceNode=True )
+
+def update_references( nodes ):
+    """Updates the referenced Ramses nodes by loading the new file in their reference nodes.
+    nodes is a list of tuples (Ramses node, update file).
+    Returns the list of the tuples which are not referenced, to be updated by the replacer.
+    The references which can't be updated are logged and skipped."""
+
+    # Group by reference node
+    references = OrderedDict()
+    other_nodes = []
+    for node, update_file in nodes:
+        reference_node = get_reference_node( node )
+        if reference_node == '':
+            other_nodes.append( (node, update_file) )
+            continue
+        if reference_node in references:
+            # Can't load two files in the same reference
+            if references[reference_node][0] != update_file:
+                other_nodes.append( (node, update_file) )
+                continue
+            references[reference_node][1].append( node )
+        else:
+            references[reference_node] = ( update_file, [node] )
+
+    if len(references) == 0:
+        return other_nodes
+
+    ramses.log("Updating " + str(len(references)) + " references.")
 
-    ram_step = get_step( maya_node )
-    ram_item = get_item( maya_node )
-    resource = get_ramses_attr( maya_node, RamsesAttribute.RESOURCE )
+    RAMSES_ITEM_CACHE.check_project()
+    records = read_ramses_attrs( [ node for node, update_file in nodes ] )
 
-    # Get the latest one and check its version and state
-    fileName = os.path.basename( source_file )
-    latest_folder = ram_item.latestPublishedVersionFolderPath( ram_step, fileName, resource )
-    latest_file = os.path.join(latest_folder, fileName)
+    # One file load per reference node, and a single refresh at the end
+    failed_references = []
+    cmds.refresh( suspend=True )
+    try:
+        for reference_node, ( update_file, ram_nodes ) in references.items():
+            ram_item = get_item( ram_nodes[0], records[ram_nodes[0]] )
+            ram_step = get_step( ram_nodes[0], records[ram_nodes[0]] )
+            ramses.log("Updating reference: " + reference_node + "\nwith: " + update_file )
+            # A missing or broken file must not stop the other updates
+            try:
+                cmds.file( update_file, loadReference=reference_node )
+            except RuntimeError as err:
+                ramses.log("Can't update the reference " + reference_node + " with " + update_file + ":\n" + str(err), ramses.LogLevel.Critical)
+                failed_references.append( reference_node )
+                continue
+            if ram_item is not None and ram_step is not None:
+                set_import_attributes( ram_nodes, ram_item, ram_step, update_file )
+    finally:
+        cmds.refresh( suspend=False )
+        cmds.refresh()
+
+    if len(failed_references) > 0:
+        ramses.log(
+            str(len(failed_references)) + " reference(s) could not be updated:\n" + "\n".join(failed_references),
+            ramses.LogLevel.Critical
+            )
+        cmds.inViewMessage( msg="Some references could not be updated, <hl>see the script editor</hl>.", pos='midCenterBot', fade=True )
+
+    return other_nodes
+
+def get_update_files( maya_nodes ):
+    """Gets the asset files updating these nodes.
+    Returns a list of tuples (node, update file) for the nodes which have an update"""
+    # Items and steps are cached, but may belong to another project
+    RAMSES_ITEM_CACHE.check_project()
+    records = read_ramses_attrs( maya_nodes )
+    node_jobs, jobs = get_update_jobs( maya_nodes, records )
+    ramses.log("Item cache: " + str(RAMSES_ITEM_CACHE.stats()), ramses.LogLevel.Debug)
+
+    # The file system is queried once per job, in parallel
+    latest_files = {}
+    for key, latest in find_latest_published_all( jobs ):
+        latest_files[key] = latest['file']
+
+    update_files = []
+    for maya_node in maya_nodes:
+        if maya_node not in node_jobs:
+            continue
+        source_file = records[maya_node].get( RamsesAttribute.SOURCE_FILE, '' )
+        latest_file = latest_files.get( node_jobs[maya_node], '' )
+        if latest_file != source_file and latest_file != '':
+            update_files.append( (maya_node, latest_file) )
+    return update_files
+
+def get_update_file( maya_node, attrs=None ):
+    """Gets the asset file updating this node.
+    attrs is the record of the node already read with read_ramses_attrs, if any"""
+
+    if attrs is None:
+        attrs = read_ramses_attrs( (maya_node,) )[maya_node]
+
+    node_jobs, jobs = get_update_jobs( (maya_node,), { maya_node: attrs } )
+    if maya_node not in node_jobs:
+        return ''
+
+    source_file = attrs.get( RamsesAttribute.SOURCE_FILE, '' )
+    latest_file = find_latest_published( jobs[node_jobs[maya_node]] )['file']
 
     if latest_file != source_file and latest_file != '':
         return latest_file
 
     return ''
+
+def get_update_jobs( maya_nodes, records ):
+    """Prepares the lookup of the published versions of the nodes.
+    This reads Maya and resolves the items, it must run in the main thread.
+    Nodes sharing the same item, step, file and resource share the same job.
+    Returns a dict node -> job key, and a dict job key -> (RamItem, RamStep, file name, resource)"""
+    node_jobs = {}
+    jobs = {}
+    for maya_node in maya_nodes:
+        attrs = records[maya_node]
+        source_file = attrs.get( RamsesAttribute.SOURCE_FILE, '' )
+        if source_file is None or source_file == '':
+            continue
+
+        ram_item = get_item( maya_node, attrs )
+        ram_step = get_step( maya_node, attrs )
+        if ram_item is None or ram_step is None:
+            continue
+
+        resource = attrs.get( RamsesAttribute.RESOURCE, '' )
+        file_name = os.path.basename( source_file )
+
+        key = ( str(ram_item), str(ram_step), file_name, resource )
+        node_jobs[maya_node] = key
+        if key not in jobs:
+            jobs[key] = ( ram_item, ram_step, file_name, resource )
+    return node_jobs, jobs
+
+def find_latest_published( job ):
+    """Finds the latest published file for a job, and reads its version and state.
+    This only reads the file system, it can run in another thread.
+    Returns a dict with the 'file' ('' if not found), its 'version' and its 'state' short name"""
+    ram_item, ram_step, file_name, resource = job
+    latest = {
+        'file': '',
+        'version': None,
+        'state': '',
+    }
+    latest_folder = ram_item.latestPublishedVersionFolderPath( ram_step, file_name, resource )
+    if latest_folder == '':
+        return latest
+    latest_file = ramses.RamFileManager.buildPath(( latest_folder, file_name ))
+    latest['file'] = latest_file
+    latest['version'] = ramses.RamMetaDataManager.getVersion( latest_file )
+    latest['state'] = ramses.RamMetaDataManager.getState( latest_file )
+    return latest
+
+def find_latest_published_all( jobs, cancel=None, max_threads=UPDATE_CHECK_THREADS ):
+    """Runs find_latest_published for all the jobs in a thread pool.
+    Yields tuples (job key, latest) as soon as they're available.
+    cancel is an optional function returning True to stop the lookup"""
+    if len(jobs) == 0:
+        return
+
+    executor = ThreadPoolExecutor( max_workers=min(max_threads, len(jobs)) )
+    futures = {}
+    try:
+        for key, job in jobs.items():
+            futures[ executor.submit(find_latest_published, job) ] = key
+        for future in as_completed( futures ):
+            if cancel is not None and cancel():
+                return
+            key = futures[future]
+            try:
+                latest = future.result()
+            except Exception as err: # pylint: disable=broad-except
+                ramses.log("Can't find the published versions of " + str(key) + ":\n" + str(err), ramses.LogLevel.Debug)
+                latest = { 'file': '', 'version': None, 'state': '' }
+            yield key, latest
+    finally:
+        # Don't wait for the remaining jobs if we stop early
+        for future in futures:
+            future.cancel()
+        executor.shutdown( wait=False )
@@ -5,8 +5,10 @@ Useful functions to manage Maya and Ramses custom attributes on nodes
 
 import os
 import maya.cmds as cmds # pylint: disable=import-error
+import maya.api.OpenMaya as om # pylint: disable=import-error
 import dumaf as maf # pylint: disable=import-error
 import ramses as ram
+from .utils_items import RAMSES_ITEM_CACHE
 
 class RamsesAttribute():
     """Enum for attribute names"""
@@ -28,9 +30,34 @@ class RamsesAttribute():
     ORIGIN_ROT = 'ramsesOriginalRot'
     ORIGIN_SCA = 'ramsesOriginalSca'
     RESOURCE = 'ramsesResource'
+    ALL = (
+        MANAGED,
+        STEP,
+        ITEM,
+        ASSET_GROUP,
+        ITEM_TYPE,
+        SOURCE_FILE,
+        SOURCE_TIME,
+        SHADING_TYPE,
+        SHADED_OBJECTS,
+        IS_PROXY,
+        VERSION,
+        STATE,
+        ORIGIN_POS,
+        ORIGIN_ROT,
+        ORIGIN_SCA,
+        RESOURCE,
+    )
+
+# The index of all the nodes managed by Ramses in the scene
+RAMSES_NODE_INDEX = maf.AttributeIndex( RamsesAttribute.MANAGED )
+
+def set_import_attributes( nodes, item, step, file_path ):
+    """Sets the attributes needed when importing an asset.
+    nodes can be a single node or a list of nodes imported from the same file"""
+    if isinstance(nodes, (str, maf.Node)):
+        nodes = (nodes,)
 
-def set_import_attributes( node, item, step, file_path ):
-    """Sets the attributes needed when importing an asset"""
     timestamp = os.path.getmtime( file_path )
     timestamp = int(timestamp)
 
@@ -38,16 +65,119 @@ def set_import_attributes( node, item, step, file_path ):
     state = ram.RamMetaDataManager.getState( file_path )
     resource = ram.RamMetaDataManager.getResource(file_path)
 
-    set_ramses_managed( node )
-    set_ramses_attr( node, RamsesAttribute.SOURCE_FILE, file_path, 'string' )
-    set_ramses_attr( node, RamsesAttribute.SOURCE_TIME, timestamp, 'long' )
-    set_ramses_attr( node, RamsesAttribute.VERSION, version, 'long' )
-    set_ramses_attr( node, RamsesAttribute.STATE, state, 'string' )
-    set_ramses_attr( node, RamsesAttribute.STEP, str(step), 'string' )
-    set_ramses_attr( node, RamsesAttribute.ITEM, str(item), 'string' )
-    set_ramses_attr( node, RamsesAttribute.ITEM_TYPE, item.itemType(), 'string' )
-    set_ramses_attr( node, RamsesAttribute.ASSET_GROUP, item.group(), 'string' )
-    set_ramses_attr( node, RamsesAttribute.RESOURCE, resource, 'string' )
+    attrs = {
+        RamsesAttribute.MANAGED: (True, 'bool'),
+        RamsesAttribute.SOURCE_FILE: (file_path, 'string'),
+        RamsesAttribute.SOURCE_TIME: (timestamp, 'long'),
+        RamsesAttribute.VERSION: (version, 'long'),
+        RamsesAttribute.STATE: (state, 'string'),
+        RamsesAttribute.STEP: (str(step), 'string'),
+        RamsesAttribute.ITEM: (str(item), 'string'),
+        RamsesAttribute.ITEM_TYPE: (item.itemType(), 'string'),
+        RamsesAttribute.ASSET_GROUP: (item.group(), 'string'),
+        RamsesAttribute.RESOURCE: (resource, 'string'),
+    }
+
+    set_ramses_attrs( { node: attrs for node in nodes } )
+
+def set_ramses_attrs( nodes_attrs ):
+    """Sets many Ramses attributes on many nodes at once.
+    nodes_attrs is a dict: node -> { attribute name: (value, type) }.
+    The reference lock is toggled only once, missing attributes are created
+    and the values are set with two MDGModifiers, which can be undone"""
+
+    # Temporarily unlock ref edit
+    cmds.optionVar(iv=("refLockEditable",1))
+    try:
+        # Create the missing attributes
+        modifier = om.MDGModifier()
+        new_attributes = []
+        values = []
+        for node, attrs in nodes_attrs.items():
+            if isinstance(node, maf.Node):
+                node = node.path()
+            fn_node = _get_fn_node( node )
+            if fn_node is None:
+                continue
+            for attr, (value, t) in attrs.items():
+                if not fn_node.hasAttribute( attr ):
+                    attribute = _create_attribute( node, attr, t )
+                    if attribute is not None:
+                        modifier.addAttribute( fn_node.object(), attribute )
+                        new_attributes.append( (fn_node, attr, t) )
+                values.append( (node, fn_node, attr, value, t) )
+        try:
+            maf.undo.apply_modifier( modifier )
+        except RuntimeError:
+            # Some nodes won't accept new attributes, add the others one by one
+            for fn_node, attr, t in new_attributes:
+                if fn_node.hasAttribute( attr ):
+                    continue
+                node_modifier = om.MDGModifier()
+                node_modifier.addAttribute( fn_node.object(), _create_attribute( fn_node.uniqueName(), attr, t ) )
+                try:
+                    maf.undo.apply_modifier( node_modifier )
+                except RuntimeError:
+                    pass
+
+        # Unlock, set and lock
+        modifier = om.MDGModifier()
+        plugs = []
+        for node, fn_node, attr, value, t in values:
+            if not fn_node.hasAttribute( attr ):
+                continue
+            plug = fn_node.findPlug( attr, False )
+            plug_name = node + '.' + attr
+            try:
+                if t == 'string':
+                    if value is None:
+                        value = ''
+                    modifier.newPlugValueString( plug, str(value) )
+                elif t == 'bool':
+                    modifier.newPlugValueBool( plug, bool(value) )
+                elif t == 'long':
+                    modifier.newPlugValueInt( plug, int(value) )
+                else:
+                    # Less common types are set right away
+                    cmds.setAttr( plug_name, lock=False )
+                    if t in RamsesAttribute.DT_TYPES:
+                        cmds.setAttr( plug_name, value, type=t )
+                    else:
+                        cmds.setAttr( plug_name, value )
+            except (TypeError, ValueError, RuntimeError):
+                pass
+            plugs.append( plug )
+        try:
+            maf.undo.apply_modifier( modifier, unlock=plugs, lock=plugs )
+        except RuntimeError:
+            pass
+    finally:
+        cmds.optionVar(iv=("refLockEditable",0))
+
+    # Keep the index up to date
+    for node, attrs in nodes_attrs.items():
+        if RamsesAttribute.MANAGED in attrs:
+            if isinstance(node, maf.Node):
+                node = node.path()
+            RAMSES_NODE_INDEX.update( node )
+
+def _create_attribute( node, attr, t ):
+    """Creates a new attribute to be added with an MDGModifier.
+    Less common types are directly added to the node by Maya, and None is returned"""
+    if t == 'string':
+        return om.MFnTypedAttribute().create( attr, attr, om.MFnData.kString )
+    if t == 'bool':
+        return om.MFnNumericAttribute().create( attr, attr, om.MFnNumericData.kBoolean )
+    if t == 'long':
+        return om.MFnNumericAttribute().create( attr, attr, om.MFnNumericData.kInt )
+    try:
+        if t in RamsesAttribute.DT_TYPES:
+            cmds.addAttr( node, ln=attr, dt=t )
+        else:
+            cmds.addAttr( node, ln=attr, at=t )
+    except RuntimeError:
+        pass
+    return None
 
 def set_ramses_attr3( node, attr, x, y, z, t):
     """Sets a 3-dimensionnal Ramses attribute to the node"""
@@ -98,24 +228,84 @@ def set_ramses_attr( node, attr, value, t):
     except: # pylint: disable=bare-except
         pass
     cmds.optionVar(iv=("refLockEditable",0))
+    # Keep the index up to date
+    if attr == RamsesAttribute.MANAGED:
+        RAMSES_NODE_INDEX.update( node )
 
 def get_ramses_attr( node, attr):
     """Gets a Ramses attribute from the node"""
-    if attr not in cmds.listAttr(node):
+    if isinstance(node, maf.Node):
+        node = node.path()
+    fn_node = _get_fn_node( node )
+    if fn_node is None or not fn_node.hasAttribute( attr ):
         return ''
-    return cmds.getAttr(node + '.' + attr)
+    return _get_plug_value( node, fn_node.findPlug( attr, False ) )
+
+def read_ramses_attrs( nodes ):
+    """Reads all the Ramses attributes of the nodes in a single pass.
+    Returns a dict: node -> { attribute name: value }.
+    Only the attributes which exist on the node are listed in its record."""
+    records = {}
+    for node in nodes:
+        record = {}
+        records[node] = record
+        fn_node = _get_fn_node( node )
+        if fn_node is None:
+            continue
+        for attr in RamsesAttribute.ALL:
+            if fn_node.hasAttribute( attr ):
+                record[attr] = _get_plug_value( node, fn_node.findPlug( attr, False ) )
+    return records
+
+def _get_fn_node( node ):
+    """Gets a MFnDependencyNode for the node path, or None if it doesn't exist"""
+    selection = om.MSelectionList()
+    try:
+        selection.add( node )
+        return om.MFnDependencyNode( selection.getDependNode(0) )
+    except: # pylint: disable=bare-except
+        return None
+
+def _get_plug_value( node, plug ):
+    """Gets the value of a plug without going through MEL for simple types"""
+    attribute = plug.attribute()
+    if attribute.hasFn( om.MFn.kTypedAttribute ):
+        if om.MFnTypedAttribute( attribute ).attrType() == om.MFnData.kString:
+            return plug.asString()
+    elif attribute.hasFn( om.MFn.kNumericAttribute ):
+        numeric_type = om.MFnNumericAttribute( attribute ).numericType()
+        if numeric_type == om.MFnNumericData.kBoolean:
+            return plug.asBool()
+        if numeric_type in (
+            om.MFnNumericData.kByte,
+            om.MFnNumericData.kChar,
+            om.MFnNumericData.kShort,
+            om.MFnNumericData.kInt,
+            ):
+            return plug.asInt()
+        if numeric_type in (om.MFnNumericData.kFloat, om.MFnNumericData.kDouble):
+            return plug.asDouble()
+    # Compounds (float3...) are converted by Maya
+    return cmds.getAttr( node + '.' + plug.partialName(useLongNames=True) )
+
+def _get_attr( node, attr, attrs=None ):
+    """Gets the attribute from the record if it's provided, or from the node"""
+    if attrs is None:
+        return get_ramses_attr( node, attr )
+    return attrs.get( attr, '' )
 
 def set_ramses_managed(node, managed=True):
     """Sets the node as managed by Ramses (an asset from the pipeline).
     Actually (un)checks the RamsesAttribute.MANAGED"""
     set_ramses_attr( node, RamsesAttribute.MANAGED, managed, 'bool' )
 
-def get_item( node ):
-    """Gets the RamItem corresponding to this node"""
+def get_item( node, attrs=None ):
+    """Gets the RamItem corresponding to this node.
+    attrs is the record of the node already read with read_ramses_attrs, if any"""
     # try from path first
-    sourcePath = get_ramses_attr( node, RamsesAttribute.SOURCE_FILE )
+    sourcePath = _get_attr( node, RamsesAttribute.SOURCE_FILE, attrs )
     if sourcePath != '':
-        item = ram.RamItem.fromPath( sourcePath )
+        item = RAMSES_ITEM_CACHE.item( sourcePath )
         if item is not None:
             return item
     return None
@@ -126,12 +316,13 @@ def get_item( node ):
         return None
     return ram.RamItem.fromString( name, itemType )"""
 
-def get_step( node ):
-    """Gets the RamStep corresponding to this node"""
+def get_step( node, attrs=None ):
+    """Gets the RamStep corresponding to this node.
+    attrs is the record of the node already read with read_ramses_attrs, if any"""
     # try from path first
-    sourcePath = get_ramses_attr( node, RamsesAttribute.SOURCE_FILE )
+    sourcePath = _get_attr( node, RamsesAttribute.SOURCE_FILE, attrs )
     if sourcePath != '':
-        step = ram.RamStep.fromPath( sourcePath )
+        step = RAMSES_ITEM_CACHE.step( sourcePath )
         if step is not None:
             return step
     return None
@@ -140,9 +331,10 @@ def get_step( node ):
     if name == '': return None
     return ram.RamStep.fromString( name )"""
 
-def get_state( node ):
-    """Gets the RamState corresponding to this node"""
-    state = get_ramses_attr( node, RamsesAttribute.STATE )
+def get_state( node, attrs=None ):
+    """Gets the RamState corresponding to this node.
+    attrs is the record of the node already read with read_ramses_attrs, if any"""
+    state = _get_attr( node, RamsesAttribute.STATE, attrs )
     return ram.Ramses.instance().state(state)
 
 def is_ramses_managed(node):
@@ -151,27 +343,22 @@ def is_ramses_managed(node):
 
 def list_ramses_nodes(node_type='transform', selected_only=False):
     """Lists all the nodes managed by Ramses in the scene"""
-    # Scan all transform nodes
-    scene_nodes = ()
-    if node_type == '':
-        scene_nodes = cmds.ls( long=True, selection=selected_only )
-    else:
-        scene_nodes = cmds.ls( type=node_type, long=True, selection=selected_only )
-
-    nodes = []
-
-    progress_dialog = maf.ProgressDialog()
-    progress_dialog.show()
-    progress_dialog.setText("Scanning Scene for Ramses Nodes")
-    progress_dialog.setMaximum(len(scene_nodes))
-
-    for node in scene_nodes:
-        progress_dialog.increment()
-        try:
-            if is_ramses_managed(node):
-                nodes.append(node)
-        except: # pylint: disable=bare-except
-            pass
+    # Only the indexed nodes need to be checked, not the whole scene
+    nodes = RAMSES_NODE_INDEX.nodes()
+    if len(nodes) == 0:
+        return []
+
+    # Filter by type in a single query (this keeps the inherited types, like cmds.ls)
+    if node_type != '':
+        nodes = cmds.ls( nodes, type=node_type, long=True )
+        if not nodes:
+            return []
+
+    if selected_only:
+        selection = cmds.ls( long=True, selection=True )
+        if not selection:
+            return []
+        nodes = set(nodes)
+        return [ node for node in selection if node in nodes ]
 
-    progress_dialog.hide()
     return nodes
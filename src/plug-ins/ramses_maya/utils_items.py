@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Cached resolution of Ramses items and steps from file paths
+"""
+
+import os
+from collections import OrderedDict
+import maya.api.OpenMaya as om # pylint: disable=import-error
+import ramses as ram
+
+class ItemCache():
+    """A bounded LRU cache of the RamItem and RamStep resolved from source files.
+    Many nodes usually share the same source file, and each resolution
+    queries the Ramses daemon and the file system.
+    The cache is cleared when a scene is opened or created, and by check_project when the current project changes:
+    call it once before each batch of lookups, the lookups themselves don't query the daemon.
+    The paths which can't be resolved are not cached: the item may be created later."""
+
+    def __init__(self, max_size=1024):
+        self.__max_size = max_size
+        self.__items = OrderedDict()
+        self.__steps = OrderedDict()
+        self.__project = None
+        self.__callbacks = []
+        self.hits = 0
+        self.misses = 0
+
+    # <== Public ==>
+
+    def item(self, file_path):
+        """Gets the RamItem for this file path"""
+        return self.__get( self.__items, file_path, ram.RamItem.fromPath )
+
+    def step(self, file_path):
+        """Gets the RamStep for this file path"""
+        return self.__get( self.__steps, file_path, ram.RamStep.fromPath )
+
+    def check_project(self):
+        """Clears the cache if the current project has changed since the last check"""
+        project = ram.Ramses.instance().currentProject()
+        project_id = ''
+        if project is not None:
+            project_id = project.uuid()
+        if project_id != self.__project:
+            self.clear()
+            self.__project = project_id
+
+    def clear(self):
+        """Empties the cache"""
+        self.__items.clear()
+        self.__steps.clear()
+
+    def stats(self):
+        """Returns the hits, misses and size of the cache as a dict"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.__items) + len(self.__steps),
+        }
+
+    def install_callbacks(self):
+        """Clears the cache when the scene changes"""
+        if len(self.__callbacks) > 0:
+            return
+        self.__callbacks = [
+            om.MSceneMessage.addCallback( om.MSceneMessage.kAfterOpen, self.__scene_changed ),
+            om.MSceneMessage.addCallback( om.MSceneMessage.kAfterNew, self.__scene_changed ),
+        ]
+
+    def remove_callbacks(self):
+        """Stops listening to the scene changes (call this before unloading the plug-in)"""
+        for callback_id in self.__callbacks:
+            om.MMessage.removeCallback(callback_id)
+        self.__callbacks = []
+        self.clear()
+
+    # <== Private ==>
+
+    def __get(self, cache, file_path, resolve):
+        if file_path is None or file_path == '':
+            return None
+        self.install_callbacks()
+        key = os.path.normcase( os.path.normpath( file_path ) )
+        if key in cache:
+            self.hits = self.hits + 1
+            cache.move_to_end( key )
+            return cache[key]
+        self.misses = self.misses + 1
+        result = resolve( file_path )
+        if result is None:
+            return None
+        cache[key] = result
+        if len(cache) > self.__max_size:
+            cache.popitem( last=False )
+        return result
+
+    def __scene_changed(self, client_data=None): # pylint: disable=unused-argument
+        self.clear()
+
+# The cache used by the plug-in
+RAMSES_ITEM_CACHE = ItemCache()
@@ -0,0 +1,194 @@
+"""
+    Tests the eviction and invalidation of the node cache (dumaf)
+    and of the item cache (ramses_maya).
+
+    Run with mayapy:
+        mayapy tools/tests/test_caches.py
+"""
+
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+PLUGINS_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'plug-ins'))
+sys.path.insert(0, PLUGINS_PATH)
+
+import maya.standalone # pylint: disable=import-error,wrong-import-position
+maya.standalone.initialize(name='python')
+
+# pylint: disable=wrong-import-position
+import maya.cmds as cmds # pylint: disable=import-error
+import maya.api.OpenMaya as om # pylint: disable=import-error
+from dumaf.node_cache import NodeCache
+
+# Import the modules of ramses_maya without initializing the whole add-on (see publish_worker)
+RAMSES_MAYA = types.ModuleType('ramses_maya')
+RAMSES_MAYA.__path__ = [ os.path.join(PLUGINS_PATH, 'ramses_maya') ]
+sys.modules['ramses_maya'] = RAMSES_MAYA
+from ramses_maya import utils_items
+
+def get_node(node):
+    """Returns the full path, the MObjectHandle and the MDagPath of a node"""
+    selection = om.MSelectionList()
+    selection.add( node )
+    dag_path = selection.getDagPath(0)
+    return dag_path.fullPathName(), om.MObjectHandle( dag_path.node() ), dag_path
+
+class TestNodeCache( unittest.TestCase ):
+    """The least recently used nodes are evicted, and the changed paths are forgotten"""
+
+    def setUp(self):
+        cmds.file(new=True, force=True)
+        self.cache = NodeCache()
+        self.cache.install_callbacks()
+        self.nodes = [ get_node( cmds.group(empty=True, name='node' + str(i)) ) for i in range(3) ]
+
+    def tearDown(self):
+        self.cache.remove_callbacks()
+
+    def test_hit(self):
+        """A node added by path is found again"""
+        path, handle, dag_path = self.nodes[0]
+        self.cache.add( path, handle, dag_path )
+        cached = self.cache.get( path )
+        self.assertIsNotNone( cached )
+        self.assertEqual( cached[1].fullPathName(), path )
+        self.assertEqual( self.cache.stats()['hits'], 1 )
+
+    def test_least_recently_used_is_evicted(self):
+        """Above MAX_NODES, the node which was not used for the longest time is forgotten"""
+        self.cache.MAX_NODES = 2
+        (path0, handle0, dag_path0), (path1, handle1, dag_path1), (path2, handle2, dag_path2) = self.nodes
+        self.cache.add( path0, handle0, dag_path0 )
+        self.cache.add( path1, handle1, dag_path1 )
+        # Use the first one, the second one becomes the oldest
+        self.assertIsNotNone( self.cache.get( path0 ) )
+        self.cache.add( path2, handle2, dag_path2 )
+        self.assertIsNone( self.cache.get( path1 ) )
+        self.assertIsNotNone( self.cache.get( path0 ) )
+        self.assertIsNotNone( self.cache.get( path2 ) )
+
+    def test_uuids_are_limited_separately(self):
+        """The UUIDs and the paths have their own limit"""
+        self.cache.MAX_NODES = 1
+        path, handle, dag_path = self.nodes[0]
+        uuid = cmds.ls( path, uuid=True )[0]
+        self.cache.add( path, handle, dag_path )
+        self.cache.add( uuid, handle )
+        self.assertIsNotNone( self.cache.get( path ) )
+        self.assertIsNotNone( self.cache.get( uuid ) )
+
+    def test_deleted_node(self):
+        """A deleted node is not returned"""
+        path, handle, dag_path = self.nodes[0]
+        self.cache.add( path, handle, dag_path )
+        cmds.delete( path )
+        self.assertIsNone( self.cache.get( path ) )
+
+    def test_renamed_node(self):
+        """The paths are forgotten when a node is renamed"""
+        path, handle, dag_path = self.nodes[0]
+        self.cache.add( path, handle, dag_path )
+        cmds.rename( path, 'renamed' )
+        self.assertIsNone( self.cache.get( path ) )
+
+    def test_reparented_node(self):
+        """The paths are forgotten when a node is reparented"""
+        path, handle, dag_path = self.nodes[0]
+        self.cache.add( path, handle, dag_path )
+        cmds.parent( path, self.nodes[1][0] )
+        self.assertIsNone( self.cache.get( path ) )
+
+    def test_new_scene(self):
+        """Everything is forgotten with a new scene"""
+        path, handle, dag_path = self.nodes[0]
+        self.cache.add( path, handle, dag_path )
+        cmds.file(new=True, force=True)
+        self.assertEqual( self.cache.stats()['size'], 0 )
+
+class FakeProject(): # pylint: disable=too-few-public-methods
+    """A project with a uuid"""
+    def __init__(self, uuid):
+        self.__uuid = uuid
+
+    def uuid(self):
+        """The uuid"""
+        return self.__uuid
+
+class TestItemCache( unittest.TestCase ):
+    """The least recently used items are evicted, the unresolved paths are not cached,
+    and the cache is cleared when the project or the scene changes"""
+
+    def setUp(self):
+        cmds.file(new=True, force=True)
+        self.resolved = []
+        self.project = FakeProject('project1')
+        ramses_instance = mock.MagicMock()
+        ramses_instance.currentProject.side_effect = lambda: self.project
+        self.patches = [
+            mock.patch.object( utils_items.ram.RamItem, 'fromPath', side_effect=self.__resolve ),
+            mock.patch.object( utils_items.ram.Ramses, 'instance', return_value=ramses_instance ),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.cache = utils_items.ItemCache( max_size=2 )
+        self.cache.check_project()
+
+    def tearDown(self):
+        self.cache.remove_callbacks()
+        for patch in self.patches:
+            patch.stop()
+
+    def __resolve(self, file_path):
+        self.resolved.append( file_path )
+        if 'unknown' in file_path:
+            return None
+        return 'item:' + file_path
+
+    def test_hit(self):
+        """The same path is resolved only once"""
+        self.assertEqual( self.cache.item('/a.ma'), 'item:/a.ma' )
+        self.assertEqual( self.cache.item('/a.ma'), 'item:/a.ma' )
+        self.assertEqual( self.resolved, ['/a.ma'] )
+
+    def test_least_recently_used_is_evicted(self):
+        """Above max_size, the item which was not used for the longest time is resolved again"""
+        self.cache.item('/a.ma')
+        self.cache.item('/b.ma')
+        self.cache.item('/a.ma')
+        self.cache.item('/c.ma')
+        self.cache.item('/a.ma')
+        self.assertEqual( self.resolved, ['/a.ma', '/b.ma', '/c.ma'] )
+        self.cache.item('/b.ma')
+        self.assertEqual( self.resolved, ['/a.ma', '/b.ma', '/c.ma', '/b.ma'] )
+
+    def test_unresolved_not_cached(self):
+        """A path without item is resolved again, the item may have been created"""
+        self.assertIsNone( self.cache.item('/unknown.ma') )
+        self.assertIsNone( self.cache.item('/unknown.ma') )
+        self.assertEqual( len(self.resolved), 2 )
+
+    def test_project_change(self):
+        """The items are resolved again after the project changes, once check_project is called"""
+        self.cache.item('/a.ma')
+        self.project = FakeProject('project2')
+        # The lookups themselves don't check the project
+        self.cache.item('/a.ma')
+        self.assertEqual( len(self.resolved), 1 )
+        self.cache.check_project()
+        self.cache.item('/a.ma')
+        self.assertEqual( len(self.resolved), 2 )
+
+    def test_new_scene(self):
+        """The items are resolved again in a new scene"""
+        self.cache.item('/a.ma')
+        cmds.file(new=True, force=True)
+        self.cache.item('/a.ma')
+        self.assertEqual( len(self.resolved), 2 )
+
+if __name__ == '__main__':
+    result = unittest.main(exit=False).result
+    maya.standalone.uninitialize()
+    sys.exit( not result.wasSuccessful() )
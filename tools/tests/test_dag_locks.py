@@ -0,0 +1,75 @@
+"""
+    Tests the transform locks of dumaf.dag on hierarchies containing joints.
+
+    Run with mayapy:
+        mayapy tools/tests/test_dag_locks.py
+"""
+
+import os
+import sys
+import unittest
+
+PLUGINS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'plug-ins')
+sys.path.insert(0, os.path.normpath(PLUGINS_PATH))
+
+import maya.standalone # pylint: disable=import-error
+maya.standalone.initialize(name='python')
+
+import maya.cmds as cmds # pylint: disable=import-error,wrong-import-position
+from dumaf import dag # pylint: disable=wrong-import-position
+
+TRANSFORM_ATTRIBUTES = ('tx', 'ty', 'tz', 'rx', 'ry', 'rz', 'sx', 'sy', 'sz')
+
+def build_rig():
+    """Creates a group containing a plain transform and a joint chain.
+    Returns the paths of the root, the transform and the joints"""
+    root = cmds.group(empty=True, name='rig')
+    ctrl = cmds.group(empty=True, name='ctrl', parent=root)
+    # A chain: the second joint is created under the first one
+    cmds.select(clear=True)
+    first_joint = cmds.joint(name='joint1', position=(0, 0, 0))
+    cmds.joint(name='joint2', position=(0, 1, 0))
+    cmds.parent(first_joint, ctrl)
+    joints = cmds.listRelatives(root, allDescendents=True, type='joint', fullPath=True)
+    return cmds.ls(root, long=True)[0], cmds.ls(ctrl, long=True)[0], joints
+
+def set_locked(node, lock):
+    """Locks or unlocks the transformation channels of a single node"""
+    for attr in TRANSFORM_ATTRIBUTES:
+        cmds.setAttr(node + '.' + attr, lock=lock)
+
+def is_locked(node):
+    """Checks if any transformation channel of the node is locked"""
+    return any( cmds.getAttr(node + '.' + attr, lock=True) for attr in TRANSFORM_ATTRIBUTES )
+
+class TestTransformLocks( unittest.TestCase ):
+    """Only the plain transform nodes are locked and checked, never the joints"""
+
+    def setUp(self):
+        cmds.file(new=True, force=True)
+        self.root, self.ctrl, self.joints = build_rig()
+
+    def test_locked_transforms_with_unlocked_joints(self):
+        """Assets imported with locked transforms and free joints are still locked"""
+        set_locked(self.root, True)
+        set_locked(self.ctrl, True)
+        self.assertTrue( dag.is_transform_locked(self.root) )
+        self.assertTrue( dag.is_transform_locked(self.root, include_root=False) )
+
+    def test_unlocked_transform(self):
+        """An unlocked plain transform is still detected"""
+        set_locked(self.root, True)
+        self.assertFalse( dag.is_transform_locked(self.root) )
+
+    def test_lock_transform_skips_joints(self):
+        """Locking the hierarchy leaves the joints free"""
+        dag.lock_transform(self.root, True)
+        self.assertTrue( is_locked(self.root) )
+        self.assertTrue( is_locked(self.ctrl) )
+        for joint in self.joints:
+            self.assertFalse( is_locked(joint) )
+
+if __name__ == '__main__':
+    result = unittest.main(exit=False).result
+    maya.standalone.uninitialize()
+    sys.exit( not result.wasSuccessful() )
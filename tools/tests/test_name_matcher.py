@@ -0,0 +1,63 @@
+"""
+    Tests the name patterns of dumaf.dag.NameMatcher (freeze transform whitelist).
+
+    Run with mayapy:
+        mayapy tools/tests/test_name_matcher.py
+"""
+
+import os
+import sys
+import unittest
+
+PLUGINS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'plug-ins')
+sys.path.insert(0, os.path.normpath(PLUGINS_PATH))
+
+import maya.standalone # pylint: disable=import-error,wrong-import-position
+maya.standalone.initialize(name='python')
+
+from dumaf.dag import NameMatcher # pylint: disable=wrong-import-position
+
+class TestNameMatcher( unittest.TestCase ):
+    """Substrings match anywhere, globs the whole name, 're:' patterns anywhere"""
+
+    def test_substring(self):
+        """A plain pattern matches the names containing it"""
+        matcher = NameMatcher( ('ctrl',) )
+        self.assertTrue( matcher.match('body_ctrl1') )
+        self.assertTrue( matcher.match('ctrl') )
+        self.assertFalse( matcher.match('body_geo') )
+
+    def test_glob_matches_whole_name(self):
+        """A glob pattern must match the whole name"""
+        matcher = NameMatcher( ('ctrl*',) )
+        self.assertTrue( matcher.match('ctrl_main') )
+        self.assertFalse( matcher.match('body_ctrl1') )
+        matcher = NameMatcher( ('*_ctrl?',) )
+        self.assertTrue( matcher.match('body_ctrl1') )
+        self.assertFalse( matcher.match('body_ctrl12') )
+
+    def test_regex_matches_anywhere(self):
+        """A 're:' pattern is searched in the name"""
+        matcher = NameMatcher( ('re:ctrl\\d+',) )
+        self.assertTrue( matcher.match('body_ctrl12_grp') )
+        self.assertFalse( matcher.match('body_ctrl') )
+        matcher = NameMatcher( ('re:^ctrl$',) )
+        self.assertTrue( matcher.match('ctrl') )
+        self.assertFalse( matcher.match('ctrl1') )
+
+    def test_case_sensitivity(self):
+        """The patterns ignore the case unless case_sensitive is set"""
+        for pattern in ('ctrl', 'ctrl*', 're:^ctrl'):
+            self.assertTrue( NameMatcher( (pattern,) ).match('CTRL_main') )
+            self.assertFalse( NameMatcher( (pattern,), case_sensitive=True ).match('CTRL_main') )
+
+    def test_empty_patterns(self):
+        """Empty patterns and lists don't match anything"""
+        self.assertFalse( NameMatcher().match('ctrl') )
+        self.assertFalse( NameMatcher( None ).match('ctrl') )
+        self.assertFalse( NameMatcher( ('',) ).match('ctrl') )
+
+if __name__ == '__main__':
+    result = unittest.main(exit=False).result
+    maya.standalone.uninitialize()
+    sys.exit( not result.wasSuccessful() )
@@ -0,0 +1,227 @@
+"""
+    Tests the detection of the unchanged published data (ramses_maya.publish_cache):
+    the selection of the previous published versions, the reuse of the backups and files,
+    and the changes detected by the node hashes.
+
+    Run with mayapy:
+        mayapy tools/tests/test_publish_cache.py
+"""
+
+import os
+import sys
+import types
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+PLUGINS_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'plug-ins'))
+sys.path.insert(0, PLUGINS_PATH)
+
+import maya.standalone # pylint: disable=import-error,wrong-import-position
+maya.standalone.initialize(name='python')
+
+# pylint: disable=wrong-import-position
+import maya.cmds as cmds # pylint: disable=import-error
+import ramses as ram
+
+# Import the modules of ramses_maya without initializing the whole add-on (see publish_worker)
+RAMSES_MAYA = types.ModuleType('ramses_maya')
+RAMSES_MAYA.__path__ = [ os.path.join(PLUGINS_PATH, 'ramses_maya') ]
+sys.modules['ramses_maya'] = RAMSES_MAYA
+from ramses_maya import publish_cache
+
+PUBLISH_OPTIONS = { 'formats': [ { 'abc': { 'animation': {} } } ] }
+
+def options_hash(options):
+    """The hash of the publish options"""
+    digest = hashlib.sha256()
+    publish_cache.hash_options( options, digest )
+    return digest.hexdigest()
+
+class TestPublishFolders( unittest.TestCase ):
+    """The previous versions are sorted by version number, not by date"""
+
+    def setUp(self):
+        self.published_folder = tempfile.mkdtemp(prefix='RamsesTestPublished')
+        self.folders = {}
+        for name in ('001_WIP', '002_WIP', '010_OK', 'res_003_WIP', 'backup', '011_WIP'):
+            self.folders[name] = os.path.join(self.published_folder, name)
+            os.makedirs(self.folders[name])
+        # The oldest versions were modified last
+        for i, name in enumerate(('011_WIP', '010_OK', 'res_003_WIP', '002_WIP', '001_WIP')):
+            os.utime(self.folders[name], (1000000 + i * 1000, 1000000 + i * 1000))
+
+    def tearDown(self):
+        shutil.rmtree(self.published_folder, ignore_errors=True)
+
+    def write_file(self, folder_name, file_name, key, value):
+        """Creates a published file with a metadata value"""
+        file_path = os.path.join(self.folders[folder_name], file_name)
+        with open(file_path, 'w', encoding='utf8') as f:
+            f.write(folder_name)
+        ram.RamMetaDataManager.setValue( file_path, key, value )
+        return file_path
+
+    def test_folder_version(self):
+        """The version is read from the folder name, with or without resource and state"""
+        self.assertEqual( publish_cache.get_folder_version('001_WIP'), 1 )
+        self.assertEqual( publish_cache.get_folder_version('res_012_OK'), 12 )
+        self.assertEqual( publish_cache.get_folder_version('007'), 7 )
+        self.assertEqual( publish_cache.get_folder_version('backup'), -1 )
+
+    def test_previous_folders(self):
+        """Latest version first, without the current one nor the folders without a version"""
+        folders = publish_cache.get_previous_publish_folders( self.folders['011_WIP'] )
+        self.assertEqual( folders, [
+            self.folders['010_OK'],
+            self.folders['res_003_WIP'],
+            self.folders['002_WIP'],
+            self.folders['001_WIP'],
+            ] )
+
+    def test_unchanged_files(self):
+        """Only the latest published version is compared"""
+        previous_path = self.write_file('010_OK', 'node.abc', publish_cache.NODE_HASH_KEY, 'hash1')
+        self.write_file('002_WIP', 'node.abc', publish_cache.NODE_HASH_KEY, 'hash2')
+        file_path = os.path.join(self.folders['011_WIP'], 'node.abc')
+        self.assertEqual( publish_cache.find_unchanged_files( [file_path], 'hash1' ), [previous_path] )
+        self.assertEqual( publish_cache.find_unchanged_files( [file_path], 'hash2' ), [] )
+        self.assertEqual( publish_cache.find_unchanged_files( [file_path], '' ), [] )
+
+    def test_unchanged_files_all_formats(self):
+        """All the files of the node must exist with the same hash"""
+        self.write_file('010_OK', 'node.abc', publish_cache.NODE_HASH_KEY, 'hash1')
+        file_paths = [
+            os.path.join(self.folders['011_WIP'], 'node.abc'),
+            os.path.join(self.folders['011_WIP'], 'node.mb'),
+            ]
+        self.assertEqual( publish_cache.find_unchanged_files( file_paths, 'hash1' ), [] )
+
+    def test_previous_backup(self):
+        """A backup with the same fingerprint is found in any previous version"""
+        self.write_file('010_OK', 'scene.mb', publish_cache.BACKUP_FINGERPRINT_KEY, 'fingerprint1')
+        previous_path = self.write_file('002_WIP', 'scene.mb', publish_cache.BACKUP_FINGERPRINT_KEY, 'fingerprint2')
+        backup_path = os.path.join(self.folders['011_WIP'], 'scene.mb')
+        self.assertEqual( publish_cache.find_previous_backup( backup_path, 'fingerprint2' ), previous_path )
+        self.assertEqual( publish_cache.find_previous_backup( backup_path, 'fingerprint3' ), '' )
+
+    def test_reuse_published_file(self):
+        """The reused file has the same content"""
+        previous_path = self.write_file('010_OK', 'node.abc', publish_cache.NODE_HASH_KEY, 'hash1')
+        file_path = os.path.join(self.folders['011_WIP'], 'node.abc')
+        size = publish_cache.reuse_published_file( previous_path, file_path )
+        self.assertEqual( size, os.path.getsize(previous_path) )
+        with open(file_path, 'r', encoding='utf8') as f:
+            self.assertEqual( f.read(), '010_OK' )
+
+class TestOptionsHash( unittest.TestCase ):
+    """Only the options changing the published data are hashed"""
+
+    def test_key_order(self):
+        """The order of the keys doesn't matter"""
+        self.assertEqual(
+            options_hash( { 'a': 1, 'formats': ['abc'] } ),
+            options_hash( { 'formats': ['abc'], 'a': 1 } )
+            )
+
+    def test_non_content_options(self):
+        """The number of workers and the single Alembic job are ignored"""
+        options = { 'formats': [ { 'abc': { 'renderable_only': True } } ] }
+        performance_options = {
+            'format_workers': 4,
+            'formats': [ { 'abc': { 'renderable_only': True, 'single_job': True } } ]
+            }
+        self.assertEqual( options_hash(options), options_hash(performance_options) )
+
+    def test_content_options(self):
+        """The other options change the hash"""
+        self.assertNotEqual(
+            options_hash( { 'formats': [ { 'abc': { 'renderable_only': True } } ] } ),
+            options_hash( { 'formats': [ { 'abc': { 'renderable_only': False } } ] } )
+            )
+
+class TestNodeHasher( unittest.TestCase ):
+    """The hash changes with everything which changes the exported data"""
+
+    def setUp(self):
+        cmds.file(new=True, force=True)
+        self.root = cmds.group(empty=True, name='geo')
+        self.cube = cmds.polyCube(name='cube', constructionHistory=False)[0]
+        self.cube = cmds.parent(self.cube, self.root)[0]
+        self.cube = cmds.ls(self.cube, long=True)[0]
+        self.root = cmds.ls(self.root, long=True)[0]
+
+    def node_hash(self):
+        """A new hasher each time: the history and shading networks are cached by each hasher"""
+        return publish_cache.NodeHasher( PUBLISH_OPTIONS ).hash( self.root, 'geo' )
+
+    def test_same_scene(self):
+        """The hash doesn't change if nothing changes"""
+        self.assertEqual( self.node_hash(), self.node_hash() )
+
+    def test_geometry(self):
+        """Moving a vertex changes the hash"""
+        before = self.node_hash()
+        cmds.move(0, 1, 0, self.cube + '.vtx[0]', relative=True)
+        self.assertNotEqual( before, self.node_hash() )
+
+    def test_transform(self):
+        """Moving a child changes the hash"""
+        before = self.node_hash()
+        cmds.setAttr(self.cube + '.tx', 2)
+        self.assertNotEqual( before, self.node_hash() )
+
+    def test_parent_transform(self):
+        """Moving a parent outside of the published node changes the hash"""
+        parent = cmds.group(self.root, name='world')
+        self.root = cmds.ls('geo', long=True)[0]
+        self.cube = cmds.ls('cube', long=True)[0]
+        before = self.node_hash()
+        cmds.setAttr(parent + '.ty', 3)
+        self.assertNotEqual( before, self.node_hash() )
+
+    def test_outside_animation(self):
+        """Re-keying a controller constraining the node from outside changes the hash"""
+        ctrl = cmds.spaceLocator(name='ctrl')[0]
+        cmds.setKeyframe(ctrl, attribute='translateX', time=1, value=0)
+        cmds.setKeyframe(ctrl, attribute='translateX', time=10, value=5)
+        cmds.parentConstraint(ctrl, self.cube)
+        before = self.node_hash()
+        cmds.setKeyframe(ctrl, attribute='translateX', time=10, value=8)
+        self.assertNotEqual( before, self.node_hash() )
+
+    def test_outside_deformer(self):
+        """Moving a joint skinning the node from outside changes the hash"""
+        cmds.select(clear=True)
+        joint = cmds.joint(name='joint1')
+        cmds.skinCluster(joint, self.cube)
+        self.cube = cmds.ls('cube', long=True)[0]
+        before = self.node_hash()
+        cmds.setAttr(joint + '.rz', 45)
+        self.assertNotEqual( before, self.node_hash() )
+
+    def test_face_shading(self):
+        """Moving faces from a shader to another changes the hash"""
+        engines = []
+        for name in ('red', 'blue'):
+            shader = cmds.shadingNode('lambert', asShader=True, name=name)
+            engine = cmds.sets(renderable=True, noSurfaceShader=True, empty=True, name=name + 'SG')
+            cmds.connectAttr(shader + '.outColor', engine + '.surfaceShader')
+            engines.append(engine)
+        cmds.sets(self.cube + '.f[0:2]', edit=True, forceElement=engines[0])
+        cmds.sets(self.cube + '.f[3:5]', edit=True, forceElement=engines[1])
+        before = self.node_hash()
+        cmds.sets(self.cube + '.f[2]', edit=True, forceElement=engines[1])
+        self.assertNotEqual( before, self.node_hash() )
+
+    def test_frame_range(self):
+        """The playback range is exported with the animation"""
+        before = self.node_hash()
+        cmds.playbackOptions(animationEndTime=cmds.playbackOptions(q=True, animationEndTime=True) + 10)
+        self.assertNotEqual( before, self.node_hash() )
+
+if __name__ == '__main__':
+    result = unittest.main(exit=False).result
+    maya.standalone.uninitialize()
+    sys.exit( not result.wasSuccessful() )